@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Encryption Benchmarks
+Reproducible throughput, memory and profiling harness for EncryptionEngine
+and FileEncryptor
+AI-Generated Implementation
+
+Usage:
+    python benchmark.py --sizes 64,4K,1M,64M --output results.json
+    python benchmark.py --compare baseline.json --output results.json
+    python benchmark.py --suite file --sizes 2G --profile-dir profiles/
+    python benchmark.py messages | daemon
+
+The JSON report holds timestamp, python, cryptography, platform, cpu_count,
+repeat and results: one entry per scenario with name, seconds, ops, bytes,
+ops_per_sec, mb_per_sec, peak_rss_bytes, peak_alloc_bytes and
+allocated_blocks. --compare exits with status 1 if any scenario's ops_per_sec
+fell by more than --threshold.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import cProfile
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+from encryption import EncryptionEngine
+from encrypt_file import FileEncryptor
+from kdf import KeyCache
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = '64,4K,64K,1M,16M'
+# In-memory scenarios above this size would mostly measure the allocator/swap
+MAX_IN_MEMORY_SIZE = 256 * 1024 * 1024
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds else float('inf')
+
+
+def bench_messages(count=20000, size=64, passphrase="BenchmarkPassword"):
+    """Compare per-call encrypt_text/decrypt_text with encrypt_many/decrypt_many
+
+    Returns a dict of records/s for each path.
+    """
+    engine = EncryptionEngine('AES-256')
+    messages = [os.urandom(size // 2).hex() for _ in range(count)]
+    results = {}
+
+    start = time.perf_counter()
+    encrypted = [engine.encrypt_text(message, passphrase) for message in messages]
+    results['encrypt_text'] = _rate(count, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for record in encrypted:
+        engine.decrypt_text(record, passphrase)
+    results['decrypt_text'] = _rate(count, time.perf_counter() - start)
+
+    for framing in ('binary', 'base64'):
+        start = time.perf_counter()
+        records = list(engine.encrypt_many(messages, passphrase, framing=framing))
+        results[f'encrypt_many[{framing}]'] = _rate(count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in engine.decrypt_many(records, passphrase, framing=framing, text=True):
+            pass
+        results[f'decrypt_many[{framing}]'] = _rate(count, time.perf_counter() - start)
+
+    return results
+
+
+def _wait_for_socket(path, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise RuntimeError("Daemon did not start")
+        time.sleep(0.05)
+
+
+def bench_daemon(count=50, size=4096, passphrase="BenchmarkPassword"):
+    """Compare jobs/s for a fresh encrypt_file.py process per file with the daemon
+
+    Three paths are timed: forking the full CLI per file, forking the thin
+    daemon client per file, and one client submitting all files as a batch.
+    """
+    workdir = tempfile.mkdtemp(prefix='encbench-')
+    socket_path = os.path.join(workdir, 'daemon.sock')
+    paths = []
+    for index in range(count):
+        path = os.path.join(workdir, f'file{index}.txt')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size // 2).hex().encode())
+        paths.append(path)
+
+    daemon = subprocess.Popen([sys.executable, os.path.join(HERE, 'daemon.py'), 'serve',
+                               '--socket', socket_path], cwd=HERE, stdout=subprocess.DEVNULL)
+    results = {}
+    try:
+        _wait_for_socket(socket_path)
+
+        start = time.perf_counter()
+        for path in paths:
+            subprocess.run([sys.executable, os.path.join(HERE, 'encrypt_file.py'), 'encrypt',
+                            path, passphrase], check=True, stdout=subprocess.DEVNULL)
+        results['fork per file (CLI)'] = _rate(count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for path in paths:
+            subprocess.run([sys.executable, os.path.join(HERE, 'daemon.py'), 'encrypt', path,
+                            '-p', passphrase, '--socket', socket_path],
+                           check=True, stdout=subprocess.DEVNULL)
+        results['fork per file (daemon client)'] = _rate(count, time.perf_counter() - start)
+
+        from daemon import DaemonClient
+        jobs = [{'command': 'encrypt', 'input': path, 'passphrase': passphrase}
+                for path in paths]
+        start = time.perf_counter()
+        with DaemonClient(socket_path) as client:
+            failures = [r for r in client.submit_batch(jobs) if not r['ok']]
+        results['daemon batch'] = _rate(count, time.perf_counter() - start)
+        if failures:
+            raise RuntimeError(f"Daemon jobs failed: {failures[0]['error']}")
+    finally:
+        daemon.terminate()
+        daemon.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def parse_size(text):
+    """Parse sizes like 64, 4K, 16M or 2G into bytes"""
+    text = text.strip().upper()
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    for unit in ('G', 'M', 'K'):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return str(size)
+
+
+def peak_rss_bytes():
+    """Process-wide peak resident set size so far (a high-water mark)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def write_random_file(path, size, chunk_size=1024 * 1024):
+    """Create a test file without holding it in memory"""
+    block = os.urandom(min(size, chunk_size))
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining:
+            f.write(block[:remaining])
+            remaining -= min(remaining, len(block))
+
+
+class Scenario:
+    """One benchmark case: func() does the work once and returns (ops, bytes)"""
+
+    def __init__(self, name, func, setup=None):
+        self.name = name
+        self.func = func
+        self.setup = setup
+
+
+def run_scenario(scenario, repeat=3, trace_allocations=True, profile_dir=None):
+    """Time a scenario, measure its allocations and optionally profile it
+
+    The best of `repeat` runs is reported. Allocation peaks come from an extra
+    run under tracemalloc so tracing overhead never skews the timings.
+    """
+    if scenario.setup is not None:
+        scenario.setup()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ops, size = scenario.func()
+        best = min(best, time.perf_counter() - start)
+
+    result = {
+        'name': scenario.name,
+        'seconds': best,
+        'ops': ops,
+        'bytes': size,
+        'ops_per_sec': _rate(ops, best),
+        'mb_per_sec': _rate(size / 1e6, best),
+        'peak_rss_bytes': peak_rss_bytes(),
+        'peak_alloc_bytes': None,
+        'allocated_blocks': None,
+    }
+
+    if trace_allocations:
+        tracemalloc.start()
+        scenario.func()
+        snapshot = tracemalloc.take_snapshot()
+        result['peak_alloc_bytes'] = tracemalloc.get_traced_memory()[1]
+        result['allocated_blocks'] = sum(stat.count for stat in snapshot.statistics('filename'))
+        tracemalloc.stop()
+
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler = cProfile.Profile()
+        profiler.runcall(scenario.func)
+        profiler.dump_stats(os.path.join(profile_dir, scenario.name.replace('/', '_') + '.prof'))
+
+    return result
+
+
+def memory_scenarios(sizes, passphrase):
+    """encrypt_aes256/encrypt_into/decrypt_into on in-memory buffers"""
+    engine = EncryptionEngine('AES-256')
+    key, _ = engine.derive_key(passphrase)
+    for size in sizes:
+        if size > MAX_IN_MEMORY_SIZE:
+            continue
+        data = os.urandom(size)
+        out = bytearray(engine.encrypted_size(size))
+        ciphertext = engine.encrypt_aes256(data, key)
+        plain = bytearray(len(ciphertext))
+        label = format_size(size)
+
+        yield Scenario(f'memory/encrypt_aes256/{label}',
+                       lambda data=data: (engine.encrypt_aes256(data, key), (1, len(data)))[1])
+        yield Scenario(f'memory/encrypt_into/{label}',
+                       lambda data=data, out=out: (engine.encrypt_into(data, key, out),
+                                                   (1, len(data)))[1])
+        yield Scenario(f'memory/decrypt_into/{label}',
+                       lambda c=ciphertext, p=plain: (engine.decrypt_into(c, key, p),
+                                                      (1, len(p) - 32))[1])
+
+
+def file_scenarios(sizes, passphrase, workdir):
+    """Streaming CBC and parallel container encryption of files on disk"""
+    encryptor = FileEncryptor(passphrase, compression='none')
+    workers = os.cpu_count() or 1
+    for size in sizes:
+        label = format_size(size)
+        source = os.path.join(workdir, f'source-{label}.bin')
+        encrypted = source + '.encrypted'
+        container = source + '.container'
+        decrypted = source + '.decrypted'
+
+        def setup(source=source, size=size, encrypted=encrypted):
+            if not os.path.exists(source):
+                write_random_file(source, size)
+                encryptor.run_job('encrypt', source, encrypted)
+
+        def cleanup_after(func, *paths):
+            def run():
+                result = func()
+                for path in paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+                return result
+            return run
+
+        yield Scenario(f'file/encrypt_stream/{label}', lambda s=source, sz=size: (
+            encryptor.run_job('encrypt', s, s + '.tmp'), (1, sz))[1], setup)
+        yield Scenario(f'file/decrypt_stream/{label}', cleanup_after(lambda e=encrypted, d=decrypted, sz=size: (
+            encryptor.run_job('decrypt', e, d), (1, sz))[1], decrypted), setup)
+        yield Scenario(f'file/encrypt_container[{workers}]/{label}', cleanup_after(
+            lambda s=source, c=container, sz=size: (
+                encryptor.run_job('encrypt', s, c, workers=workers), (1, sz))[1], container), setup)
+
+
+def batch_scenarios(passphrase, workdir, count=200, size=4096):
+    """Single-call vs batch APIs for messages and small files"""
+    engine = EncryptionEngine('AES-256')
+    messages = [os.urandom(64) for _ in range(count * 10)]
+    texts = [message.hex() for message in messages]
+    engine.derive_key(passphrase)
+
+    yield Scenario('batch/encrypt_text', lambda: (
+        [engine.encrypt_text(text, passphrase) for text in texts],
+        (len(texts), sum(map(len, texts))))[1])
+    yield Scenario('batch/encrypt_many', lambda: (
+        list(engine.encrypt_many(messages, passphrase)),
+        (len(messages), sum(map(len, messages))))[1])
+
+    directory = os.path.join(workdir, 'batch')
+
+    def setup():
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+            for index in range(count):
+                write_random_file(os.path.join(directory, f'file{index}.dat'), size)
+
+    encryptor = FileEncryptor(passphrase, compression='none')
+
+    def encrypt_each():
+        for index in range(count):
+            path = os.path.join(directory, f'file{index}.dat')
+            encryptor.run_job('encrypt', path)
+        return count, count * size
+
+    def encrypt_batch():
+        result = encryptor.batch_encrypt(directory)
+        return result.files_encrypted, result.bytes_processed
+
+    yield Scenario('batch/run_job_loop', encrypt_each, setup)
+    yield Scenario('batch/batch_encrypt', encrypt_batch, setup)
+
+
+def kdf_scenarios(passphrase, rounds=5):
+    """Key derivation with an empty cache vs a warm cache"""
+    def cold():
+        for _ in range(rounds):
+            EncryptionEngine('AES-256', key_cache=KeyCache()).derive_key(passphrase)
+        return rounds, 0
+
+    warm_engine = EncryptionEngine('AES-256', key_cache=KeyCache())
+    warm_engine.derive_key(passphrase)
+
+    def warm():
+        for _ in range(rounds):
+            warm_engine.derive_key(passphrase)
+        return rounds, 0
+
+    yield Scenario('kdf/cold', cold)
+    yield Scenario('kdf/warm', warm)
+
+
+def run_suite(suites, sizes, repeat=3, trace_allocations=True, profile_dir=None,
+              passphrase="BenchmarkPassword"):
+    """Run the selected suites and return a JSON-serialisable report"""
+    workdir = tempfile.mkdtemp(prefix='encbench-')
+    scenarios = []
+    if 'kdf' in suites:
+        scenarios += kdf_scenarios(passphrase)
+    if 'memory' in suites:
+        scenarios += memory_scenarios(sizes, passphrase)
+    if 'batch' in suites:
+        scenarios += batch_scenarios(passphrase, workdir)
+    if 'file' in suites:
+        scenarios += file_scenarios(sizes, passphrase, workdir)
+
+    results = []
+    try:
+        for scenario in scenarios:
+            result = run_scenario(scenario, repeat, trace_allocations, profile_dir)
+            print_result(result)
+            results.append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    try:
+        from cryptography import __version__ as cryptography_version
+    except ImportError:
+        cryptography_version = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'cryptography': cryptography_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def print_result(result):
+    alloc = result['peak_alloc_bytes']
+    alloc_text = f"{alloc / 1e6:9.2f} MB" if alloc is not None else " " * 12
+    print(f"  {result['name']:40s} {result['ops_per_sec']:12,.1f} ops/s "
+          f"{result['mb_per_sec']:10,.1f} MB/s  peak alloc {alloc_text}")
+
+
+def compare_reports(report, baseline, threshold=0.10):
+    """List scenarios that got slower than the baseline by more than threshold"""
+    previous = {result['name']: result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        before = previous.get(result['name'])
+        if not before or not before['ops_per_sec']:
+            continue
+        change = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        if change < -threshold:
+            regressions.append((result['name'], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encryption benchmarks")
+    parser.add_argument('suite', nargs='?', default='all',
+                        choices=['all', 'memory', 'file', 'batch', 'kdf', 'messages', 'daemon'])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help="comma separated payload sizes, e.g. 64,4K,1M,2G")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="write the JSON report here")
+    parser.add_argument('--compare', help="baseline JSON report to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="slowdown fraction that counts as a regression")
+    parser.add_argument('--profile-dir', help="dump a cProfile .prof file per scenario here")
+    parser.add_argument('--no-tracemalloc', action='store_true')
+    parser.add_argument('--count', type=int, default=None)
+    parser.add_argument('--size', type=int, default=None,
+                        help="message/file size in bytes (messages and daemon suites)")
+    args = parser.parse_args(argv)
+
+    if args.suite == 'messages':
+        count, size = args.count or 20000, args.size or 64
+        print(f"Messages: {count} x {size} bytes")
+        for name, rate in bench_messages(count, size).items():
+            print(f"  {name:24s} {rate:12,.0f} records/s")
+        return 0
+    if args.suite == 'daemon':
+        count, size = args.count or 50, args.size or 4096
+        print(f"Files: {count} x {size} bytes")
+        for name, rate in bench_daemon(count, size).items():
+            print(f"  {name:30s} {rate:10,.1f} jobs/s")
+        return 0
+
+    suites = ['kdf', 'memory', 'batch', 'file'] if args.suite == 'all' else [args.suite]
+    sizes = sorted(parse_size(size) for size in args.sizes.split(','))
+    report = run_suite(suites, sizes, args.repeat, not args.no_tracemalloc, args.profile_dir)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.threshold)
+        for name, change in regressions:
+            print(f"REGRESSION {name}: {change * 100:+.1f}% ops/s")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# Written by: AI Agents
+# License: MIT
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Streaming Compression Stage
+Pluggable standard-library codecs applied before encryption, plus the
+heuristics that decide whether a file is worth compressing
+AI-Generated Implementation
+"""
+
+import lzma
+import math
+import zlib
+from collections import Counter
+
+# Low bits of the key header flags byte hold the codec id (0 = uncompressed)
+COMPRESSION_MASK = 0x0F
+
+# Files whose first bytes are at least this random are treated as compressed
+ENTROPY_THRESHOLD = 7.5
+ENTROPY_SAMPLE_SIZE = 4096
+
+
+class ZlibCodec:
+    """DEFLATE via zlib - fast, modest ratio"""
+
+    CODEC_ID = 1
+    NAME = 'zlib'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compressor(self):
+        return zlib.compressobj(self.level)
+
+    def decompressor(self):
+        return zlib.decompressobj()
+
+    def iter_decompress(self, decompressor, data, max_length):
+        """Decompress data in pieces of at most max_length bytes"""
+        yield decompressor.decompress(data, max_length)
+        while decompressor.unconsumed_tail:
+            yield decompressor.decompress(decompressor.unconsumed_tail, max_length)
+
+
+class LzmaCodec:
+    """LZMA/XZ - slower, better ratio for text and logs"""
+
+    CODEC_ID = 2
+    NAME = 'lzma'
+
+    def __init__(self, preset=6):
+        self.preset = preset
+
+    def compressor(self):
+        return lzma.LZMACompressor(preset=self.preset)
+
+    def decompressor(self):
+        return lzma.LZMADecompressor()
+
+    def iter_decompress(self, decompressor, data, max_length):
+        """Decompress data in pieces of at most max_length bytes"""
+        yield decompressor.decompress(data, max_length)
+        while not decompressor.needs_input and not decompressor.eof:
+            yield decompressor.decompress(b'', max_length)
+
+
+CODECS = {}
+
+
+def register_codec(codec):
+    """Make a codec instance available by id and by name"""
+    if not 0 < codec.CODEC_ID <= COMPRESSION_MASK:
+        raise ValueError(f"Codec id must be between 1 and {COMPRESSION_MASK}")
+    CODECS[codec.CODEC_ID] = codec
+    return codec
+
+
+register_codec(ZlibCodec())
+register_codec(LzmaCodec())
+
+
+def codec_by_name(name):
+    for codec in CODECS.values():
+        if codec.NAME == name:
+            return codec
+    raise ValueError(f"Unknown compression codec: {name}")
+
+
+def codec_from_flags(flags):
+    """Codec recorded in a key header's flags, or None if uncompressed"""
+    codec_id = flags & COMPRESSION_MASK
+    if not codec_id:
+        return None
+    if codec_id not in CODECS:
+        raise ValueError(f"Unknown compression codec id {codec_id}")
+    return CODECS[codec_id]
+
+
+def sample_entropy(path, sample_size=ENTROPY_SAMPLE_SIZE):
+    """Shannon entropy in bits per byte of the first sample_size bytes of a file"""
+    with open(path, 'rb') as f:
+        sample = f.read(sample_size)
+    if not sample:
+        return 0.0
+    total = len(sample)
+    return -sum(count / total * math.log2(count / total) for count in Counter(sample).values())
+
+
+class CompressingReader:
+    """Read-only stream yielding the compressed form of another binary stream
+
+    Exposes readinto() so it can be handed straight to encrypt_stream; only
+    one chunk of input plus its compressed output is buffered at a time.
+    """
+
+    def __init__(self, raw, codec, chunk_size):
+        self.raw = raw
+        self.compressor = codec.compressor()
+        self.chunk_size = chunk_size
+        self._pending = bytearray()
+        self._eof = False
+
+    def readinto(self, buffer):
+        while len(self._pending) < len(buffer) and not self._eof:
+            chunk = self.raw.read(self.chunk_size)
+            if chunk:
+                self._pending += self.compressor.compress(chunk)
+            else:
+                self._pending += self.compressor.flush()
+                self._eof = True
+        count = min(len(buffer), len(self._pending))
+        buffer[:count] = self._pending[:count]
+        del self._pending[:count]
+        return count
+
+
+class DecompressingWriter:
+    """Write-only stream that decompresses everything written to it into dest
+
+    Output is produced in pieces of at most chunk_size bytes, so a highly
+    compressible input cannot blow up memory use.
+    """
+
+    def __init__(self, dest, codec, chunk_size):
+        self.dest = dest
+        self.codec = codec
+        self.decompressor = codec.decompressor()
+        self.chunk_size = chunk_size
+
+    def write(self, data):
+        if not data:
+            return 0
+        try:
+            for piece in self.codec.iter_decompress(self.decompressor, bytes(data),
+                                                    self.chunk_size):
+                self.dest.write(piece)
+        except (zlib.error, lzma.LZMAError, EOFError) as e:
+            raise ValueError(f"Decompression failed - wrong passphrase or corrupted data ({e})") \
+                from None
+        return len(data)
+
+    def close(self):
+        """Check that the compressed stream was complete"""
+        if not self.decompressor.eof:
+            raise ValueError("Compressed data is truncated or corrupted")
+
+# Written by: AI Agents
+# License: MIT
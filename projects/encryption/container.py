@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Chunked AEAD Container Format
+Splits a file into independently authenticated AES-256-GCM chunks so that
+encryption and decryption of a single large file can use every CPU core
+AI-Generated Implementation
+
+Layout (after an optional key header, see kdf.py):
+    header  : magic (4) | version (1) | chunk size (4) | plaintext length (8) | nonce prefix (8)
+    chunk i : AES-256-GCM(chunk i) + 16-byte tag
+
+Chunk i uses the nonce <nonce prefix> + <i as 4-byte big-endian counter>, and the
+key header in front of the container plus the whole container header are
+passed as associated data. Reordering, truncating or extending the file, or
+changing its key header flags, therefore fails authentication. Version 1
+containers authenticated only the container header and are still readable.
+"""
+
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.exceptions import InvalidTag
+from encryption import EncryptionEngine, STREAM_CHUNK_SIZE
+
+CONTAINER_MAGIC = b'AEC\x01'
+CONTAINER_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+HEADER_FORMAT = '>4sBIQ8s'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TAG_SIZE = 16
+MAX_CHUNKS = 2 ** 32
+
+
+class ContainerHeader:
+    """Parsed container header"""
+
+    def __init__(self, chunk_size, plaintext_length, nonce_prefix, version=CONTAINER_VERSION,
+                 base_offset=0):
+        self.version = version
+        self.chunk_size = chunk_size
+        self.plaintext_length = plaintext_length
+        self.nonce_prefix = nonce_prefix
+        # Position of the container header within the file
+        self.base_offset = base_offset
+
+    @classmethod
+    def new(cls, plaintext_length, chunk_size=STREAM_CHUNK_SIZE, base_offset=0):
+        """Create a header with a fresh random nonce prefix"""
+        header = cls(chunk_size, plaintext_length, os.urandom(8), base_offset=base_offset)
+        if header.chunk_count > MAX_CHUNKS:
+            raise ValueError("File is too large for the chosen chunk size")
+        return header
+
+    @classmethod
+    def from_bytes(cls, data, base_offset=0):
+        """Parse a header, raising ValueError if it is not a container"""
+        if len(data) < HEADER_SIZE:
+            raise ValueError("Data is too short to be an encrypted container")
+        magic, version, chunk_size, length, prefix = struct.unpack_from(HEADER_FORMAT, data)
+        if magic != CONTAINER_MAGIC:
+            raise ValueError("Not an encrypted container")
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported container version {version}")
+        if chunk_size == 0:
+            raise ValueError("Corrupted container header")
+        return cls(chunk_size, length, prefix, version, base_offset)
+
+    def to_bytes(self):
+        """Serialise the header"""
+        return struct.pack(HEADER_FORMAT, CONTAINER_MAGIC, self.version, self.chunk_size,
+                           self.plaintext_length, self.nonce_prefix)
+
+    def associated_data(self, prefix):
+        """GCM associated data for every chunk, given the bytes in front of the header"""
+        if len(prefix) != self.base_offset:
+            raise ValueError("Key header length doesn't match the container offset")
+        if self.version < 2:
+            return self.to_bytes()
+        return bytes(prefix) + self.to_bytes()
+
+    @property
+    def chunk_count(self):
+        """Number of chunks; an empty file still has one empty chunk"""
+        return max(1, -(-self.plaintext_length // self.chunk_size))
+
+    @property
+    def container_length(self):
+        """Total size of the file holding the container, in bytes"""
+        return self.base_offset + HEADER_SIZE + self.plaintext_length + self.chunk_count * TAG_SIZE
+
+    def nonce(self, index):
+        """Per-chunk nonce derived from the header nonce and the chunk counter"""
+        return self.nonce_prefix + index.to_bytes(4, 'big')
+
+    def plaintext_span(self, index):
+        """(offset, length) of a chunk within the plaintext"""
+        offset = index * self.chunk_size
+        return offset, min(self.chunk_size, self.plaintext_length - offset)
+
+    def ciphertext_offset(self, index):
+        """Offset of a chunk within the file"""
+        return self.base_offset + HEADER_SIZE + index * (self.chunk_size + TAG_SIZE)
+
+
+def is_container(path, offset=0):
+    """Check whether a file has the container magic at offset"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC
+
+
+def _split_ranges(chunk_count, workers):
+    """Split chunk indices into contiguous ranges, a few per worker"""
+    tasks = max(1, min(chunk_count, workers * 4))
+    step = -(-chunk_count // tasks)
+    return [(start, min(start + step, chunk_count)) for start in range(0, chunk_count, step)]
+
+
+def _encrypt_range(input_path, output_path, key, header_bytes, prefix, start, stop):
+    """Encrypt chunks [start, stop) in place; runs inside a worker process"""
+    engine = EncryptionEngine('AES-256')
+    header = ContainerHeader.from_bytes(header_bytes, len(prefix))
+    associated_data = header.associated_data(prefix)
+    with open(input_path, 'rb') as src, open(output_path, 'r+b') as dst:
+        for index in range(start, stop):
+            offset, length = header.plaintext_span(index)
+            src.seek(offset)
+            chunk = src.read(length)
+            if len(chunk) != length:
+                raise ValueError("Input file changed size during encryption")
+            dst.seek(header.ciphertext_offset(index))
+            dst.write(engine.encrypt_aes256_gcm(chunk, key, header.nonce(index), associated_data))
+
+
+def _decrypt_range(input_path, output_path, key, header_bytes, prefix, start, stop):
+    """Decrypt chunks [start, stop) in place; runs inside a worker process"""
+    engine = EncryptionEngine('AES-256')
+    header = ContainerHeader.from_bytes(header_bytes, len(prefix))
+    associated_data = header.associated_data(prefix)
+    with open(input_path, 'rb') as src, open(output_path, 'r+b') as dst:
+        for index in range(start, stop):
+            offset, length = header.plaintext_span(index)
+            src.seek(header.ciphertext_offset(index))
+            chunk = src.read(length + TAG_SIZE)
+            try:
+                plaintext = engine.decrypt_aes256_gcm(chunk, key, header.nonce(index),
+                                                      associated_data)
+            except InvalidTag:
+                raise ValueError(f"Chunk {index} failed authentication - "
+                                 "wrong passphrase or corrupted data") from None
+            dst.seek(offset)
+            dst.write(plaintext)
+
+
+def _run_ranges(func, input_path, output_path, key, header, prefix, workers):
+    """Run func over all chunk ranges, in a process pool when workers > 1
+
+    prefix holds the bytes in front of the container header (the key header).
+    """
+    header_bytes = header.to_bytes()
+    ranges = _split_ranges(header.chunk_count, workers)
+    if workers <= 1 or len(ranges) == 1:
+        for start, stop in ranges:
+            func(input_path, output_path, key, header_bytes, prefix, start, stop)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(func, input_path, output_path, key, header_bytes, prefix,
+                               start, stop)
+                   for start, stop in ranges]
+        for future in futures:
+            future.result()
+
+
+def encrypt_container(input_path, output_path, key, workers=None, chunk_size=STREAM_CHUNK_SIZE,
+                      prefix=b''):
+    """Encrypt a file into the chunked container format using a pool of workers
+
+    prefix (normally the key header) is written in front of the container.
+    """
+    workers = workers or os.cpu_count() or 1
+    header = ContainerHeader.new(os.path.getsize(input_path), chunk_size, len(prefix))
+
+    # Preallocate the output so every worker can write its chunks in place
+    with open(output_path, 'wb') as dst:
+        dst.write(prefix)
+        dst.write(header.to_bytes())
+        dst.truncate(header.container_length)
+
+    _run_ranges(_encrypt_range, str(input_path), str(output_path), key, header, bytes(prefix),
+                workers)
+    return header.container_length
+
+
+def decrypt_container(input_path, output_path, key, workers=None, offset=0):
+    """Decrypt a chunked container starting at offset using a pool of workers"""
+    workers = workers or os.cpu_count() or 1
+    with open(input_path, 'rb') as src:
+        prefix = src.read(offset)
+        header = ContainerHeader.from_bytes(src.read(HEADER_SIZE), offset)
+    if os.path.getsize(input_path) != header.container_length:
+        raise ValueError("Container is truncated or has trailing data")
+
+    with open(output_path, 'wb') as dst:
+        dst.truncate(header.plaintext_length)
+
+    _run_ranges(_decrypt_range, str(input_path), str(output_path), key, header, prefix, workers)
+    return header.plaintext_length
+
+# Written by: AI Agents
+# License: MIT
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Encryption Daemon
+Keeps FileEncryptor instances and derived keys warm in a long-running process
+and serves encrypt/decrypt jobs over a local Unix domain socket
+AI-Generated Implementation
+
+Protocol: one JSON object per line in each direction.
+    request : {"command": "encrypt"|"decrypt", "input": path, "output": path?,
+               "passphrase": str, "workers": int?, "compression": str?}
+              or {"jobs": [request, ...]} to submit a batch
+    response: {"ok": true, "output": path} / {"ok": false, "error": message}
+              or {"results": [response, ...]} for a batch
+
+The client half only uses the standard library and does not import the
+crypto stack, so invoking it per file stays cheap.
+"""
+
+import os
+import sys
+import json
+import socket
+import asyncio
+import argparse
+import tempfile
+from collections import OrderedDict
+
+DEFAULT_MAX_IN_FLIGHT = 32
+MAX_CACHED_ENCRYPTORS = 16
+# Longest request line the daemon accepts
+MAX_REQUEST_SIZE = 16 * 1024 * 1024
+# Jobs per request when the client submits a batch
+CLIENT_BATCH_SIZE = 256
+
+
+def default_socket_path():
+    """Per-user socket path, preferring XDG_RUNTIME_DIR"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f'encryptiond-{os.getuid()}.sock')
+
+
+class EncryptionDaemon:
+    """asyncio server running jobs on a thread pool with a cap on in-flight jobs"""
+
+    def __init__(self, socket_path=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        # Imported here so the client half of this module stays lightweight
+        from concurrent.futures import ThreadPoolExecutor
+        from encrypt_file import FileEncryptor
+        from kdf import DEFAULT_KEY_CACHE
+
+        self.socket_path = socket_path or default_socket_path()
+        self.max_in_flight = max_in_flight
+        self._file_encryptor = FileEncryptor
+        self._key_cache = DEFAULT_KEY_CACHE
+        self._encryptors = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._slots = None
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+
+    def _encryptor(self, passphrase, compression):
+        """Reuse one FileEncryptor per (passphrase, compression) so keys stay cached
+
+        Keyed on the key cache's HMAC fingerprint of the passphrase rather
+        than the passphrase itself.
+        """
+        cache_key = (self._key_cache.fingerprint(passphrase), compression)
+        encryptor = self._encryptors.get(cache_key)
+        if encryptor is None:
+            encryptor = self._file_encryptor(passphrase, compression=compression)
+            self._encryptors[cache_key] = encryptor
+            while len(self._encryptors) > MAX_CACHED_ENCRYPTORS:
+                self._encryptors.popitem(last=False)
+        else:
+            self._encryptors.move_to_end(cache_key)
+        return encryptor
+
+    def _run_job(self, encryptor, job):
+        return encryptor.run_job(job['command'], job['input'], job.get('output'),
+                                 job.get('workers'))
+
+    async def run_job(self, job):
+        """Run one job once an in-flight slot is free"""
+        try:
+            encryptor = self._encryptor(job.get('passphrase', ''), job.get('compression', 'auto'))
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                output = await loop.run_in_executor(self._executor, self._run_job, encryptor, job)
+            self.jobs_completed += 1
+            return {'ok': True, 'output': output}
+        except Exception as e:
+            self.jobs_failed += 1
+            return {'ok': False, 'error': str(e) or type(e).__name__}
+
+    async def handle_client(self, reader, writer):
+        """Serve requests from one client until it disconnects"""
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # The rest of the oversized line is still in the stream, so
+                    # answer once and hang up rather than parse its remainder
+                    response = {'ok': False,
+                                'error': f"Request larger than {MAX_REQUEST_SIZE} bytes"}
+                    writer.write(json.dumps(response).encode() + b'\n')
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = {'ok': False, 'error': f"Invalid request: {e}"}
+                else:
+                    if not isinstance(request, dict):
+                        response = {'ok': False, 'error': "Invalid request: expected a JSON object"}
+                    elif 'jobs' in request:
+                        if isinstance(request['jobs'], list):
+                            results = await asyncio.gather(*(self.run_job(job)
+                                                             for job in request['jobs']))
+                            response = {'results': list(results)}
+                        else:
+                            response = {'ok': False,
+                                        'error': "Invalid request: jobs must be a list"}
+                    else:
+                        response = await self.run_job(request)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """Listen on the Unix socket until cancelled"""
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        # Only the owning user may connect: requests carry passphrases
+        old_umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path,
+                                                     limit=MAX_REQUEST_SIZE)
+        finally:
+            os.umask(old_umask)
+        print(f"Encryption daemon listening on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=True)
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+class DaemonClient:
+    """Blocking client for EncryptionDaemon"""
+
+    def __init__(self, socket_path=None):
+        self.socket_path = socket_path or default_socket_path()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+        self._reader = self.sock.makefile('rb')
+
+    def _request(self, request):
+        self.sock.sendall(json.dumps(request).encode() + b'\n')
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Daemon closed the connection")
+        return json.loads(line)
+
+    def submit(self, job):
+        """Run a single job and return its response"""
+        return self._request(job)
+
+    def submit_batch(self, jobs):
+        """Run several jobs concurrently on the daemon and return their responses
+
+        Large batches are sent as several requests of CLIENT_BATCH_SIZE jobs.
+        """
+        jobs = list(jobs)
+        results = []
+        for start in range(0, len(jobs), CLIENT_BATCH_SIZE):
+            response = self._request({'jobs': jobs[start:start + CLIENT_BATCH_SIZE]})
+            if 'results' not in response:
+                raise RuntimeError(response.get('error', "Malformed response from daemon"))
+            results += response['results']
+        return results
+
+    def close(self):
+        self._reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encryption daemon and its client")
+    parser.add_argument('command', choices=['serve', 'encrypt', 'decrypt'])
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('-p', '--passphrase', default="DefaultPassword")
+    parser.add_argument('--socket', default=None, help="Unix socket path")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--compression', default='auto', choices=['auto', 'none', 'zlib', 'lzma'])
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        daemon = EncryptionDaemon(args.socket, args.max_in_flight)
+        try:
+            asyncio.run(daemon.serve())
+        except KeyboardInterrupt:
+            print("\nDaemon stopped")
+        return 0
+
+    if not args.files:
+        parser.error("no files given")
+    jobs = [{'command': args.command, 'input': os.path.abspath(path),
+             'passphrase': args.passphrase, 'workers': args.workers,
+             'compression': args.compression} for path in args.files]
+    try:
+        with DaemonClient(args.socket) as client:
+            results = client.submit_batch(jobs)
+    except OSError as e:
+        print(f"Error: cannot reach encryption daemon: {e}")
+        return 2
+    except RuntimeError as e:
+        print(f"Error: daemon rejected the batch: {e}")
+        return 2
+
+    failed = 0
+    for job, result in zip(jobs, results):
+        if result['ok']:
+            print(f"✓ {job['input']} -> {result['output']}")
+        else:
+            failed += 1
+            print(f"✗ {job['input']}: {result['error']}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# Written by: AI Agents
+# License: MIT
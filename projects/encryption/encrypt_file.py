@@ -6,21 +6,40 @@ AI-Generated Implementation
 """
 
 import os
-import sys
+import time
+import secrets
+import fnmatch
+import argparse
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from encryption import EncryptionEngine
+from encryption import EncryptionEngine, STREAM_CHUNK_SIZE
+from container import encrypt_container, decrypt_container, is_container
+from manifest import file_digest
+from kdf import KeyHeader, KEY_HEADER_MAX_SIZE
+from compression import (CODECS, ENTROPY_THRESHOLD, ZlibCodec, CompressingReader,
+                         DecompressingWriter, codec_by_name, codec_from_flags, sample_entropy)
 
 class FileEncryptor:
     """File encryption/decryption utility"""
     
     SUPPORTED_FORMATS = ['.txt', '.pdf', '.docx', '.jpg', '.png', '.zip', '.py', '.cpp']
+    # Already-compressed formats that are never worth compressing again
+    COMPRESSED_FORMATS = ['.docx', '.jpg', '.png', '.zip']
     
-    def __init__(self, passphrase):
+    def __init__(self, passphrase, chunk_size=STREAM_CHUNK_SIZE, compression='auto'):
+        """compression is 'auto', 'none' or a codec name such as 'zlib' or 'lzma'"""
         self.engine = EncryptionEngine('AES-256')
         self.passphrase = passphrase
+        self.chunk_size = chunk_size
+        self.compression = compression
     
-    def encrypt_file(self, input_path, output_path=None):
-        """Encrypt a file and save to output path"""
+    def encrypt_file(self, input_path, output_path=None, workers=None):
+        """Encrypt a file and save to output path
+        
+        With workers set, the file is written in the chunked AES-GCM container
+        format and encrypted across that many processes (0 means all cores).
+        """
         input_file = Path(input_path)
         
         if not input_file.exists():
@@ -34,19 +53,11 @@ class FileEncryptor:
             output_path = str(input_file) + '.encrypted'
         
         try:
-            # Read file content
-            with open(input_file, 'rb') as f:
-                file_data = f.read()
-            
-            # Generate key from passphrase
-            key = self.engine.generate_key(self.passphrase)
+            self._check_output(input_file, output_path)
+            # Derive key from passphrase (cached after the first file)
+            key, header = self.engine.derive_key(self.passphrase)
             
-            # Encrypt data
-            encrypted_data = self.engine.encrypt_aes256(file_data, key)
-            
-            # Write encrypted file
-            with open(output_path, 'wb') as f:
-                f.write(encrypted_data)
+            self._encrypt_path(input_file, output_path, key, header, workers)
             
             print(f"✓ File encrypted successfully: {output_path}")
             return True
@@ -54,8 +65,51 @@ class FileEncryptor:
             print(f"Error encrypting file: {e}")
             return False
     
-    def decrypt_file(self, input_path, output_path=None):
-        """Decrypt an encrypted file and save to output path"""
+    def _encrypt_path(self, input_file, output_path, key, header, workers=None, progress=None):
+        """Encrypt one file with an already derived key, raising on failure
+        
+        The output is written to a temporary file next to it and only moved
+        into place once encryption has succeeded.
+        """
+        self._check_output(input_file, output_path)
+        partial_path = self._partial_path(output_path)
+        try:
+            if workers is not None:
+                written = encrypt_container(input_file, partial_path, key, workers,
+                                            self.chunk_size, prefix=header.to_bytes())
+                os.replace(partial_path, output_path)
+                if progress is not None:
+                    size = os.path.getsize(input_file)
+                    progress(size, size)
+                return written
+            
+            # Record the compression codec, if any, in the header flags
+            codec = self._choose_codec(input_file)
+            header = KeyHeader(header.kdf, header.salt, codec.CODEC_ID if codec else 0)
+            header_bytes = header.to_bytes()
+            
+            # Stream the file through the cipher chunk by chunk
+            with open(input_file, 'rb') as src, open(partial_path, 'wb') as dst:
+                dst.write(header_bytes)
+                if progress is not None:
+                    src = ProgressReader(src, progress)
+                if codec is not None:
+                    src = CompressingReader(src, codec, self.chunk_size)
+                written = len(header_bytes) + self.engine.encrypt_stream(
+                    src, dst, key, chunk_size=self.chunk_size)
+            os.replace(partial_path, output_path)
+            return written
+        except BaseException:
+            self._remove_partial(partial_path)
+            raise
+    
+    def decrypt_file(self, input_path, output_path=None, workers=None):
+        """Decrypt an encrypted file and save to output path
+        
+        Chunked containers are detected by their header magic and decrypted
+        in parallel; anything else is treated as IV + AES-256-CBC. Files
+        without a key header use the legacy unsalted key.
+        """
         input_file = Path(input_path)
         
         if not input_file.exists():
@@ -66,19 +120,8 @@ class FileEncryptor:
             output_path = str(input_file).replace('.encrypted', '_decrypted')
         
         try:
-            # Read encrypted file
-            with open(input_file, 'rb') as f:
-                encrypted_data = f.read()
-            
-            # Generate key from passphrase
-            key = self.engine.generate_key(self.passphrase)
-            
-            # Decrypt data
-            decrypted_data = self.engine.decrypt_aes256(encrypted_data, key)
-            
-            # Write decrypted file
-            with open(output_path, 'wb') as f:
-                f.write(decrypted_data)
+            self._check_output(input_file, output_path)
+            self._decrypt_path(input_file, output_path, workers)
             
             print(f"✓ File decrypted successfully: {output_path}")
             return True
@@ -86,40 +129,307 @@ class FileEncryptor:
             print(f"Error decrypting file: {e}")
             return False
     
+    def _decrypt_path(self, input_file, output_path, workers=None, progress=None):
+        """Decrypt one file, raising on failure
+        
+        Like _encrypt_path, the output only replaces output_path on success.
+        """
+        self._check_output(input_file, output_path)
+        partial_path = self._partial_path(output_path)
+        try:
+            # Derive key from passphrase and the salt stored in the file
+            with open(input_file, 'rb') as src:
+                key, header, offset = self.engine.key_for(self.passphrase,
+                                                          src.read(KEY_HEADER_MAX_SIZE))
+            codec = codec_from_flags(header.flags) if header is not None else None
+            
+            if codec is None and is_container(input_file, offset):
+                decrypt_container(input_file, partial_path, key, workers, offset)
+                os.replace(partial_path, output_path)
+                if progress is not None:
+                    size = os.path.getsize(input_file)
+                    progress(size, size)
+                return
+            
+            # Stream the file through the cipher chunk by chunk
+            with open(input_file, 'rb') as src, open(partial_path, 'wb') as dst:
+                src.seek(offset)
+                if progress is not None:
+                    src = ProgressReader(src, progress)
+                if codec is not None:
+                    dst = DecompressingWriter(dst, codec, self.chunk_size)
+                self.engine.decrypt_stream(src, dst, key, chunk_size=self.chunk_size)
+                if codec is not None:
+                    dst.close()
+            os.replace(partial_path, output_path)
+        except BaseException:
+            self._remove_partial(partial_path)
+            raise
+    
+    def run_job(self, command, input_path, output_path=None, workers=None, progress=None):
+        """Encrypt or decrypt one file, raising instead of printing on failure
+        
+        Used by front ends (the daemon, the GUI) that report errors themselves.
+        progress, if given, is called as progress(bytes_read, total_bytes)
+        after each chunk; raising OperationCancelled from it aborts the job
+        and removes the partial output. Returns the output path.
+        """
+        input_file = Path(input_path)
+        if command == 'encrypt':
+            output_path = output_path or str(input_file) + '.encrypted'
+            key, header = self.engine.derive_key(self.passphrase)
+            self._encrypt_path(input_file, output_path, key, header, workers, progress)
+        elif command == 'decrypt':
+            output_path = output_path or str(input_file).replace('.encrypted', '_decrypted')
+            self._decrypt_path(input_file, output_path, workers, progress)
+        else:
+            raise ValueError(f"Unknown command: {command}")
+        return output_path
+    
+    def _check_output(self, input_file, output_path):
+        """Refuse an output path that is the input file itself"""
+        if os.path.abspath(output_path) == os.path.abspath(input_file) or \
+                (os.path.exists(output_path) and os.path.samefile(output_path, input_file)):
+            raise ValueError(f"Output path {output_path} would overwrite the input file")
+    
+    def _partial_path(self, output_path):
+        """Hidden temporary name in the output's directory, ending like the output"""
+        directory, name = os.path.split(os.fspath(output_path))
+        return os.path.join(directory, f".{secrets.token_hex(4)}.{name}")
+    
+    def _remove_partial(self, output_path):
+        """Delete a half-written output file after a failure"""
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+    
     def _is_supported_format(self, file_extension):
         """Check if file format is in supported list"""
         return file_extension.lower() in self.SUPPORTED_FORMATS
     
-    def batch_encrypt(self, directory, pattern='*'):
-        """Encrypt all files matching pattern in directory"""
-        dir_path = Path(directory)
-        count = 0
+    def _is_compressed_format(self, file_extension):
+        """Check if file format is already compressed"""
+        return file_extension.lower() in self.COMPRESSED_FORMATS
+    
+    def _choose_codec(self, input_file):
+        """Pick the compression codec for a file, or None to store it as is
+        
+        In 'auto' mode, known compressed formats are skipped by extension and
+        everything else by sampling the entropy of its first few KB.
+        """
+        if not self.compression or self.compression == 'none':
+            return None
+        if self.compression != 'auto':
+            return codec_by_name(self.compression)
+        if self._is_compressed_format(Path(input_file).suffix):
+            return None
+        if sample_entropy(input_file) >= ENTROPY_THRESHOLD:
+            return None
+        return CODECS[ZlibCodec.CODEC_ID]
+    
+    def batch_encrypt(self, directory, pattern='*', recursive=False, workers=None,
+                      manifest=None, hash_contents=False):
+        """Encrypt all files matching pattern in directory
+        
+        Files are encrypted concurrently by a bounded thread pool, so one
+        file's reads and writes overlap with another's encryption. The key is
+        derived once for the whole batch. Existing .encrypted outputs are
+        skipped. Returns a BatchResult with throughput and per-file failures.
         
-        for file in dir_path.glob(pattern):
-            if file.is_file():
-                if self.encrypt_file(str(file)):
-                    count += 1
+        With an EncryptionManifest, the run is incremental: files whose size,
+        mtime and inode are unchanged are skipped, renamed files get their
+        existing output renamed, and outputs of deleted sources are removed.
+        hash_contents also records a content digest so files that were only
+        touched are not re-encrypted.
+        """
+        key, header = self.engine.derive_key(self.passphrase)
+        workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        directory = os.path.abspath(directory)
+        result = BatchResult()
+        seen = set()
         
-        print(f"\nEncrypted {count} files")
+        def encrypt_one(path, entry):
+            output_path = path + '.encrypted'
+            digest = file_digest(path) if hash_contents else None
+            if digest is not None and entry is not None and entry.digest == digest \
+                    and os.path.exists(entry.output):
+                return FileOutcome(False, digest)
+            self._encrypt_path(path, output_path, key, header)
+            return FileOutcome(True, digest)
+        
+        def collect(path, stat, future):
+            outcome = result.record(path, stat.st_size, future)
+            # The manifest is only touched from this thread
+            if outcome is not None and manifest is not None:
+                manifest.record(path, stat, path + '.encrypted', outcome.digest)
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for path, stat in self._scan(directory, pattern, recursive):
+                entry = None
+                if manifest is not None:
+                    seen.add(path)
+                    entry = manifest.get(path)
+                    if entry is not None and entry.matches(stat) and os.path.exists(entry.output):
+                        result.files_skipped += 1
+                        continue
+                    if entry is None and self._adopt_renamed(manifest, path, stat):
+                        result.files_renamed += 1
+                        continue
+                pending.append((path, stat, pool.submit(encrypt_one, path, entry)))
+                # Keep the queue bounded so huge trees don't pile up futures
+                if len(pending) >= workers * 2:
+                    collect(*pending.popleft())
+            while pending:
+                collect(*pending.popleft())
+        
+        if manifest is not None:
+            self._prune_deleted(manifest, seen, directory, pattern, recursive, result)
+            manifest.commit()
+        
+        result.finish()
+        print(f"\n{result.summary()}")
+        return result
+    
+    def _adopt_renamed(self, manifest, path, stat):
+        """Reuse the output of a vanished source with the same identity as path"""
+        for candidate in manifest.find_by_identity(stat):
+            if candidate.source != path and not os.path.exists(candidate.source) \
+                    and os.path.exists(candidate.output):
+                output_path = path + '.encrypted'
+                os.replace(candidate.output, output_path)
+                manifest.remove(candidate.source)
+                manifest.record(path, stat, output_path, candidate.digest)
+                return True
+        return False
+    
+    def _prune_deleted(self, manifest, seen, directory, pattern, recursive, result):
+        """Remove outputs and entries for in-scope sources that no longer exist"""
+        for entry in manifest.entries():
+            if entry.source in seen:
+                continue
+            parent, name = os.path.split(entry.source)
+            in_scope = parent == directory or \
+                (recursive and parent.startswith(directory + os.sep))
+            if not in_scope or not fnmatch.fnmatch(name, pattern) \
+                    or os.path.exists(entry.source):
+                continue
+            try:
+                os.remove(entry.output)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                result.failures.append((entry.source, f"could not remove output: {e}"))
+                continue
+            manifest.remove(entry.source)
+            result.files_deleted += 1
+    
+    def _scan(self, directory, pattern, recursive):
+        """Yield (path, stat) of regular files matching pattern using os.scandir"""
+        stack = [str(directory)]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            stack.append(entry.path)
+                    elif entry.is_file() and fnmatch.fnmatch(entry.name, pattern) \
+                            and not entry.name.endswith('.encrypted'):
+                        yield entry.path, entry.stat()
 
 
-if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print("Usage: encrypt_file.py <encrypt|decrypt> <file> [passphrase]")
-        sys.exit(1)
+class OperationCancelled(Exception):
+    """Raised from a progress callback to abort the file being processed"""
+
+
+class ProgressReader:
+    """Wraps a binary file and reports how much of it has been read"""
+    
+    def __init__(self, raw, callback):
+        self.raw = raw
+        self.callback = callback
+        self.total = os.fstat(raw.fileno()).st_size
     
-    command = sys.argv[1]
-    file_path = sys.argv[2]
-    passphrase = sys.argv[3] if len(sys.argv) > 3 else "DefaultPassword"
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.callback(self.raw.tell(), self.total)
+        return data
+    
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        self.callback(self.raw.tell(), self.total)
+        return count
+
+
+FileOutcome = namedtuple('FileOutcome', ['encrypted', 'digest'])
+
+
+class BatchResult:
+    """Outcome of a batch run: counts, throughput and per-file failures"""
+    
+    def __init__(self):
+        self.files_encrypted = 0
+        self.files_skipped = 0
+        self.files_renamed = 0
+        self.files_deleted = 0
+        self.bytes_processed = 0
+        self.failures = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+    
+    def record(self, path, size, future):
+        """Collect one file's job; returns its FileOutcome, or None if it failed"""
+        try:
+            outcome = future.result()
+        except Exception as e:
+            self.failures.append((path, str(e)))
+            return None
+        if outcome.encrypted:
+            self.files_encrypted += 1
+            self.bytes_processed += size
+        else:
+            self.files_skipped += 1
+        return outcome
+    
+    def finish(self):
+        """Stop the clock"""
+        self.elapsed = time.perf_counter() - self.started
+    
+    @property
+    def files_per_sec(self):
+        return self.files_encrypted / self.elapsed if self.elapsed else 0.0
+    
+    @property
+    def mb_per_sec(self):
+        return self.bytes_processed / 1e6 / self.elapsed if self.elapsed else 0.0
+    
+    def summary(self):
+        """One-line human readable summary"""
+        return (f"Encrypted {self.files_encrypted} files, skipped {self.files_skipped}, "
+                f"renamed {self.files_renamed}, deleted {self.files_deleted}, "
+                f"{len(self.failures)} failed "
+                f"in {self.elapsed:.2f}s ({self.files_per_sec:.1f} files/s, "
+                f"{self.mb_per_sec:.1f} MB/s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Encrypt or decrypt a file with AES-256")
+    parser.add_argument('command', choices=['encrypt', 'decrypt'])
+    parser.add_argument('file')
+    parser.add_argument('passphrase', nargs='?', default="DefaultPassword")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="use the parallel chunked AES-GCM format with N processes (0 = all cores)")
+    parser.add_argument('--compression', default='auto', choices=['auto', 'none', 'zlib', 'lzma'],
+                        help="compress before encrypting (not used with --workers)")
+    args = parser.parse_args()
     
-    encryptor = FileEncryptor(passphrase)
+    encryptor = FileEncryptor(args.passphrase, compression=args.compression)
     
-    if command == 'encrypt':
-        encryptor.encrypt_file(file_path)
-    elif command == 'decrypt':
-        encryptor.decrypt_file(file_path)
+    if args.command == 'encrypt':
+        encryptor.encrypt_file(args.file, workers=args.workers)
     else:
-        print(f"Unknown command: {command}")
+        encryptor.decrypt_file(args.file, workers=args.workers)
 
 # Written by: AI Agents
 # License: MIT
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Random-Access Encrypted File Reader
+Read-only, seekable file object over an encrypted file that decrypts only
+the blocks covering the requested byte range
+AI-Generated Implementation
+"""
+
+import io
+import mmap
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from encryption import EncryptionEngine
+from container import ContainerHeader, CONTAINER_MAGIC, HEADER_SIZE, TAG_SIZE
+from kdf import KEY_HEADER_MAX_SIZE
+from compression import codec_from_flags
+
+
+class EncryptedFileReader(io.RawIOBase):
+    """Seekable raw reader over an AES-256-CBC file or a chunked container
+
+    CBC files are decrypted block-wise: plaintext block i only depends on
+    ciphertext blocks i-1 and i, so a range is decrypted by starting the CBC
+    decryptor with the preceding ciphertext block as its IV. Containers are
+    decrypted one authenticated chunk at a time, and the most recent chunk is
+    kept so sequential reads do not decrypt it twice.
+    """
+
+    def __init__(self, path, passphrase, engine=None):
+        super().__init__()
+        self.engine = engine or EncryptionEngine('AES-256')
+        self.block_size = self.engine.block_size
+        # Set first so close() works however far construction got
+        self._file = None
+        self._map = None
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("Encrypted file is empty")
+        self._position = 0
+        self._cached_chunk = (None, b'')
+        try:
+            self.key, key_header, self._offset = self.engine.key_for(
+                passphrase, self._map[:KEY_HEADER_MAX_SIZE])
+            if key_header is not None and codec_from_flags(key_header.flags) is not None:
+                raise ValueError("Compressed files cannot be read with random access")
+            self._detect_format()
+        except Exception:
+            self.close()
+            raise
+
+    def _detect_format(self):
+        """Pick the CBC or container reader and work out the plaintext length"""
+        offset = self._offset
+        if self._map[offset:offset + len(CONTAINER_MAGIC)] == CONTAINER_MAGIC:
+            self._header = ContainerHeader.from_bytes(self._map[offset:offset + HEADER_SIZE],
+                                                      offset)
+            self._associated_data = self._header.associated_data(self._map[:offset])
+            if len(self._map) != self._header.container_length:
+                raise ValueError("Container is truncated or has trailing data")
+            self._length = self._header.plaintext_length
+            self._read_range = self._read_container_range
+        else:
+            self._header = None
+            self._length = self._cbc_plaintext_length()
+            self._read_range = self._read_cbc_range
+
+    def _cbc_plaintext_length(self):
+        """Work out the plaintext size from the padding in the final block"""
+        data_length = len(self._map) - self._offset - self.block_size
+        if data_length < self.block_size or data_length % self.block_size:
+            raise ValueError("Ciphertext is not a whole number of blocks")
+        last_block = self._decrypt_cbc_blocks(data_length // self.block_size - 1, 1)
+        padding_length = last_block[-1]
+        if not 1 <= padding_length <= self.block_size or \
+                last_block[-padding_length:] != bytes([padding_length]) * padding_length:
+            raise ValueError("Invalid padding - wrong passphrase or corrupted data")
+        return data_length - padding_length
+
+    def _decrypt_cbc_blocks(self, first, count):
+        """Decrypt count ciphertext blocks starting at block index first"""
+        start = self._offset + self.block_size * (first + 1)
+        iv = self._map[start - self.block_size:start]
+        decryptor = Cipher(
+            algorithms.AES(self.key),
+            modes.CBC(iv),
+            backend=self.engine.backend
+        ).decryptor()
+        return decryptor.update(self._map[start:start + count * self.block_size])
+
+    def _read_cbc_range(self, offset, size):
+        """Decrypt plaintext [offset, offset + size) from a CBC file"""
+        first = offset // self.block_size
+        last = (offset + size - 1) // self.block_size
+        plaintext = self._decrypt_cbc_blocks(first, last - first + 1)
+        skip = offset - first * self.block_size
+        return plaintext[skip:skip + size]
+
+    def _container_chunk(self, index):
+        """Decrypt and cache a single container chunk"""
+        cached_index, cached_plaintext = self._cached_chunk
+        if cached_index == index:
+            return cached_plaintext
+        header = self._header
+        _, length = header.plaintext_span(index)
+        start = header.ciphertext_offset(index)
+        plaintext = self.engine.decrypt_aes256_gcm(
+            self._map[start:start + length + TAG_SIZE], self.key,
+            header.nonce(index), self._associated_data)
+        self._cached_chunk = (index, plaintext)
+        return plaintext
+
+    def _read_container_range(self, offset, size):
+        """Decrypt plaintext [offset, offset + size) from a container"""
+        index, skip = divmod(offset, self._header.chunk_size)
+        return self._container_chunk(index)[skip:skip + size]
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Move the read position; seeking past the end is allowed"""
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._length + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def readinto(self, buffer):
+        """Decrypt up to len(buffer) bytes at the current position into buffer"""
+        size = min(len(buffer), self._length - self._position)
+        if size <= 0:
+            return 0
+        data = self._read_range(self._position, size)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._cached_chunk = (None, b'')
+            if self._map is not None:
+                self._map.close()
+            if self._file is not None:
+                self._file.close()
+        super().close()
+
+    def __len__(self):
+        return self._length
+
+
+def open_encrypted(path, passphrase, buffer_size=io.DEFAULT_BUFFER_SIZE):
+    """Open an encrypted file for buffered, seekable reading"""
+    return io.BufferedReader(EncryptedFileReader(path, passphrase), buffer_size)
+
+# Written by: AI Agents
+# License: MIT
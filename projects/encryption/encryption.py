@@ -7,30 +7,207 @@ Supports multiple encryption algorithms and block modes
 
 import os
 import json
+import base64
+import struct
+import threading
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 import hashlib
+from kdf import ScryptKDF, KeyHeader, DEFAULT_KEY_CACHE, SALT_LENGTH
+
+# Size of the plaintext/ciphertext slices fed through the cipher when streaming
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Length prefix of each binary record produced by encrypt_many
+RECORD_PREFIX = struct.Struct('>I')
 
 class EncryptionEngine:
     """Main encryption engine supporting multiple algorithms"""
     
-    def __init__(self, algorithm='AES-256'):
+    def __init__(self, algorithm='AES-256', kdf=None, key_cache=None):
         self.algorithm = algorithm
         self.backend = default_backend()
         self.block_size = 16  # 128 bits
+        self.kdf = kdf if kdf is not None else ScryptKDF()
+        self.key_cache = key_cache if key_cache is not None else DEFAULT_KEY_CACHE
+        self._salt = None
+        self._local = threading.local()
+        self._algorithm = (None, None)
         
     def generate_key(self, passphrase):
-        """Generate AES key from passphrase using SHA-256"""
+        """Generate AES key from passphrase using SHA-256
+        
+        Unsalted legacy derivation, only used to decrypt data written before
+        key headers existed. New data uses derive_key.
+        """
         key = hashlib.sha256(passphrase.encode()).digest()
         return key
     
+    def derive_key(self, passphrase, salt=None):
+        """Derive a key from passphrase with the engine's salted KDF
+        
+        Returns (key, header), where header is the KeyHeader to write in front
+        of the ciphertext. Without an explicit salt, each engine generates one
+        random salt and reuses it, so repeated calls are served from the key
+        cache instead of re-running the KDF.
+        """
+        if salt is None:
+            if self._salt is None:
+                self._salt = os.urandom(SALT_LENGTH)
+            salt = self._salt
+        key = self.key_cache.get(passphrase, self.kdf, salt)
+        return key, KeyHeader(self.kdf, salt)
+    
+    def key_for(self, passphrase, data):
+        """Key for a ciphertext beginning with data
+        
+        Returns (key, header, header_length). Data without a key header was
+        written by older versions and gets the legacy SHA-256 key.
+        """
+        header, length = KeyHeader.parse(data)
+        if header is None:
+            return self.generate_key(passphrase), None, 0
+        return self.key_cache.get(passphrase, header.kdf, header.salt), header, length
+    
     def generate_iv(self):
         """Generate random initialization vector"""
         return os.urandom(self.block_size)
     
+    def _aes(self, key):
+        """AES algorithm object for key, reused while the key stays the same"""
+        cached_key, algorithm = self._algorithm
+        if cached_key != key:
+            algorithm = algorithms.AES(key)
+            self._algorithm = (bytes(key), algorithm)
+        return algorithm
+    
+    def encrypted_size(self, plaintext_length):
+        """Size of IV + padded ciphertext produced for a plaintext of this length"""
+        return self.block_size * (plaintext_length // self.block_size + 2)
+    
+    def _scratch_block(self):
+        """Per-thread two-block scratch buffer used for the final CBC block"""
+        scratch = getattr(self._local, 'scratch', None)
+        if scratch is None:
+            scratch = self._local.scratch = bytearray(2 * self.block_size)
+        return scratch
+    
+    def encrypt_into(self, plaintext, key, out, iv=None):
+        """Encrypt a bytes-like object into a preallocated writable buffer
+        
+        Writes IV + AES-256-CBC ciphertext (PKCS7 padded) into out, which must
+        hold at least encrypted_size(len(plaintext)) bytes. Whole blocks are
+        encrypted straight into out with update_into; no intermediate copies
+        of the data are made. Returns the number of bytes written.
+        """
+        data = memoryview(plaintext).cast('B')
+        out_view = memoryview(out).cast('B')
+        size = self.encrypted_size(len(data))
+        if len(out_view) < size:
+            raise ValueError(f"Output buffer too small: need {size} bytes")
+        if iv is None:
+            iv = self.generate_iv()
+        out_view[:self.block_size] = iv
+        
+        encryptor = Cipher(
+            self._aes(key),
+            modes.CBC(iv),
+            backend=self.backend
+        ).encryptor()
+        
+        whole = len(data) - len(data) % self.block_size
+        written = self.block_size
+        if whole:
+            written += encryptor.update_into(data[:whole], out_view[written:])
+        
+        # Final block: leftover bytes plus PKCS7 padding, encrypted via scratch
+        scratch = self._scratch_block()
+        remainder = len(data) - whole
+        padding_length = self.block_size - remainder
+        scratch[:remainder] = data[whole:]
+        scratch[remainder:self.block_size] = bytes((padding_length,)) * padding_length
+        block_view = memoryview(scratch)
+        produced = encryptor.update_into(block_view[:self.block_size], block_view)
+        encryptor.finalize()
+        out_view[written:written + produced] = block_view[:produced]
+        return written + produced
+    
+    def decrypt_into(self, ciphertext, key, out):
+        """Decrypt IV + AES-256-CBC ciphertext into a preallocated writable buffer
+        
+        out must hold at least len(ciphertext) - block_size bytes. The PKCS7
+        padding is checked and stripped. Returns the number of plaintext
+        bytes written.
+        """
+        data = memoryview(ciphertext).cast('B')
+        out_view = memoryview(out).cast('B')
+        body_length = len(data) - self.block_size
+        if body_length < self.block_size or body_length % self.block_size:
+            raise ValueError("Ciphertext is not a whole number of blocks")
+        if len(out_view) < body_length:
+            raise ValueError(f"Output buffer too small: need {body_length} bytes")
+        
+        decryptor = Cipher(
+            self._aes(key),
+            modes.CBC(data[:self.block_size]),
+            backend=self.backend
+        ).decryptor()
+        
+        # All blocks but the last go straight into out
+        last_start = len(data) - self.block_size
+        written = 0
+        if last_start > self.block_size:
+            written = decryptor.update_into(data[self.block_size:last_start], out_view)
+        
+        scratch = self._scratch_block()
+        block_view = memoryview(scratch)
+        decryptor.update_into(data[last_start:], block_view)
+        decryptor.finalize()
+        
+        # Remove PKCS7 padding
+        padding_length = scratch[self.block_size - 1]
+        if not 1 <= padding_length <= self.block_size or \
+                scratch.count(padding_length, self.block_size - padding_length,
+                              self.block_size) != padding_length:
+            raise ValueError("Invalid padding - wrong passphrase or corrupted data")
+        remainder = self.block_size - padding_length
+        out_view[written:written + remainder] = block_view[:remainder]
+        return written + remainder
+    
     def encrypt_aes256(self, plaintext, key, iv=None):
         """Encrypt data using AES-256-CBC"""
+        out = bytearray(self.encrypted_size(len(plaintext)))
+        self.encrypt_into(plaintext, key, out, iv)
+        return bytes(out)
+    
+    def decrypt_aes256(self, ciphertext, key):
+        """Decrypt AES-256-CBC encrypted data"""
+        out = bytearray(max(0, len(ciphertext) - self.block_size))
+        written = self.decrypt_into(ciphertext, key, out)
+        del out[written:]
+        return bytes(out)
+    
+    def encrypt_aes256_gcm(self, plaintext, key, nonce, associated_data=None):
+        """Encrypt and authenticate data using AES-256-GCM
+        
+        Returns the ciphertext with the 16-byte tag appended. The nonce must
+        never be reused with the same key.
+        """
+        return AESGCM(key).encrypt(nonce, plaintext, associated_data)
+    
+    def decrypt_aes256_gcm(self, ciphertext, key, nonce, associated_data=None):
+        """Verify and decrypt AES-256-GCM data, raising InvalidTag on tampering"""
+        return AESGCM(key).decrypt(nonce, ciphertext, associated_data)
+    
+    def encrypt_stream(self, source, dest, key, iv=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Encrypt a binary stream into another using AES-256-CBC
+        
+        Produces the same IV + ciphertext layout as encrypt_aes256, but reads
+        fixed-size chunks into a reusable buffer so memory use does not grow
+        with the size of the input. Returns the number of bytes written.
+        """
         if iv is None:
             iv = self.generate_iv()
         
@@ -41,17 +218,39 @@ class EncryptionEngine:
         )
         encryptor = cipher.encryptor()
         
-        # Add PKCS7 padding
-        padding_length = self.block_size - (len(plaintext) % self.block_size)
-        padded_plaintext = plaintext + bytes([padding_length]) * padding_length
+        in_buffer = bytearray(chunk_size)
+        in_view = memoryview(in_buffer)
+        out_buffer = bytearray(chunk_size + self.block_size)
+        out_view = memoryview(out_buffer)
+        
+        dest.write(iv)
+        written = len(iv)
+        total_read = 0
+        while True:
+            count = source.readinto(in_buffer)
+            if not count:
+                break
+            total_read += count
+            produced = encryptor.update_into(in_view[:count], out_buffer)
+            dest.write(out_view[:produced])
+            written += produced
         
-        ciphertext = encryptor.update(padded_plaintext) + encryptor.finalize()
-        return iv + ciphertext
+        # Add PKCS7 padding
+        padding_length = self.block_size - (total_read % self.block_size)
+        tail = encryptor.update(bytes([padding_length]) * padding_length) + encryptor.finalize()
+        dest.write(tail)
+        return written + len(tail)
     
-    def decrypt_aes256(self, ciphertext, key):
-        """Decrypt AES-256-CBC encrypted data"""
-        iv = ciphertext[:self.block_size]
-        encrypted_data = ciphertext[self.block_size:]
+    def decrypt_stream(self, source, dest, key, chunk_size=STREAM_CHUNK_SIZE):
+        """Decrypt an AES-256-CBC stream written by encrypt_stream/encrypt_aes256
+        
+        The last plaintext block is held back until the end of the input so the
+        PKCS7 padding can be checked and stripped. Returns the number of
+        plaintext bytes written.
+        """
+        iv = source.read(self.block_size)
+        if len(iv) != self.block_size:
+            raise ValueError("Ciphertext is too short to contain an IV")
         
         cipher = Cipher(
             algorithms.AES(key),
@@ -59,26 +258,122 @@ class EncryptionEngine:
             backend=self.backend
         )
         decryptor = cipher.decryptor()
-        padded_plaintext = decryptor.update(encrypted_data) + decryptor.finalize()
+        
+        in_buffer = bytearray(chunk_size)
+        in_view = memoryview(in_buffer)
+        out_buffer = bytearray(chunk_size + self.block_size)
+        out_view = memoryview(out_buffer)
+        last_block = bytearray()
+        
+        written = 0
+        while True:
+            count = source.readinto(in_buffer)
+            if not count:
+                break
+            produced = decryptor.update_into(in_view[:count], out_buffer)
+            if not produced:
+                continue
+            dest.write(last_block)
+            dest.write(out_view[:produced - self.block_size])
+            written += len(last_block) + produced - self.block_size
+            last_block = bytearray(out_view[produced - self.block_size:produced])
+        # Raises if the ciphertext was not a whole number of blocks
+        last_block += decryptor.finalize()
         
         # Remove PKCS7 padding
-        padding_length = padded_plaintext[-1]
-        plaintext = padded_plaintext[:-padding_length]
-        return plaintext
+        padding_length = last_block[-1] if last_block else 0
+        if not 1 <= padding_length <= self.block_size or \
+                last_block[-padding_length:] != bytes([padding_length]) * padding_length:
+            raise ValueError("Invalid padding - wrong passphrase or corrupted data")
+        dest.write(last_block[:-padding_length])
+        return written + len(last_block) - padding_length
     
     def encrypt_text(self, text, passphrase):
         """Encrypt plain text with passphrase"""
-        key = self.generate_key(passphrase)
+        key, header = self.derive_key(passphrase)
         plaintext_bytes = text.encode('utf-8')
-        ciphertext = self.encrypt_aes256(plaintext_bytes, key)
+        ciphertext = header.to_bytes() + self.encrypt_aes256(plaintext_bytes, key)
         return ciphertext.hex()
     
     def decrypt_text(self, hex_ciphertext, passphrase):
         """Decrypt ciphertext with passphrase"""
-        key = self.generate_key(passphrase)
         ciphertext = bytes.fromhex(hex_ciphertext)
-        plaintext_bytes = self.decrypt_aes256(ciphertext, key)
+        key, _, offset = self.key_for(passphrase, ciphertext)
+        plaintext_bytes = self.decrypt_aes256(memoryview(ciphertext)[offset:], key)
         return plaintext_bytes.decode('utf-8')
+    
+    def encrypt_many(self, messages, passphrase, framing='binary'):
+        """Encrypt an iterable of messages, deriving the key only once
+        
+        Messages may be str (UTF-8 encoded) or bytes-like. Records are
+        yielded lazily as key header + IV + ciphertext, all sharing one salt
+        so decrypt_many derives the key once too: with framing='binary' each is
+        prefixed with its 4-byte big-endian length so records can be
+        concatenated into one stream; with framing='base64' each is an
+        ASCII str.
+        """
+        if framing not in ('binary', 'base64'):
+            raise ValueError(f"Unknown framing: {framing}")
+        key, header = self.derive_key(passphrase)
+        header_bytes = header.to_bytes()
+        start = len(header_bytes)
+        if framing == 'binary':
+            start += RECORD_PREFIX.size
+        for message in messages:
+            if isinstance(message, str):
+                message = message.encode('utf-8')
+            size = len(header_bytes) + self.encrypted_size(len(message))
+            record = bytearray(start + self.encrypted_size(len(message)))
+            record[start - len(header_bytes):start] = header_bytes
+            self.encrypt_into(message, key, memoryview(record)[start:])
+            if framing == 'base64':
+                yield base64.b64encode(record).decode('ascii')
+            else:
+                RECORD_PREFIX.pack_into(record, 0, size)
+                yield bytes(record)
+    
+    def decrypt_many(self, records, passphrase, framing='binary', text=False):
+        """Decrypt records produced by encrypt_many, deriving the key only once
+        
+        Yields bytes, or str when text is True. Binary records must carry
+        their length prefix; use read_records() to split a concatenated stream.
+        """
+        if framing not in ('binary', 'base64'):
+            raise ValueError(f"Unknown framing: {framing}")
+        prefix_size = RECORD_PREFIX.size
+        last_header, key, offset = None, None, 0
+        for record in records:
+            if framing == 'base64':
+                body = memoryview(base64.b64decode(record))
+            else:
+                body = memoryview(record)[prefix_size:]
+                if RECORD_PREFIX.unpack_from(record)[0] != len(body):
+                    raise ValueError("Record length prefix does not match its size")
+            # Records from one encrypt_many call share a header; only look up
+            # the key again when it changes
+            if last_header is None or not offset or body[:offset] != last_header:
+                key, _, offset = self.key_for(passphrase, body)
+                last_header = bytes(body[:offset])
+            body = body[offset:]
+            out = bytearray(len(body))
+            written = self.decrypt_into(body, key, out)
+            del out[written:]
+            yield out.decode('utf-8') if text else bytes(out)
+
+
+def read_records(stream):
+    """Split a binary stream of length-prefixed records from encrypt_many"""
+    while True:
+        prefix = stream.read(RECORD_PREFIX.size)
+        if not prefix:
+            return
+        if len(prefix) != RECORD_PREFIX.size:
+            raise ValueError("Truncated record length prefix")
+        size = RECORD_PREFIX.unpack(prefix)[0]
+        body = stream.read(size)
+        if len(body) != size:
+            raise ValueError("Truncated record")
+        yield prefix + body
 
 # Module initialization
 if __name__ == '__main__':
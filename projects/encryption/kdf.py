@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Key Derivation Layer
+Pluggable salted KDFs, the key header that records them in ciphertexts, and
+an in-process cache of derived keys
+AI-Generated Implementation
+
+Key header layout (prepended to everything encrypted with a passphrase):
+    magic (4) | version (1) | KDF id (1) | flags (1) | params length (1) | params |
+    salt length (1) | salt
+"""
+
+import os
+import hmac
+import time
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+KEY_HEADER_MAGIC = b'EKDF'
+KEY_HEADER_VERSION = 1
+KEY_LENGTH = 32
+SALT_LENGTH = 16
+# Upper bound on the size of a key header, for reading it off the front of a file
+KEY_HEADER_MAX_SIZE = 8 + 255 + 1 + 255
+# Highest costs accepted from a key header, which comes from an untrusted file.
+# scrypt needs 128 * r * n bytes of memory; p multiplies its CPU time
+SCRYPT_MAX_MEMORY = 256 * 1024 * 1024
+SCRYPT_MAX_P = 4
+PBKDF2_MAX_ITERATIONS = 10_000_000
+
+
+class ScryptKDF:
+    """scrypt with configurable cost (n), block size (r) and parallelism (p)"""
+
+    KDF_ID = 1
+    PARAMS = struct.Struct('>BBB')
+
+    def __init__(self, n=2 ** 15, r=8, p=1):
+        if n < 2 or n & (n - 1):
+            raise ValueError("scrypt n must be a power of two")
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def derive(self, passphrase, salt):
+        return Scrypt(salt=salt, length=KEY_LENGTH, n=self.n, r=self.r, p=self.p).derive(passphrase)
+
+    def encode_params(self):
+        return self.PARAMS.pack(self.n.bit_length() - 1, self.r, self.p)
+
+    @classmethod
+    def from_params(cls, data):
+        log_n, r, p = cls.PARAMS.unpack(data)
+        if 128 * r * 2 ** log_n > SCRYPT_MAX_MEMORY or p > SCRYPT_MAX_P:
+            raise ValueError(f"scrypt cost n=2^{log_n}, r={r}, p={p} exceeds the allowed maximum")
+        return cls(2 ** log_n, r, p)
+
+
+class PBKDF2KDF:
+    """PBKDF2-HMAC-SHA256 with a configurable iteration count"""
+
+    KDF_ID = 2
+    PARAMS = struct.Struct('>I')
+
+    def __init__(self, iterations=600000):
+        self.iterations = iterations
+
+    def derive(self, passphrase, salt):
+        return PBKDF2HMAC(algorithm=hashes.SHA256(), length=KEY_LENGTH, salt=salt,
+                          iterations=self.iterations).derive(passphrase)
+
+    def encode_params(self):
+        return self.PARAMS.pack(self.iterations)
+
+    @classmethod
+    def from_params(cls, data):
+        iterations, = cls.PARAMS.unpack(data)
+        if iterations > PBKDF2_MAX_ITERATIONS:
+            raise ValueError(f"PBKDF2 iteration count {iterations} exceeds the allowed maximum")
+        return cls(iterations)
+
+
+KDF_REGISTRY = {}
+
+
+def register_kdf(kdf_class):
+    """Make a KDF class available for decoding key headers"""
+    KDF_REGISTRY[kdf_class.KDF_ID] = kdf_class
+    return kdf_class
+
+
+register_kdf(ScryptKDF)
+register_kdf(PBKDF2KDF)
+
+
+class KeyHeader:
+    """KDF choice, parameters and salt recorded in front of a ciphertext"""
+
+    def __init__(self, kdf, salt, flags=0):
+        self.kdf = kdf
+        self.salt = salt
+        self.flags = flags
+
+    def to_bytes(self):
+        params = self.kdf.encode_params()
+        return (KEY_HEADER_MAGIC + bytes((KEY_HEADER_VERSION, self.kdf.KDF_ID, self.flags,
+                                          len(params)))
+                + params + bytes((len(self.salt),)) + self.salt)
+
+    @classmethod
+    def parse(cls, data):
+        """Parse a header at the start of data
+
+        Returns (header, header_length), or (None, 0) for data without the
+        header magic, i.e. written before salted KDFs were introduced.
+        """
+        data = bytes(data[:KEY_HEADER_MAX_SIZE])
+        if not data.startswith(KEY_HEADER_MAGIC):
+            return None, 0
+        try:
+            version, kdf_id, flags, params_length = data[4:8]
+            params = data[8:8 + params_length]
+            salt_length = data[8 + params_length]
+            salt_start = 9 + params_length
+            salt = data[salt_start:salt_start + salt_length]
+        except (ValueError, IndexError):
+            raise ValueError("Truncated key header") from None
+        if version != KEY_HEADER_VERSION:
+            raise ValueError(f"Unsupported key header version {version}")
+        if len(salt) != salt_length or len(params) != params_length:
+            raise ValueError("Truncated key header")
+        if kdf_id not in KDF_REGISTRY:
+            raise ValueError(f"Unknown key derivation function id {kdf_id}")
+        kdf = KDF_REGISTRY[kdf_id].from_params(params)
+        return cls(kdf, salt, flags), salt_start + salt_length
+
+
+class KeyCache:
+    """Thread-safe LRU/TTL cache of derived keys
+
+    Entries are keyed on (passphrase fingerprint, KDF id, params, salt). The
+    fingerprint is an HMAC under a per-process random secret, so the cache
+    never holds the passphrase or a fast unsalted hash of it. Keys are held in
+    bytearrays that are overwritten with zeros when evicted, expired or
+    cleared; callers receive their own bytes copy.
+    """
+
+    def __init__(self, max_entries=64, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, passphrase):
+        """HMAC of a passphrase, for identifying it without keeping it around"""
+        if isinstance(passphrase, str):
+            passphrase = passphrase.encode('utf-8')
+        return hmac.new(self._secret, passphrase, hashlib.sha256).digest()
+
+    @staticmethod
+    def _zeroise(key):
+        key[:] = bytes(len(key))
+
+    def get(self, passphrase, kdf, salt):
+        """Return the derived key, running the KDF only on a cache miss"""
+        if isinstance(passphrase, str):
+            passphrase = passphrase.encode('utf-8')
+        cache_key = (self.fingerprint(passphrase), kdf.KDF_ID, kdf.encode_params(), bytes(salt))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                key, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(cache_key)
+                    self.hits += 1
+                    return bytes(key)
+                del self._entries[cache_key]
+                self._zeroise(key)
+            self.misses += 1
+
+        # Derive outside the lock so slow KDFs don't serialise unrelated lookups
+        key = bytearray(kdf.derive(passphrase, bytes(salt)))
+        result = bytes(key)
+        with self._lock:
+            previous = self._entries.pop(cache_key, None)
+            if previous is not None:
+                self._zeroise(previous[0])
+            self._entries[cache_key] = (key, now + self.ttl)
+            self._evict(now)
+        return result
+
+    def _evict(self, now):
+        """Drop expired entries, then the least recently used beyond the cap"""
+        for cache_key in [k for k, (_, expires) in self._entries.items() if expires <= now]:
+            self._zeroise(self._entries.pop(cache_key)[0])
+        while len(self._entries) > self.max_entries:
+            _, (key, _) = self._entries.popitem(last=False)
+            self._zeroise(key)
+
+    def clear(self):
+        """Zeroise and drop every cached key"""
+        with self._lock:
+            for key, _ in self._entries.values():
+                self._zeroise(key)
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared by every EncryptionEngine that isn't given its own cache
+DEFAULT_KEY_CACHE = KeyCache()
+
+# Written by: AI Agents
+# License: MIT
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Encryption Manifest
+Persistent SQLite index of source files and their encrypted outputs, used to
+make repeated batch runs incremental
+AI-Generated Implementation
+"""
+
+import hashlib
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    source   TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode    INTEGER NOT NULL,
+    digest   BLOB,
+    output   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_identity ON files (inode, size, mtime_ns);
+"""
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """BLAKE2b digest of a file's contents"""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class ManifestEntry:
+    """One row of the manifest"""
+
+    __slots__ = ('source', 'size', 'mtime_ns', 'inode', 'digest', 'output')
+
+    def __init__(self, source, size, mtime_ns, inode, digest, output):
+        self.source = source
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.digest = digest
+        self.output = output
+
+    def matches(self, stat):
+        """True if the file metadata is unchanged since it was recorded"""
+        return (self.size == stat.st_size and self.mtime_ns == stat.st_mtime_ns
+                and self.inode == stat.st_ino)
+
+
+class EncryptionManifest:
+    """Maps each source file's size, mtime, inode and digest to its encrypted output
+
+    Only metadata is compared on the fast path, so a nightly run over an
+    unchanged tree costs a directory walk plus one indexed lookup per file.
+    Changes are written in a single transaction committed by commit()/close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(str(path))
+        self.db.executescript(SCHEMA)
+
+    def get(self, source):
+        """Return the entry recorded for source, or None"""
+        row = self.db.execute(
+            "SELECT source, size, mtime_ns, inode, digest, output FROM files WHERE source = ?",
+            (source,)).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def find_by_identity(self, stat):
+        """Return entries whose inode, size and mtime match stat (rename candidates)"""
+        rows = self.db.execute(
+            "SELECT source, size, mtime_ns, inode, digest, output FROM files "
+            "WHERE inode = ? AND size = ? AND mtime_ns = ?",
+            (stat.st_ino, stat.st_size, stat.st_mtime_ns)).fetchall()
+        return [ManifestEntry(*row) for row in rows]
+
+    def record(self, source, stat, output, digest=None):
+        """Insert or replace the entry for source"""
+        self.db.execute(
+            "INSERT OR REPLACE INTO files (source, size, mtime_ns, inode, digest, output) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (source, stat.st_size, stat.st_mtime_ns, stat.st_ino, digest, output))
+
+    def remove(self, source):
+        """Forget source"""
+        self.db.execute("DELETE FROM files WHERE source = ?", (source,))
+
+    def entries(self):
+        """Iterate over all recorded entries"""
+        for row in self.db.execute(
+                "SELECT source, size, mtime_ns, inode, digest, output FROM files").fetchall():
+            yield ManifestEntry(*row)
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Written by: AI Agents
+# License: MIT
@@ -0,0 +1,108 @@
+"""
+Benchmark Harness Tests
+Runs the benchmark suites at tiny sizes to check the scenarios, the JSON
+report and regression detection with --compare
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from benchmark import (Scenario, compare_reports, kdf_scenarios, main, run_scenario,
+                       run_suite)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPORT_FIELDS = {'timestamp', 'python', 'cryptography', 'platform', 'cpu_count', 'repeat',
+                 'results'}
+RESULT_FIELDS = {'name', 'seconds', 'ops', 'bytes', 'ops_per_sec', 'mb_per_sec',
+                 'peak_rss_bytes', 'peak_alloc_bytes', 'allocated_blocks'}
+
+
+@pytest.fixture(scope='module')
+def report_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('bench') / 'results.json')
+    assert main(['all', '--sizes', '64,4K', '--repeat', '1', '--output', path]) == 0
+    return path
+
+
+def test_report_has_documented_fields(report_path):
+    with open(report_path) as f:
+        report = json.load(f)
+    assert set(report) == REPORT_FIELDS
+    assert report['repeat'] == 1
+    for result in report['results']:
+        assert set(result) == RESULT_FIELDS
+        assert result['seconds'] > 0 and result['ops'] > 0
+        assert result['peak_alloc_bytes'] is not None
+
+
+def test_suites_cover_memory_file_batch_and_kdf(report_path):
+    with open(report_path) as f:
+        names = {result['name'] for result in json.load(f)['results']}
+    for size in ('64', '4K'):
+        assert {f'memory/encrypt_aes256/{size}', f'memory/encrypt_into/{size}',
+                f'memory/decrypt_into/{size}', f'file/encrypt_stream/{size}',
+                f'file/decrypt_stream/{size}'} <= names
+        assert any(name.startswith('file/encrypt_container[') and name.endswith(f'/{size}')
+                   for name in names)
+    assert {'batch/encrypt_text', 'batch/encrypt_many', 'batch/run_job_loop',
+            'batch/batch_encrypt', 'kdf/cold', 'kdf/warm'} <= names
+
+
+def test_single_and_batch_process_the_same_work(report_path):
+    with open(report_path) as f:
+        results = {result['name']: result for result in json.load(f)['results']}
+    assert results['batch/encrypt_text']['ops'] == results['batch/encrypt_many']['ops']
+    assert results['batch/run_job_loop']['bytes'] == results['batch/batch_encrypt']['bytes']
+
+
+def test_warm_kdf_cache_beats_cold_derivation():
+    cold, warm = (run_scenario(scenario, repeat=1, trace_allocations=False)
+                  for scenario in kdf_scenarios("BenchmarkPassword", rounds=2))
+    assert (cold['name'], warm['name']) == ('kdf/cold', 'kdf/warm')
+    assert warm['ops_per_sec'] > 10 * cold['ops_per_sec']
+
+
+def test_run_scenario_profiles_into_directory(tmp_path):
+    scenario = Scenario('unit/noop', lambda: (1, 0))
+    result = run_scenario(scenario, repeat=2, profile_dir=str(tmp_path))
+    assert result['ops'] == 1 and result['bytes'] == 0
+    assert os.path.exists(tmp_path / 'unit_noop.prof')
+
+
+def test_compare_reports_uses_threshold():
+    baseline = {'results': [{'name': 'a', 'ops_per_sec': 100.0},
+                            {'name': 'b', 'ops_per_sec': 100.0}]}
+    report = {'results': [{'name': 'a', 'ops_per_sec': 85.0},
+                          {'name': 'b', 'ops_per_sec': 95.0},
+                          {'name': 'new', 'ops_per_sec': 1.0}]}
+    assert [name for name, _ in compare_reports(report, baseline, 0.10)] == ['a']
+    assert compare_reports(report, baseline, 0.20) == []
+
+
+def _kdf_baseline(tmp_path, scale):
+    report = run_suite(['kdf'], [], repeat=1, trace_allocations=False)
+    for result in report['results']:
+        result['ops_per_sec'] *= scale
+    path = str(tmp_path / f'baseline-{scale}.json')
+    with open(path, 'w') as f:
+        json.dump(report, f)
+    return path
+
+
+def test_compare_exits_nonzero_on_regression(tmp_path):
+    # A baseline 100x faster than anything this run can reach
+    baseline = _kdf_baseline(tmp_path, 100.0)
+    completed = subprocess.run([sys.executable, os.path.join(HERE, 'benchmark.py'), 'kdf',
+                                '--repeat', '1', '--no-tracemalloc', '--compare', baseline],
+                               cwd=HERE, capture_output=True, text=True)
+    assert completed.returncode == 1
+    assert 'REGRESSION kdf/cold' in completed.stdout
+
+
+def test_compare_passes_against_slower_baseline(tmp_path):
+    baseline = _kdf_baseline(tmp_path, 0.01)
+    assert main(['kdf', '--repeat', '1', '--no-tracemalloc', '--compare', baseline]) == 0
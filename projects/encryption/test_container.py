@@ -0,0 +1,98 @@
+"""
+Container Format Tests
+Parallel chunked AES-GCM files round-trip, and tampering with the key
+header in front of the container fails authentication
+"""
+
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from container import (ContainerHeader, HEADER_SIZE, TAG_SIZE, decrypt_container,
+                       encrypt_container)
+from encrypt_file import FileEncryptor
+from encrypted_reader import EncryptedFileReader
+from encryption import EncryptionEngine
+from kdf import KeyHeader
+
+PASSPHRASE = "ContainerPassword"
+# Key header flag bit outside the compression codec bits
+UNUSED_FLAG = 0x80
+
+
+@pytest.fixture
+def plaintext_file(tmp_path):
+    path = tmp_path / 'plain.bin'
+    path.write_bytes(os.urandom(3 * 1024 + 17))
+    return path
+
+
+def encrypted_container(tmp_path, plaintext_file, workers=1):
+    engine = EncryptionEngine('AES-256')
+    key, header = engine.derive_key(PASSPHRASE)
+    path = tmp_path / f'plain.bin.{workers}.encrypted'
+    encrypt_container(plaintext_file, path, key, workers, chunk_size=1024,
+                      prefix=header.to_bytes())
+    return path, key, len(header.to_bytes())
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_round_trip(tmp_path, plaintext_file, workers):
+    path, key, offset = encrypted_container(tmp_path, plaintext_file, workers)
+    output = tmp_path / 'out.bin'
+    decrypt_container(path, output, key, workers, offset)
+    assert output.read_bytes() == plaintext_file.read_bytes()
+    with EncryptedFileReader(path, PASSPHRASE) as reader:
+        # Within the second chunk: raw reads stop at chunk boundaries
+        reader.seek(1030)
+        assert reader.read(100) == plaintext_file.read_bytes()[1030:1130]
+
+
+def test_file_encryptor_workers_round_trip(tmp_path, plaintext_file):
+    encryptor = FileEncryptor(PASSPHRASE)
+    encrypted = tmp_path / 'plain.enc'
+    encryptor.run_job('encrypt', plaintext_file, encrypted, workers=2)
+    output = encryptor.run_job('decrypt', encrypted, tmp_path / 'plain.out', workers=2)
+    assert open(output, 'rb').read() == plaintext_file.read_bytes()
+
+
+def test_key_header_flags_are_authenticated(tmp_path, plaintext_file):
+    path, key, offset = encrypted_container(tmp_path, plaintext_file)
+    data = bytearray(path.read_bytes())
+    header, length = KeyHeader.parse(data)
+    assert length == offset
+    # flags is the byte after magic, version and KDF id
+    data[6] |= UNUSED_FLAG
+    path.write_bytes(bytes(data))
+    assert KeyHeader.parse(data)[0].flags == header.flags | UNUSED_FLAG
+
+    with pytest.raises(ValueError, match="failed authentication"):
+        decrypt_container(path, tmp_path / 'out.bin', key, 1, offset)
+    with EncryptedFileReader(path, PASSPHRASE) as reader:
+        with pytest.raises((InvalidTag, ValueError)):
+            reader.read()
+
+
+def test_version_1_containers_still_decrypt(tmp_path):
+    # Version 1 only authenticated the container header, not the key header
+    engine = EncryptionEngine('AES-256')
+    key, key_header = engine.derive_key(PASSPHRASE)
+    prefix = key_header.to_bytes()
+    plaintext = os.urandom(2500)
+    header = ContainerHeader(1024, len(plaintext), os.urandom(8), version=1,
+                             base_offset=len(prefix))
+    header_bytes = header.to_bytes()
+    chunks = []
+    for index in range(header.chunk_count):
+        start, length = header.plaintext_span(index)
+        chunks.append(engine.encrypt_aes256_gcm(plaintext[start:start + length], key,
+                                                header.nonce(index), header_bytes))
+    path = tmp_path / 'v1.encrypted'
+    path.write_bytes(prefix + header_bytes + b''.join(chunks))
+    assert len(header_bytes) == HEADER_SIZE and len(chunks[0]) == 1024 + TAG_SIZE
+
+    decrypt_container(path, tmp_path / 'v1.out', key, 1, len(prefix))
+    assert (tmp_path / 'v1.out').read_bytes() == plaintext
+    with EncryptedFileReader(path, PASSPHRASE) as reader:
+        assert reader.read() == plaintext
@@ -0,0 +1,53 @@
+"""
+Key Derivation Tests
+Key headers round-trip their KDF parameters, and costs above the limits are
+rejected from the header alone, before any derivation runs
+"""
+
+import pytest
+
+from kdf import (KeyCache, KeyHeader, PBKDF2KDF, ScryptKDF, PBKDF2_MAX_ITERATIONS,
+                 SCRYPT_MAX_MEMORY, SCRYPT_MAX_P)
+from encryption import EncryptionEngine
+
+SALT = bytes(range(16))
+
+
+@pytest.fixture
+def no_derive(monkeypatch):
+    """Fail the test if any KDF runs"""
+    def derive(self, passphrase, salt):
+        pytest.fail(f"{type(self).__name__}.derive() was called")
+    monkeypatch.setattr(ScryptKDF, 'derive', derive)
+    monkeypatch.setattr(PBKDF2KDF, 'derive', derive)
+
+
+@pytest.mark.parametrize('kdf_instance', [ScryptKDF(), ScryptKDF(2 ** 14, r=8, p=SCRYPT_MAX_P),
+                                          ScryptKDF(SCRYPT_MAX_MEMORY // (128 * 8), r=8),
+                                          PBKDF2KDF(), PBKDF2KDF(PBKDF2_MAX_ITERATIONS)])
+def test_header_round_trip_within_limits(kdf_instance):
+    header, length = KeyHeader.parse(KeyHeader(kdf_instance, SALT, flags=1).to_bytes())
+    assert header.kdf.encode_params() == kdf_instance.encode_params()
+    assert (header.salt, header.flags) == (SALT, 1)
+    assert length == len(KeyHeader(kdf_instance, SALT).to_bytes())
+
+
+@pytest.mark.parametrize('kdf_instance', [
+    ScryptKDF(2 ** 20, r=16, p=1),      # 2 GiB
+    ScryptKDF(SCRYPT_MAX_MEMORY // (128 * 8) * 2, r=8),
+    ScryptKDF(2 ** 22, r=1),
+    ScryptKDF(2 ** 14, r=8, p=SCRYPT_MAX_P + 1),
+    PBKDF2KDF(PBKDF2_MAX_ITERATIONS + 1),
+])
+def test_costly_header_rejected_before_derive(kdf_instance, no_derive):
+    data = KeyHeader(kdf_instance, SALT).to_bytes() + bytes(64)
+    with pytest.raises(ValueError, match="exceeds the allowed maximum"):
+        EncryptionEngine('AES-256', key_cache=KeyCache()).key_for("passphrase", data)
+
+
+def test_huge_log_n_rejected(no_derive):
+    data = bytearray(KeyHeader(ScryptKDF(), SALT).to_bytes())
+    # log2(n) is the first parameter byte, right after the fixed 8-byte prefix
+    data[8] = 255
+    with pytest.raises(ValueError, match="exceeds the allowed maximum"):
+        KeyHeader.parse(bytes(data))
@@ -3,12 +3,40 @@
 Encryption UI Application
 Gtkinter-based GUI for encryption/decryption
 AI-Generated Implementation with Red and Black Theme
+
+Jobs run on a background thread pool and report back through a thread-safe
+queue that the Tk main loop polls with root.after, so the window stays
+responsive while large files are processed.
 """
 
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from encrypt_file import FileEncryptor
+from concurrent.futures import ThreadPoolExecutor
+from encrypt_file import FileEncryptor, OperationCancelled
 import os
+import time
+import queue
+import threading
+
+
+class BatchState:
+    """Progress bookkeeping for one queue of files being processed"""
+
+    def __init__(self, command, paths):
+        self.command = command
+        self.paths = paths
+        self.sizes = [os.path.getsize(path) for path in paths]
+        self.total_bytes = sum(self.sizes) or 1
+        self.done_bytes = [0] * len(paths)
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.started = time.monotonic()
+
+    @property
+    def finished(self):
+        return self.completed + self.failed + self.cancelled == len(self.paths)
+
 
 class EncryptionApp:
     """Tkinter GUI for encryption/decryption"""
@@ -19,13 +47,28 @@ class EncryptionApp:
     BLACK_ACCENT = "#0f0f0f"
     TEXT_COLOR = "#ffffff"
     
+    MAX_WORKERS = 2
+    POLL_INTERVAL_MS = 100
+    MAX_EVENTS_PER_POLL = 5000
+    PROGRESS_INTERVAL = 0.1     # seconds between progress events from a worker
+    LOG_FLUSH_INTERVAL = 0.25   # seconds between writes to the status log
+    MAX_LOG_LINES = 1000
+
     def __init__(self, root):
         self.root = root
         self.root.title("AES-256 Encryption Tool")
-        self.root.geometry("600x500")
+        self.root.geometry("600x600")
         self.root.configure(bg=self.DARK_BG)
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+        self.batch = None
+        self.pending_log = []
+        self.last_log_flush = 0.0
         self.setup_styles()
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(self.POLL_INTERVAL_MS, self.poll_events)
     
     def setup_styles(self):
         """Configure application styles"""
@@ -36,6 +79,8 @@ class EncryptionApp:
                        font=('Arial', 14, 'bold'))
         style.configure('TButton', background=self.RED_ACCENT, foreground=self.TEXT_COLOR)
         style.configure('TEntry', fieldbackground=self.BLACK_ACCENT, foreground=self.TEXT_COLOR)
+        style.configure('Red.Horizontal.TProgressbar', background=self.RED_ACCENT,
+                       troughcolor=self.BLACK_ACCENT)
     
     def setup_ui(self):
         """Build user interface"""
@@ -43,14 +88,19 @@ class EncryptionApp:
         title = ttk.Label(self.root, text="AES-256 Encryption Suite", style='Title.TLabel')
         title.pack(pady=20)
         
-        # File selection frame
+        # File queue frame
         file_frame = tk.Frame(self.root, bg=self.DARK_BG)
         file_frame.pack(pady=10, padx=20, fill='x')
         
-        ttk.Label(file_frame, text="Select File:").pack(anchor='w')
-        self.file_path = tk.StringVar()
-        ttk.Entry(file_frame, textvariable=self.file_path, width=40).pack(fill='x', pady=5)
-        ttk.Button(file_frame, text="Browse...", command=self.browse_file).pack(anchor='w')
+        ttk.Label(file_frame, text="Files:").pack(anchor='w')
+        self.file_list = tk.Listbox(file_frame, height=5, bg=self.BLACK_ACCENT,
+                                    fg=self.TEXT_COLOR, selectbackground=self.RED_ACCENT)
+        self.file_list.pack(fill='x', pady=5)
+        browse_frame = tk.Frame(file_frame, bg=self.DARK_BG)
+        browse_frame.pack(anchor='w')
+        ttk.Button(browse_frame, text="Add Files...", command=self.browse_file).pack(side='left')
+        ttk.Button(browse_frame, text="Add Folder...",
+                   command=self.browse_folder).pack(side='left', padx=10)
         
         # Passphrase frame
         pass_frame = tk.Frame(self.root, bg=self.DARK_BG)
@@ -62,11 +112,22 @@ class EncryptionApp:
         
         # Action buttons frame
         button_frame = tk.Frame(self.root, bg=self.DARK_BG)
-        button_frame.pack(pady=20)
+        button_frame.pack(pady=10)
         
         ttk.Button(button_frame, text="Encrypt", command=self.encrypt_file).pack(side='left', padx=10)
         ttk.Button(button_frame, text="Decrypt", command=self.decrypt_file).pack(side='left', padx=10)
+        ttk.Button(button_frame, text="Cancel", command=self.cancel).pack(side='left', padx=10)
         ttk.Button(button_frame, text="Clear", command=self.clear_fields).pack(side='left', padx=10)
+
+        # Progress frame
+        progress_frame = tk.Frame(self.root, bg=self.DARK_BG)
+        progress_frame.pack(padx=20, fill='x')
+
+        self.progress = ttk.Progressbar(progress_frame, mode='determinate', maximum=100,
+                                        style='Red.Horizontal.TProgressbar')
+        self.progress.pack(fill='x', pady=5)
+        self.progress_label = tk.StringVar(value="Idle")
+        ttk.Label(progress_frame, textvariable=self.progress_label).pack(anchor='w')
         
         # Status frame
         status_frame = tk.Frame(self.root, bg=self.DARK_BG)
@@ -83,57 +144,180 @@ class EncryptionApp:
         info.pack(pady=10)
     
     def browse_file(self):
-        """Open file browser dialog"""
-        filename = filedialog.askopenfilename()
-        if filename:
-            self.file_path.set(filename)
+        """Open file browser dialog and queue the chosen files"""
+        for filename in filedialog.askopenfilenames():
+            self.file_list.insert(tk.END, filename)
             self.log(f"Selected: {os.path.basename(filename)}")
     
+    def browse_folder(self):
+        """Queue every file below a chosen folder"""
+        folder = filedialog.askdirectory()
+        if not folder:
+            return
+        count = 0
+        for dirpath, _, filenames in os.walk(folder):
+            for name in filenames:
+                self.file_list.insert(tk.END, os.path.join(dirpath, name))
+                count += 1
+        self.log(f"Selected {count} files from {folder}")
+
     def encrypt_file(self):
-        """Encrypt selected file"""
-        if not self.file_path.get() or not self.passphrase.get():
-            messagebox.showerror("Error", "Please select a file and enter a passphrase")
+        """Encrypt queued files"""
+        self.start_batch('encrypt')
+
+    def decrypt_file(self):
+        """Decrypt queued files"""
+        self.start_batch('decrypt')
+
+    def start_batch(self, command):
+        """Hand the queued files to the worker pool"""
+        paths = list(self.file_list.get(0, tk.END))
+        if not paths or not self.passphrase.get():
+            messagebox.showerror("Error", "Please select files and enter a passphrase")
+            return
+        if self.batch is not None and not self.batch.finished:
+            messagebox.showerror("Error", "A job is already running")
             return
         
+        # Folders queue everything; only feed each command the files it applies to
+        encrypted = [path for path in paths if path.endswith('.encrypted')]
+        paths = encrypted if command == 'decrypt' else \
+            [path for path in paths if not path.endswith('.encrypted')]
         try:
-            encryptor = FileEncryptor(self.passphrase.get())
-            if encryptor.encrypt_file(self.file_path.get()):
-                self.log("✓ Encryption completed successfully")
-                messagebox.showinfo("Success", "File encrypted successfully")
-            else:
-                self.log("✗ Encryption failed")
-        except Exception as e:
-            self.log(f"✗ Error: {str(e)}")
-            messagebox.showerror("Error", f"Encryption failed: {e}")
-    
-    def decrypt_file(self):
-        """Decrypt selected file"""
-        if not self.file_path.get() or not self.passphrase.get():
-            messagebox.showerror("Error", "Please select a file and enter a passphrase")
+            batch = BatchState(command, paths)
+        except OSError as e:
+            messagebox.showerror("Error", f"Cannot read file: {e}")
+            return
+        if not paths:
+            messagebox.showerror("Error", f"No files to {command}")
             return
         
+        self.batch = batch
+        self.cancel_event.clear()
+        self.progress['value'] = 0
+        encryptor = FileEncryptor(self.passphrase.get())
+        self.log(f"Starting to {command} {len(paths)} file(s)...")
+        for index, path in enumerate(paths):
+            self.executor.submit(self._run_job, batch, encryptor, index, path)
+
+    def _run_job(self, batch, encryptor, index, path):
+        """Process one file on a worker thread, reporting through the event queue"""
+        if self.cancel_event.is_set():
+            self.events.put((batch, 'cancelled', index, None))
+            return
+        last_report = 0.0
+
+        def progress(done, total):
+            nonlocal last_report
+            if self.cancel_event.is_set():
+                raise OperationCancelled()
+            now = time.monotonic()
+            if now - last_report >= self.PROGRESS_INTERVAL or done >= total:
+                last_report = now
+                self.events.put((batch, 'progress', index, done))
+
         try:
-            encryptor = FileEncryptor(self.passphrase.get())
-            if encryptor.decrypt_file(self.file_path.get()):
-                self.log("✓ Decryption completed successfully")
-                messagebox.showinfo("Success", "File decrypted successfully")
-            else:
-                self.log("✗ Decryption failed")
+            output = encryptor.run_job(batch.command, path, progress=progress)
+            self.events.put((batch, 'done', index, output))
+        except OperationCancelled:
+            self.events.put((batch, 'cancelled', index, None))
         except Exception as e:
-            self.log(f"✗ Error: {str(e)}")
-            messagebox.showerror("Error", f"Decryption failed: {e}")
+            self.events.put((batch, 'error', index, str(e)))
+
+    def poll_events(self):
+        """Apply worker events on the Tk thread, then reschedule"""
+        try:
+            for _ in range(self.MAX_EVENTS_PER_POLL):
+                batch, kind, index, detail = self.events.get_nowait()
+                if batch is not self.batch:
+                    continue
+                path = os.path.basename(batch.paths[index])
+                if kind == 'progress':
+                    batch.done_bytes[index] = detail
+                elif kind == 'done':
+                    batch.done_bytes[index] = batch.sizes[index]
+                    batch.completed += 1
+                    self.log(f"✓ {path}")
+                elif kind == 'error':
+                    batch.failed += 1
+                    self.log(f"✗ {path}: {detail}")
+                else:
+                    batch.cancelled += 1
+        except queue.Empty:
+            pass
+
+        if self.batch is not None:
+            self.update_progress(self.batch)
+        self.flush_log()
+        self.root.after(self.POLL_INTERVAL_MS, self.poll_events)
+
+    def update_progress(self, batch):
+        """Refresh the progress bar, throughput and ETA"""
+        done = sum(batch.done_bytes)
+        elapsed = max(time.monotonic() - batch.started, 1e-6)
+        rate = done / elapsed
+        self.progress['value'] = 100.0 * done / batch.total_bytes
+        if batch.finished:
+            if batch.cancelled:
+                summary = f"Cancelled - {batch.completed} done, {batch.failed} failed"
+            else:
+                summary = f"Finished - {batch.completed} done, {batch.failed} failed"
+            self.progress_label.set(f"{summary} ({rate / 1e6:.1f} MB/s)")
+            self.log(summary)
+            self.batch = None
+            self.flush_log(force=True)
+            if not batch.cancelled:
+                messagebox.showinfo("Done", f"{batch.command.capitalize()}ed "
+                                    f"{batch.completed} file(s), {batch.failed} failed")
+            return
+        eta = (batch.total_bytes - done) / rate if rate else float('inf')
+        eta_text = f"{eta:.0f}s" if eta != float('inf') else "--"
+        self.progress_label.set(
+            f"{batch.completed + batch.failed}/{len(batch.paths)} files | "
+            f"{rate / 1e6:.1f} MB/s | ETA {eta_text}")
+
+    def cancel(self):
+        """Abort the running batch, including the file currently in progress"""
+        if self.batch is not None:
+            self.cancel_event.set()
+            self.log("Cancelling...")
     
     def clear_fields(self):
         """Clear all fields"""
-        self.file_path.set("")
+        self.file_list.delete(0, tk.END)
         self.passphrase.set("")
+        self.pending_log.clear()
         self.status_text.delete(1.0, tk.END)
         self.log("Fields cleared")
     
     def log(self, message):
-        """Add message to status log"""
-        self.status_text.insert(tk.END, f"{message}\n")
+        """Queue a message for the status log"""
+        self.pending_log.append(message)
+
+    def flush_log(self, force=False):
+        """Write queued log lines in one go, at most every LOG_FLUSH_INTERVAL"""
+        now = time.monotonic()
+        if not self.pending_log or (not force and now - self.last_log_flush < self.LOG_FLUSH_INTERVAL):
+            return
+        lines = self.pending_log
+        self.pending_log = []
+        if len(lines) > self.MAX_LOG_LINES:
+            skipped = len(lines) - self.MAX_LOG_LINES
+            lines = [f"... {skipped} earlier messages skipped"] + lines[-self.MAX_LOG_LINES:]
+        self.status_text.insert(tk.END, "\n".join(lines) + "\n")
+
+        # Keep the widget bounded so huge batches don't slow it down
+        line_count = int(self.status_text.index('end-1c').split('.')[0])
+        if line_count > self.MAX_LOG_LINES:
+            self.status_text.delete(1.0, f"{line_count - self.MAX_LOG_LINES}.0")
         self.status_text.see(tk.END)
+        self.last_log_flush = now
+
+    def on_close(self):
+        """Stop workers and close the window"""
+        self.cancel_event.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Network Monitor Benchmarks
+Throughput and memory measurements for the analysis data structures
+
+Usage:
+    python benchmark.py flows --count 1000000
+    python benchmark.py packets --count 1000000
+    python benchmark.py dashboard --count 200000
+    python benchmark.py metrics --count 200000
+    python benchmark.py all --output results.json
+"""
+
+import gc
+import io
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import platform
+import tempfile
+import threading
+import tracemalloc
+import urllib.request
+from datetime import datetime, timezone
+from flow_table import FlowTable
+from packet_ring import PacketRing
+from dashboard import Dashboard
+from metrics import MetricsServer, RotatingExporter
+from network_monitor import NetworkMonitor
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds else float('inf')
+
+
+def _flow_fields(index):
+    """Distinct (protocol, src, dst, sport, dport) for a flow number, built the
+    way parse_frame builds them (fresh strings per packet)"""
+    return ('TCP', f'10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}',
+            f'192.168.{index >> 24 & 255}.1', 1024 + index % 60000, 443)
+
+
+def bench_flows(count=200000, packets_per_flow=4, idle_timeout=15.0):
+    """Flow table inserts/s, updates/s, expiries/s and memory per live flow
+
+    count flows start in the same second, then every flow gets
+    packets_per_flow - 1 more packets, then all of them idle out.
+    """
+    fields = [_flow_fields(index) for index in range(count)]
+    results = {'flows': count}
+
+    table = FlowTable(idle_timeout=idle_timeout)
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for protocol, src, dst, sport, dport in fields:
+            table.update(protocol, src, dst, sport, dport, 60, 0x02, 1.0)
+        results['inserts_per_sec'] = _rate(count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(packets_per_flow - 1):
+            for protocol, src, dst, sport, dport in fields:
+                table.update(protocol, src, dst, sport, dport, 1500, 0x10, 1.5)
+        results['updates_per_sec'] = _rate(count * (packets_per_flow - 1),
+                                           time.perf_counter() - start)
+
+        expired = []
+        table.subscribe(expired.append)
+        start = time.perf_counter()
+        table.advance(2.0 + idle_timeout)
+        results['expiries_per_sec'] = _rate(len(expired), time.perf_counter() - start)
+    finally:
+        gc.enable()
+    del fields, expired, table
+
+    # Memory of the table itself plus the key strings each flow keeps alive
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    table = FlowTable(idle_timeout=idle_timeout)
+    for index in range(count):
+        table.update(*_flow_fields(index), 60, 0x02, 1.0)
+    results['bytes_per_flow'] = (tracemalloc.get_traced_memory()[0] - baseline) / count
+    tracemalloc.stop()
+    return results
+
+
+def bench_packets(count=1000000, capacity=None):
+    """Recent-packet ring appends/s, memory per packet and cost of reading it back"""
+    capacity = capacity or count
+    fields = [_flow_fields(index) for index in range(min(count, 100000))]
+    results = {'packets': count, 'capacity': capacity}
+
+    ring = PacketRing(capacity)
+    start = time.perf_counter()
+    for index in range(count):
+        protocol, src, dst, sport, dport = fields[index % len(fields)]
+        ring.append(protocol, src, dst, sport, dport, 60, 1.0 + index * 1e-6)
+    results['appends_per_sec'] = _rate(count, time.perf_counter() - start)
+    results['bytes_per_packet'] = ring.nbytes / capacity
+
+    start = time.perf_counter()
+    read = sum(1 for _ in ring)
+    results['reads_per_sec'] = _rate(read, time.perf_counter() - start)
+    return results
+
+
+class _Terminal(io.StringIO):
+    """In-memory stand-in for a terminal, so renders take the ANSI diff path"""
+
+    def isatty(self):
+        return True
+
+
+def bench_dashboard(count=200000, frames=50, packets_per_frame=500):
+    """Cost of one dashboard refresh on a monitor that has seen count packets
+
+    Reports milliseconds per snapshot publish, per format_stats() and per
+    render, and bytes written per frame by the incremental dashboard versus
+    redrawing the whole screen.
+    """
+    monitor = NetworkMonitor(snapshot_interval=None)
+    monitor.start_time = time.time()
+    timestamp = time.time() - count / 1000
+
+    def feed(packets, offset):
+        for index in range(offset, offset + packets):
+            protocol, src, dst, sport, dport = _flow_fields(index % 5000)
+            monitor.record(protocol, src, dst, sport, dport, 100 + index % 1400, 0x10,
+                           timestamp + index / 1000)
+
+    feed(count, 0)
+    publish = format_time = 0.0
+    incremental, full = Dashboard(_Terminal()), Dashboard(_Terminal())
+    render = {'incremental': [0.0, 0], 'full': [0.0, 0]}
+    for frame in range(frames):
+        feed(packets_per_frame, count + frame * packets_per_frame)
+        start = time.perf_counter()
+        monitor.publish()
+        publish += time.perf_counter() - start
+        start = time.perf_counter()
+        lines = monitor.format_stats(monitor.published)
+        format_time += time.perf_counter() - start
+        full.previous = None
+        for name, dashboard in (('incremental', incremental), ('full', full)):
+            dashboard.render(lines)
+            render[name][0] += dashboard.render_seconds
+            render[name][1] += dashboard.bytes_written
+
+    results = {'packets': count, 'frames': frames,
+               'publish_ms': publish / frames * 1000,
+               'format_ms': format_time / frames * 1000}
+    for name, (seconds, written) in render.items():
+        results[f'{name}_render_ms'] = seconds / frames * 1000
+        results[f'{name}_bytes_per_frame'] = written / frames
+    return results
+
+
+def _write_pcap(path, count):
+    """Classic pcap file of count Ethernet/IPv4/TCP frames spread over 5000 flows"""
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        start = int(time.time()) - count // 1000
+        for index in range(count):
+            protocol, src, dst, sport, dport = _flow_fields(index % 5000)
+            frame = (bytes(12) + b'\x08\x00'
+                     + struct.pack('!BBHHHBBH4s4s', 0x45, 0, 40, 0, 0, 64, 6, 0,
+                                   socket.inet_aton(src), socket.inet_aton(dst))
+                     + struct.pack('!HHIIBBHHH', sport, dport, 0, 0, 0x50, 0x10, 65535, 0, 0))
+            microseconds = index * 1000
+            f.write(struct.pack('<IIII', start + microseconds // 1000000, microseconds % 1000000,
+                                len(frame), len(frame)))
+            f.write(frame)
+
+
+def _replay(monitor, path):
+    """(packets per wall-clock second, packets per CPU second) replaying path"""
+    cpu = time.process_time()
+    processed, seconds = monitor.replay(path)
+    return _rate(processed, seconds), _rate(processed, time.process_time() - cpu)
+
+
+def bench_metrics(count=200000, runs=5, scrape_interval=0.1):
+    """Replay throughput with the monitor's instrumentation off versus on
+
+    Off, no packet is timed. On, one packet in LATENCY_SAMPLE_EVERY is
+    timed, the metrics endpoint is served with a thread scraping it every
+    scrape_interval (standing in for Prometheus) and a JSON lines row is
+    exported as often. Each setting is run `runs` times, alternating, and
+    the best of each is compared. The overhead is computed from packets per
+    CPU second of the whole process, scraper included, which is far less
+    noisy than wall-clock rates on a shared machine.
+    """
+    best = {'off': (0.0, 0.0), 'on': (0.0, 0.0)}
+    scrapes = rows = 0
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'replay.pcap')
+        _write_pcap(path, count)
+        for _ in range(runs):
+            wall, cpu = _replay(NetworkMonitor(latency_sample_every=None), path)
+            best['off'] = (max(best['off'][0], wall), max(best['off'][1], cpu))
+
+            monitor = NetworkMonitor()
+            exporter = RotatingExporter(os.path.join(directory, 'export.jsonl'), scrape_interval)
+            monitor.exporters.append(exporter)
+            server = MetricsServer(monitor.render_metrics, 0).start()
+            url = 'http://{}:{}/metrics'.format(*server.address[:2])
+            stop = threading.Event()
+
+            def scrape():
+                while not stop.wait(scrape_interval):
+                    with urllib.request.urlopen(url) as response:
+                        response.read()
+
+            scraper = threading.Thread(target=scrape)
+            scraper.start()
+            try:
+                wall, cpu = _replay(monitor, path)
+            finally:
+                stop.set()
+                scraper.join()
+                server.close()
+                exporter.close()
+            best['on'] = (max(best['on'][0], wall), max(best['on'][1], cpu))
+            scrapes += server.scrapes
+            rows += exporter.rows
+
+    return {'packets': count, 'runs': runs,
+            'off_packets_per_sec': best['off'][0], 'on_packets_per_sec': best['on'][0],
+            'off_packets_per_cpu_sec': best['off'][1], 'on_packets_per_cpu_sec': best['on'][1],
+            'overhead_percent': (1 - best['on'][1] / best['off'][1]) * 100,
+            'scrapes': scrapes, 'rows_exported': rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Network monitor benchmarks")
+    parser.add_argument('suite', nargs='?', default='all', choices=['all', 'flows', 'packets', 'dashboard',
+                                                                   'metrics'])
+    parser.add_argument('--count', type=int, default=None,
+                        help="flows (flows suite) or packets (other suites)")
+    parser.add_argument('--packets-per-flow', type=int, default=4)
+    parser.add_argument('--output', help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.suite in ('all', 'flows'):
+        flows = results['flows'] = bench_flows(args.count or 200000, args.packets_per_flow)
+        print(f"Flow table: {flows['flows']:,} flows x {args.packets_per_flow} packets")
+        for name in ('inserts_per_sec', 'updates_per_sec', 'expiries_per_sec'):
+            print(f"  {name:18s} {flows[name]:12,.0f}")
+        print(f"  {'bytes_per_flow':18s} {flows['bytes_per_flow']:12,.0f}")
+    if args.suite in ('all', 'packets'):
+        packets = results['packets'] = bench_packets(args.count or 1000000)
+        print(f"Packet ring: {packets['packets']:,} packets")
+        for name in ('appends_per_sec', 'reads_per_sec'):
+            print(f"  {name:18s} {packets[name]:12,.0f}")
+        print(f"  {'bytes_per_packet':18s} {packets['bytes_per_packet']:12,.0f}")
+    if args.suite in ('all', 'dashboard'):
+        dashboard = results['dashboard'] = bench_dashboard(args.count or 200000)
+        print(f"Dashboard: {dashboard['packets']:,} packets seen, {dashboard['frames']} frames")
+        for name, value in dashboard.items():
+            if name.endswith('_ms'):
+                print(f"  {name:30s} {value:10.3f}")
+            elif name.endswith('_per_frame'):
+                print(f"  {name:30s} {value:10,.0f}")
+    if args.suite in ('all', 'metrics'):
+        metrics = results['metrics'] = bench_metrics(args.count or 200000)
+        print(f"Instrumentation: {metrics['packets']:,} packets replayed, best of {metrics['runs']}")
+        for name in ('off_packets_per_sec', 'on_packets_per_sec',
+                     'off_packets_per_cpu_sec', 'on_packets_per_cpu_sec'):
+            print(f"  {name:30s} {metrics[name]:10,.0f}")
+        print(f"  {'overhead_percent':30s} {metrics['overhead_percent']:10.2f}")
+        print(f"  {'scrapes':30s} {metrics['scrapes']:10,d}")
+
+    if args.output:
+        report = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
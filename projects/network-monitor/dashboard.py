@@ -0,0 +1,76 @@
+"""
+Terminal Dashboard
+Redraws only the lines that changed since the previous frame using ANSI
+cursor addressing, and measures what each refresh costs
+"""
+
+import os
+import sys
+import time
+import shutil
+
+CLEAR_SCREEN = '\x1b[2J'
+CLEAR_TO_END_OF_LINE = '\x1b[K'
+CLEAR_TO_END_OF_SCREEN = '\x1b[J'
+
+
+def move_to(row):
+    """Escape sequence moving the cursor to the start of a 0-based row"""
+    return f'\x1b[{row + 1};1H'
+
+
+class Dashboard:
+    """Full-screen text frame that is updated in place
+
+    render() compares the new frame with the previous one line by line and
+    writes only the changed lines, in a single write call. When the output
+    isn't a terminal, frames are printed in full one after another instead.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.interactive = self.stream.isatty()
+        self.previous = None
+        self.width = None
+        self.frames = 0
+        # Cost of the last refresh
+        self.render_seconds = 0.0
+        self.lines_redrawn = 0
+        self.bytes_written = 0
+        if self.interactive and os.name == 'nt':
+            # Makes the Windows console interpret ANSI escape sequences
+            os.system('')
+
+    def render(self, lines):
+        start = time.perf_counter()
+        if not self.interactive:
+            output = '\n'.join(lines) + '\n\n'
+            self.lines_redrawn = len(lines)
+        else:
+            width = shutil.get_terminal_size().columns
+            lines = [line[:width] for line in lines]
+            if self.previous is None or width != self.width:
+                # First frame or the terminal was resized: redraw everything
+                self.previous = []
+                self.width = width
+                parts = [CLEAR_SCREEN]
+            else:
+                parts = []
+            previous = self.previous
+            changed = 0
+            for row, line in enumerate(lines):
+                if row >= len(previous) or previous[row] != line:
+                    parts.append(move_to(row) + line + CLEAR_TO_END_OF_LINE)
+                    changed += 1
+            if len(lines) < len(previous):
+                parts.append(move_to(len(lines)) + CLEAR_TO_END_OF_SCREEN)
+            # Leave the cursor below the frame for anything printed afterwards
+            parts.append(move_to(len(lines)))
+            output = ''.join(parts)
+            self.previous = lines
+            self.lines_redrawn = changed
+        self.stream.write(output)
+        self.stream.flush()
+        self.frames += 1
+        self.bytes_written = len(output)
+        self.render_seconds = time.perf_counter() - start
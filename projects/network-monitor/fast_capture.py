@@ -0,0 +1,365 @@
+"""
+Fast Packet Capture Path
+Linux AF_PACKET capture (PACKET_MMAP ring with a recv() fallback) and a
+header parser that works directly on memoryviews with precompiled structs
+"""
+
+import mmap
+import select
+import socket
+import struct
+import ctypes
+import subprocess
+import time
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+ETH_P_IPV6 = 0x86DD
+VLAN_TYPES = (0x8100, 0x88A8)
+
+# pcap link-layer header types understood by parse_frame
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_ICMPV6 = 58
+# IPv6 extension headers that are skipped to find the transport header
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT_HEADER = 44
+
+ETH_TYPE = struct.Struct('!H')
+IPV4_HEADER = struct.Struct('!B5xHxB2x4s4s')
+IPV6_HEADER = struct.Struct('!4xHBB16s16s')
+PORTS = struct.Struct('!HH')
+
+# Linux packet socket options (linux/if_packet.h)
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+SO_ATTACH_FILTER = 26
+
+TPACKET_REQ3 = struct.Struct('=7I')
+BLOCK_HEADER = struct.Struct('=III')  # block_status, num_pkts, offset_to_first_pkt
+BLOCK_HEADER_OFFSET = 8
+TPACKET3_HEADER = struct.Struct('=IIIIIIH')  # next_offset, sec, nsec, snaplen, len, status, mac
+BPF_INSTRUCTION = struct.Struct('=HBBI')
+# tp_packets, tp_drops (tpacket_stats_v3 adds tp_freeze_q_cnt)
+PACKET_STATS = struct.Struct('=II')
+
+# Classic BPF opcodes (linux/filter.h) used to build sampling programs
+BPF_LD_W_ABS = 0x20
+BPF_LDX_IMM = 0x01
+BPF_TAX = 0x07
+BPF_ADD_X = 0x0C
+BPF_MUL_K = 0x24
+BPF_RSH_K = 0x74
+BPF_MOD_K = 0x94
+BPF_JA = 0x05
+BPF_JEQ_K = 0x15
+BPF_RET_K = 0x06
+# Linux extensions: loads from these offsets read skb metadata or the network header
+SKF_AD_PROTOCOL = 0xFFFFF000  # SKF_AD_OFF + 0: the frame's ethertype
+SKF_AD_RANDOM = 0xFFFFF038  # SKF_AD_OFF + 56: a random 32-bit number
+SKF_NET_OFF = 0xFFF00000
+ACCEPT_ALL = [(BPF_RET_K, 0, 0, 0x40000)]
+SAMPLING_MODES = ('count', 'flow')
+# Different from the sharding hash, so sampled flows still spread over workers
+SAMPLING_HASH_MULTIPLIER = 0x85EBCA6B
+
+DEFAULT_BLOCK_SIZE = 1 << 22
+DEFAULT_BLOCK_COUNT = 64
+DEFAULT_FRAME_SIZE = 1 << 11
+BLOCK_TIMEOUT_MS = 50
+POLL_TIMEOUT_MS = 100
+MAX_FRAME_SIZE = 65535
+RECV_BUFFER_SIZE = 1 << 24
+
+
+def parse_frame(frame, length=None, linktype=LINKTYPE_ETHERNET):
+    """Parse a captured frame without building per-layer objects
+
+    Returns (protocol, src, dst, sport, dport, length, tcp_flags); addresses
+    are None for non-IP frames and ports are None for non-TCP/UDP packets.
+    """
+    if length is None:
+        length = len(frame)
+    try:
+        if linktype == LINKTYPE_ETHERNET:
+            ethertype, = ETH_TYPE.unpack_from(frame, 12)
+            offset = 14
+        elif linktype == LINKTYPE_LINUX_SLL:
+            ethertype, = ETH_TYPE.unpack_from(frame, 14)
+            offset = 16
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            ethertype = ETH_P_IPV6 if frame[0] >> 4 == 6 else ETH_P_IP
+            offset = 0
+        else:
+            return 'Unknown', None, None, None, None, length, 0
+        while ethertype in VLAN_TYPES:
+            ethertype, = ETH_TYPE.unpack_from(frame, offset + 2)
+            offset += 4
+
+        if ethertype == ETH_P_IP:
+            version_ihl, fragment, proto, src, dst = IPV4_HEADER.unpack_from(frame, offset)
+            src = socket.inet_ntoa(src)
+            dst = socket.inet_ntoa(dst)
+            # Only the first fragment carries the transport header
+            if fragment & 0x1FFF:
+                return 'Unknown', src, dst, None, None, length, 0
+            offset += (version_ihl & 0x0F) * 4
+        elif ethertype == ETH_P_IPV6:
+            _, proto, _, src, dst = IPV6_HEADER.unpack_from(frame, offset)
+            src = socket.inet_ntop(socket.AF_INET6, src)
+            dst = socket.inet_ntop(socket.AF_INET6, dst)
+            offset += 40
+            while proto in IPV6_EXTENSION_HEADERS or proto == IPV6_FRAGMENT_HEADER:
+                next_proto = frame[offset]
+                offset += 8 if proto == IPV6_FRAGMENT_HEADER else (frame[offset + 1] + 1) * 8
+                proto = next_proto
+        elif ethertype == ETH_P_ARP:
+            return 'ARP', None, None, None, None, length, 0
+        else:
+            return 'Unknown', None, None, None, None, length, 0
+
+        if proto == IPPROTO_TCP:
+            sport, dport = PORTS.unpack_from(frame, offset)
+            return 'TCP', src, dst, sport, dport, length, frame[offset + 13]
+        if proto == IPPROTO_UDP:
+            sport, dport = PORTS.unpack_from(frame, offset)
+            return 'UDP', src, dst, sport, dport, length, 0
+        if proto == IPPROTO_ICMP or proto == IPPROTO_ICMPV6:
+            return 'ICMP', src, dst, None, None, length, 0
+        return 'Unknown', src, dst, None, None, length, 0
+    except (struct.error, IndexError):
+        # Truncated header - count the frame but don't guess at its contents
+        return 'Unknown', None, None, None, None, length, 0
+
+
+def compile_filter(filter_str, interface=None):
+    """Compile a tcpdump-style filter into BPF instructions using tcpdump -ddd"""
+    command = ['tcpdump', '-ddd']
+    if interface:
+        command += ['-i', interface]
+    command.append(filter_str)
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    except FileNotFoundError:
+        raise RuntimeError("tcpdump is required to compile BPF filters for the fast path") from None
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Invalid filter {filter_str!r}: {e.stderr.strip()}") from None
+    lines = output.split('\n')
+    return [tuple(int(value) for value in line.split()) for line in lines[1:int(lines[0]) + 1]]
+
+
+def attach_filter(sock, instructions):
+    """Attach classic BPF instructions [(code, jt, jf, k), ...] to a socket"""
+    program = b''.join(BPF_INSTRUCTION.pack(*instruction) for instruction in instructions)
+    buffer = ctypes.create_string_buffer(program)
+    fprog = struct.pack('HL', len(instructions), ctypes.addressof(buffer))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+def sampling_program(instructions, rate, mode='count'):
+    """instructions preceded by a prologue that passes about 1 in rate packets
+
+    'count' picks packets at random. 'flow' hashes the IP address pair, so
+    either every packet between two hosts is passed or none is; other
+    frames are picked at random. rate 1 returns instructions unchanged.
+    """
+    if rate <= 1:
+        return list(instructions)
+    if mode not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode: {mode}")
+    keep = [(BPF_MOD_K, 0, 0, rate), (BPF_JEQ_K, 1, 0, 0), (BPF_RET_K, 0, 0, 0)]
+    if mode == 'count':
+        return [(BPF_LD_W_ABS, 0, 0, SKF_AD_RANDOM)] + keep + list(instructions)
+    prologue = [
+        (BPF_LD_W_ABS, 0, 0, SKF_AD_PROTOCOL),
+        (BPF_JEQ_K, 1, 0, ETH_P_IP),
+        (BPF_JEQ_K, 4, 8, ETH_P_IPV6),
+        # IPv4: source + destination address, the same either way round
+        (BPF_LD_W_ABS, 0, 0, SKF_NET_OFF + 12),
+        (BPF_TAX, 0, 0, 0),
+        (BPF_LD_W_ABS, 0, 0, SKF_NET_OFF + 16),
+        (BPF_JA, 0, 0, 6),
+        # IPv6: the last 32 bits of both addresses
+        (BPF_LD_W_ABS, 0, 0, SKF_NET_OFF + 20),
+        (BPF_TAX, 0, 0, 0),
+        (BPF_LD_W_ABS, 0, 0, SKF_NET_OFF + 36),
+        (BPF_JA, 0, 0, 2),
+        # Not IP
+        (BPF_LD_W_ABS, 0, 0, SKF_AD_RANDOM),
+        (BPF_LDX_IMM, 0, 0, 0),
+        (BPF_ADD_X, 0, 0, 0),
+        (BPF_MUL_K, 0, 0, SAMPLING_HASH_MULTIPLIER),
+        (BPF_RSH_K, 0, 0, 16),
+    ]
+    return prologue + keep + list(instructions)
+
+
+class SocketFilter:
+    """Kernel-side controls of a packet socket: its BPF filter, optionally
+    sampling, and the kernel's packet and drop counters"""
+
+    def __init__(self, sock, filter_str=None, interface=None):
+        self.sock = sock
+        self.filter_str = filter_str
+        self.interface = interface
+        self.sampling_rate = 1
+        self._instructions = None
+        # Kernel counters, accumulated since reading them resets them
+        self.kernel_packets = 0
+        self.kernel_drops = 0
+
+    def attach(self, rate=1, mode='count'):
+        """(Re)attach the filter; rate > 1 also samples 1 in rate packets"""
+        if self._instructions is None:
+            self._instructions = (compile_filter(self.filter_str, self.interface)
+                                  if self.filter_str else ACCEPT_ALL)
+        if self.filter_str or rate > 1 or self.sampling_rate > 1:
+            # Attaching replaces the previous program atomically
+            attach_filter(self.sock, sampling_program(self._instructions, rate, mode))
+        self.sampling_rate = rate
+
+    def statistics(self):
+        """(packets seen by the socket, packets the kernel dropped) so far
+
+        Dropped packets are included in the first figure. Call from one
+        thread only - every read resets the kernel's counters.
+        """
+        if self.sock.fileno() != -1:
+            raw = self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12)
+            packets, drops = PACKET_STATS.unpack_from(raw)
+            self.kernel_packets += packets
+            self.kernel_drops += drops
+        return self.kernel_packets, self.kernel_drops
+
+
+class AFPacketCapture:
+    """Raw AF_PACKET capture feeding (frame, wire_length, timestamp) to a handler
+
+    Uses a TPACKET_V3 PACKET_MMAP receive ring so frames are read straight
+    from memory shared with the kernel, a block at a time. Falls back to
+    recv_into() on a reusable buffer when the ring can't be set up. Frames
+    passed to the handler are only valid until it returns.
+    """
+
+    def __init__(self, interface=None, filter_str=None, use_ring=True,
+                 block_size=DEFAULT_BLOCK_SIZE, block_count=DEFAULT_BLOCK_COUNT):
+        self.interface = interface
+        self.filter_str = filter_str
+        self.use_ring = use_ring
+        self.block_size = block_size
+        self.block_count = block_count
+        self.sock = None
+        self.ring = None
+        self.filter = None
+
+    def open(self):
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        self.filter = SocketFilter(self.sock, self.filter_str, self.interface)
+        if self.filter_str:
+            self.filter.attach()
+        if self.use_ring:
+            try:
+                self._setup_ring()
+            except OSError:
+                self.ring = None
+        if self.ring is None:
+            # Without the ring the socket buffer is all that absorbs bursts
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+        if self.interface:
+            self.sock.bind((self.interface, 0))
+        return self
+
+    def _setup_ring(self):
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        frame_count = self.block_size // DEFAULT_FRAME_SIZE * self.block_count
+        request = TPACKET_REQ3.pack(self.block_size, self.block_count, DEFAULT_FRAME_SIZE,
+                                    frame_count, BLOCK_TIMEOUT_MS, 0, 0)
+        self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, request)
+        self.ring = mmap.mmap(self.sock.fileno(), self.block_size * self.block_count,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    @property
+    def mode(self):
+        return 'mmap' if self.ring is not None else 'recv'
+
+    def statistics(self):
+        """(packets seen by the socket, packets the kernel dropped) since open()"""
+        return self.filter.statistics() if self.filter is not None else (0, 0)
+
+    def set_sampling(self, rate, mode='count'):
+        """Have the kernel pass only about 1 in rate packets (all for rate 1)"""
+        self.filter.attach(rate, mode)
+
+    def capture(self, handler, running):
+        """Deliver frames to handler until running() returns False"""
+        if self.sock is None:
+            self.open()
+        if self.ring is not None:
+            self._capture_ring(handler, running)
+        else:
+            self._capture_recv(handler, running)
+
+    def _capture_ring(self, handler, running):
+        ring = self.ring
+        view = memoryview(ring)
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN | select.POLLERR)
+        block = 0
+        try:
+            while running():
+                base = block * self.block_size
+                status, packet_count, offset = BLOCK_HEADER.unpack_from(
+                    ring, base + BLOCK_HEADER_OFFSET)
+                if not status & TP_STATUS_USER:
+                    poller.poll(POLL_TIMEOUT_MS)
+                    continue
+                position = base + offset
+                for _ in range(packet_count):
+                    next_offset, sec, nsec, snaplen, length, _, mac = \
+                        TPACKET3_HEADER.unpack_from(ring, position)
+                    start = position + mac
+                    handler(view[start:start + snaplen], length, sec + nsec * 1e-9)
+                    position += next_offset
+                # Hand the block back to the kernel
+                struct.pack_into('=I', ring, base + BLOCK_HEADER_OFFSET, TP_STATUS_KERNEL)
+                block = (block + 1) % self.block_count
+        finally:
+            view.release()
+
+    def _capture_recv(self, handler, running):
+        buffer = bytearray(MAX_FRAME_SIZE)
+        view = memoryview(buffer)
+        self.sock.settimeout(POLL_TIMEOUT_MS / 1000)
+        while running():
+            try:
+                length = self.sock.recv_into(buffer, 0, socket.MSG_TRUNC)
+            except socket.timeout:
+                continue
+            handler(view[:min(length, MAX_FRAME_SIZE)], length, time.time())
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,156 @@
+"""
+Flow Table
+Per-5-tuple packet/byte accounting with timer-wheel idle and active timeouts
+that exports finished flows as NetFlow-like records
+"""
+
+import heapq
+from collections import namedtuple
+from operator import attrgetter
+
+DEFAULT_IDLE_TIMEOUT = 15.0
+DEFAULT_ACTIVE_TIMEOUT = 1800.0
+# Seconds per timer-wheel slot, and slots per revolution
+DEFAULT_TICK = 1.0
+DEFAULT_WHEEL_SLOTS = 64
+
+TCP_FIN = 0x01
+TCP_RST = 0x04
+
+# Expiry reasons
+IDLE = 'idle'
+ACTIVE = 'active'
+END = 'end'
+FLUSH = 'flush'
+
+FlowExport = namedtuple('FlowExport', ['protocol', 'src', 'dst', 'sport', 'dport', 'packets',
+                                       'bytes', 'first_seen', 'last_seen', 'tcp_flags', 'reason'])
+
+
+class Flow:
+    """Counters for one unidirectional 5-tuple"""
+
+    __slots__ = ('key', 'packets', 'bytes', 'first_seen', 'last_seen', 'tcp_flags')
+
+    def __init__(self, key, timestamp):
+        self.key = key
+        self.packets = 0
+        self.bytes = 0
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.tcp_flags = 0
+
+    def export(self, reason=None):
+        return FlowExport(*self.key, self.packets, self.bytes, self.first_seen, self.last_seen,
+                          self.tcp_flags, reason)
+
+
+class FlowTable:
+    """Flows keyed on (protocol, src, dst, sport, dport), one per direction
+
+    A flow ends when it has been idle for idle_timeout, has lasted
+    active_timeout (long flows are then reported in pieces, as NetFlow
+    does), or on the first tick after a TCP FIN or RST. Each flow sits in
+    one timer-wheel slot; packets only update its counters, and the deadline
+    is rechecked when the slot comes round - flows that are still live are
+    moved to the slot of their new deadline. Expiry therefore costs O(1) per
+    flow instead of a scan of the whole table.
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, active_timeout=DEFAULT_ACTIVE_TIMEOUT,
+                 tick=DEFAULT_TICK, wheel_slots=DEFAULT_WHEEL_SLOTS):
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.tick = tick
+        self.flows = {}
+        self.expired = 0
+        self._listeners = []
+        self._wheel = [[] for _ in range(wheel_slots)]
+        self._current = None
+
+    def subscribe(self, callback):
+        """Call callback(FlowExport) for every flow that ends"""
+        self._listeners.append(callback)
+
+    def update(self, protocol, src, dst, sport, dport, length, tcp_flags, timestamp):
+        """Account one packet, expiring flows whose deadlines have passed"""
+        tick = int(timestamp // self.tick)
+        if tick != self._current:
+            self.advance(timestamp)
+        key = (protocol, src, dst, sport, dport)
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = self.flows[key] = Flow(key, timestamp)
+            self._schedule(flow, timestamp + min(self.idle_timeout, self.active_timeout))
+        if tcp_flags & (TCP_FIN | TCP_RST) and not flow.tcp_flags & (TCP_FIN | TCP_RST):
+            # Closing: also check it on the next tick, the later entry is skipped
+            self._schedule(flow, timestamp)
+        flow.packets += 1
+        flow.bytes += length
+        flow.tcp_flags |= tcp_flags
+        if timestamp > flow.last_seen:
+            flow.last_seen = timestamp
+
+    def _deadline(self, flow):
+        if flow.tcp_flags & (TCP_FIN | TCP_RST):
+            return flow.last_seen, END
+        idle = flow.last_seen + self.idle_timeout
+        active = flow.first_seen + self.active_timeout
+        return (idle, IDLE) if idle <= active else (active, ACTIVE)
+
+    def _schedule(self, flow, deadline):
+        # First tick starting at or after the deadline, and never behind the
+        # slot being processed, or the flow would wait a whole revolution
+        tick = max(int(deadline // self.tick) + 1, self._current + 1)
+        self._wheel[tick % len(self._wheel)].append(flow)
+
+    def advance(self, now):
+        """Run the wheel up to now, exporting every flow whose deadline has passed"""
+        tick = int(now // self.tick)
+        if self._current is None:
+            self._current = tick
+        if tick <= self._current:
+            return
+        # After a gap longer than a revolution every slot is due exactly once
+        self._current = max(self._current, tick - len(self._wheel))
+        flows = self.flows
+        while self._current < tick:
+            self._current += 1
+            index = self._current % len(self._wheel)
+            slot = self._wheel[index]
+            if not slot:
+                continue
+            self._wheel[index] = []
+            for flow in slot:
+                if flows.get(flow.key) is not flow:
+                    # Already expired through another entry
+                    continue
+                deadline, reason = self._deadline(flow)
+                if deadline <= now:
+                    del flows[flow.key]
+                    self._export(flow.export(reason))
+                else:
+                    self._schedule(flow, deadline)
+
+    def flush(self):
+        """Export and forget every flow, e.g. when capture stops"""
+        flows, self.flows = self.flows, {}
+        self._wheel = [[] for _ in self._wheel]
+        for flow in flows.values():
+            self._export(flow.export(FLUSH))
+
+    def export(self, record):
+        """Pass an already finished flow (e.g. from a worker process) to subscribers"""
+        self._export(record)
+
+    def _export(self, record):
+        self.expired += 1
+        for callback in self._listeners:
+            callback(record)
+
+    def top(self, n, key='bytes'):
+        """The n live flows with the most bytes (or packets) as FlowExport records"""
+        return [flow.export() for flow in heapq.nlargest(n, self.flows.values(), key=attrgetter(key))]
+
+    def __len__(self):
+        return len(self.flows)
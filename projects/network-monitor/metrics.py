@@ -0,0 +1,255 @@
+"""
+Monitor Instrumentation
+Latency histograms, stage timings and counters describing the monitor
+itself, served in Prometheus text format and exported to rotating files
+"""
+
+import io
+import os
+import csv
+import json
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds: 1 us to 100 ms for per-packet work
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+                   1e-3, 2.5e-3, 1e-2, 1e-1)
+# 1 ms to 1 min between a packet arriving and being analyzed
+LAG_BUCKETS = (1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+# 100 us to 10 s for periodic work such as publishing a snapshot
+STAGE_BUCKETS = (1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 10.0)
+
+DEFAULT_METRICS_HOST = '127.0.0.1'
+DEFAULT_EXPORT_INTERVAL = 60.0
+DEFAULT_EXPORT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_EXPORT_BACKUPS = 5
+
+
+class Histogram:
+    """Fixed-bucket histogram in the Prometheus style (the last bucket is +Inf)"""
+
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Approximate quantile, interpolated within the bucket that holds it"""
+        total = self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.bounds[index - 1] if index else 0.0
+                if index == len(self.bounds):
+                    return lower
+                return lower + (self.bounds[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+
+    def copy(self):
+        histogram = Histogram(self.bounds)
+        histogram.counts = list(self.counts)
+        histogram.sum = self.sum
+        return histogram
+
+
+class Instrumentation:
+    """Everything one analyzer measures about itself
+
+    latency is the parse + analyze time of sampled packets, lag how long
+    after capture they were analyzed, stages holds timings per pipeline
+    stage and counters plain totals (drops, queue depth, ...).
+    """
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.lag = Histogram(LAG_BUCKETS)
+        self.stages = {}
+        self.counters = {}
+
+    def observe_stage(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            bounds = LATENCY_BUCKETS if stage in ('parse', 'analyze') else STAGE_BUCKETS
+            histogram = self.stages[stage] = Histogram(bounds)
+        histogram.observe(seconds)
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.lag.merge(other.lag)
+        for stage, histogram in other.stages.items():
+            if stage in self.stages:
+                self.stages[stage].merge(histogram)
+            else:
+                self.stages[stage] = histogram.copy()
+        for name, value in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def copy(self):
+        instrumentation = Instrumentation()
+        instrumentation.latency = self.latency.copy()
+        instrumentation.lag = self.lag.copy()
+        instrumentation.stages = {stage: histogram.copy()
+                                  for stage, histogram in list(self.stages.items())}
+        instrumentation.counters = dict(self.counters)
+        return instrumentation
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+def format_family(name, kind, help_text, samples):
+    """Prometheus text lines for one metric family
+
+    samples are (labels dict, value) pairs; for kind 'histogram' the value
+    is a Histogram.
+    """
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        if kind != 'histogram':
+            lines.append(f'{name}{_labels(labels)} {value}')
+            continue
+        cumulative = 0
+        for bound, count in zip(value.bounds + (float('inf'),), value.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{_labels(dict(labels, le=le))} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {value.sum}')
+        lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return lines
+
+
+class MetricsServer:
+    """Serves render() as Prometheus text on http://host:port/metrics
+
+    Runs in a daemon thread; render is expected to read published
+    snapshots only, so scrapes never touch live statistics.
+    """
+
+    def __init__(self, render, port, host=DEFAULT_METRICS_HOST):
+        self.render = render
+        self.scrapes = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = server.render().encode()
+                server.scrapes += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class RotatingExporter:
+    """Appends a row of summary statistics to a JSONL or CSV file every interval
+
+    The format follows the file extension (.csv, anything else is JSON
+    lines). When the file would grow past max_bytes it is renamed to
+    path.1 (path.1 to path.2 and so on, keeping `backups` old files) and a
+    new one is started.
+    """
+
+    def __init__(self, path, interval=DEFAULT_EXPORT_INTERVAL,
+                 max_bytes=DEFAULT_EXPORT_MAX_BYTES, backups=DEFAULT_EXPORT_BACKUPS):
+        self.path = path
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        self.rows = 0
+        self._next_write = 0.0
+        self._fields = None
+        self._file = None
+
+    def due(self):
+        return time.monotonic() >= self._next_write
+
+    def write(self, row):
+        """Write row (a dict) now, rotating first if the file is full"""
+        self._next_write = time.monotonic() + self.interval
+        if self.format == 'csv':
+            if self._fields is None:
+                self._fields = list(row)
+            line = self._csv_line(row)
+        else:
+            line = json.dumps(row) + '\n'
+        if self._file is None:
+            self._open()
+        if self._file.tell() and self._file.tell() + len(line) > self.max_bytes:
+            self._rotate()
+        if self.format == 'csv' and not self._file.tell():
+            self._file.write(self._csv_line(dict(zip(self._fields, self._fields))))
+        self._file.write(line)
+        self._file.flush()
+        self.rows += 1
+
+    def _csv_line(self, row):
+        line = io.StringIO()
+        csv.writer(line).writerow(row.get(field, '') for field in self._fields)
+        return line.getvalue()
+
+    def _open(self):
+        self._file = open(self.path, 'a', newline='')
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            older = f'{self.path}.{index}'
+            if os.path.exists(older):
+                os.replace(older, f'{self.path}.{index + 1}')
+        if self.backups:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
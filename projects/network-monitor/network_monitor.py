@@ -3,122 +3,556 @@ Real-Time Network Traffic Analyzer
 Captures packets, analyzes protocols, and visualizes traffic patterns
 """
 
-from scapy.all import sniff, IP, TCP, UDP, ICMP, ARP
-from collections import defaultdict, deque
+from collections import defaultdict, namedtuple
+from operator import attrgetter
 import threading
+import argparse
 import time
 from datetime import datetime
-import os
+import sys
+import csv
+import heapq
+import socket
+
+try:
+    from scapy.all import sniff, conf, IP, IPv6, TCP, UDP, ICMP, ARP
+except ImportError:  # the AF_PACKET backend doesn't need scapy
+    sniff = None
+
+from fast_capture import AFPacketCapture, SocketFilter, parse_frame, LINKTYPE_ETHERNET
+from pcap_reader import PcapReader, DEFAULT_BATCH_SIZE
+from sharded import ShardedPipeline, flow_hash, DEFAULT_SNAPSHOT_INTERVAL
+from sampling import AdaptiveSampler, DEFAULT_MAX_RATE
+from dashboard import Dashboard
+from sketches import make_counter, DEFAULT_CAPACITY
+from scan_detector import (ScanDetector, DEFAULT_WINDOW, DEFAULT_PORT_THRESHOLD,
+                           DEFAULT_HOST_THRESHOLD)
+from flow_table import (FlowTable, FlowExport, DEFAULT_IDLE_TIMEOUT,
+                        DEFAULT_ACTIVE_TIMEOUT)
+from packet_ring import PROTOCOLS, PacketRing, PacketRecord
+from timeseries import TimeSeries
+from metrics import (Instrumentation, MetricsServer, RotatingExporter, format_family,
+                     DEFAULT_METRICS_HOST, DEFAULT_EXPORT_INTERVAL, DEFAULT_EXPORT_MAX_BYTES,
+                     DEFAULT_EXPORT_BACKUPS)
+
+TCP_SYN = 0x02
+TCP_SYN_ACK = 0x12
+# Packets between two that get their parse/analyze time measured
+LATENCY_SAMPLE_EVERY = 64
+
+# Instrumentation counters: (metric type, help text)
+COUNTERS = {
+    'kernel_packets_total': ('counter', "Packets that reached the capture socket"),
+    'kernel_drops_total': ('counter', "Packets the kernel dropped because the capture socket was full"),
+    'analyzer_drops_total': ('counter', "Packets dropped because analysis workers fell behind"),
+    'queue_depth_bytes': ('gauge', "Bytes waiting in the worker rings"),
+    'dead_workers': ('gauge', "Analysis worker processes that exited unexpectedly"),
+    'flows_finished_total': ('counter', "Flows that ended or timed out"),
+}
+
+# Point-in-time copy of the statistics that readers can use without locking
+StatsSnapshot = namedtuple('StatsSnapshot', ['packet_count', 'protocol_stats', 'ip_stats',
+                                             'port_stats', 'suspicious_ips', 'recent_packets',
+                                             'alerts', 'scan_candidates', 'active_flows',
+                                             'top_flows', 'series', 'metrics',
+                                             'sampling_rate', 'finished_flows',
+                                             'new_packets'],
+                         defaults=(None, None))
+
+
+def format_bits(bytes_per_second):
+    """Human readable bit rate"""
+    rate = bytes_per_second * 8
+    for unit in ('bit/s', 'kbit/s', 'Mbit/s'):
+        if rate < 1000:
+            return f"{rate:.1f} {unit}"
+        rate /= 1000
+    return f"{rate:.1f} Gbit/s"
+
 
 class NetworkMonitor:
-    def __init__(self, max_packets=1000):
-        self.packets = deque(maxlen=max_packets)
+    def __init__(self, max_packets=1000, counter_capacity=DEFAULT_CAPACITY, scan_options=None,
+                 flow_options=None, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL,
+                 latency_sample_every=LATENCY_SAMPLE_EVERY, live=False, sampling=None,
+                 max_sampling_rate=DEFAULT_MAX_RATE):
+        """max_packets is how many recent packets are kept for inspection.
+        counter_capacity bounds how many IPs/ports are tracked (Space-Saving
+        heavy hitters); None counts every key exactly. scan_options and
+        flow_options are keyword arguments for the ScanDetector and FlowTable.
+        A snapshot is published every snapshot_interval seconds (None: never,
+        which live captures don't allow as the dashboard would never update).
+        One packet in latency_sample_every has its processing time measured
+        (None: none); with live set, also its delay since capture.
+        sampling ('count' or 'flow') lets live captures fall back to analyzing
+        1 in up to max_sampling_rate packets when overloaded (None: never)."""
+        self.counter_capacity = counter_capacity
+        self.scan_options = scan_options or {}
+        self.flow_options = flow_options or {}
+        self.max_packets = max_packets
+        self.snapshot_interval = snapshot_interval
+        # Latest published snapshot; replaced, never modified
+        self.published = None
+        self._next_publish = 0.0 if snapshot_interval is not None else float('inf')
+        self.refresh_seconds = 0.0
+        self.packets = PacketRing(max_packets)
+        self.series = TimeSeries()
         self.protocol_stats = defaultdict(int)
-        self.ip_stats = defaultdict(int)
-        self.port_stats = defaultdict(int)
-        self.suspicious_ips = set()
+        self.ip_stats = make_counter(counter_capacity)
+        self.port_stats = make_counter(counter_capacity)
+        self.scan_detector = ScanDetector(**self.scan_options)
+        self.flows = FlowTable(**self.flow_options)
+        # (active flows, top flows) summed over workers when running sharded
+        self._merged_flows = None
+        # Measurements of the monitor itself; workers' arrive with their snapshots
+        self.instruments = Instrumentation()
+        self._worker_metrics = None
+        self.latency_sample_every = latency_sample_every
+        self._countdown = latency_sample_every or 0
+        self.live = live
+        # Sources of drop counters while capturing: the capture socket's
+        # SocketFilter and the worker pipeline
+        self._capture = None
+        self._pipeline = None
+        # Counts of sampled packets are scaled by the rate they were sampled at
+        self.sampler = AdaptiveSampler(sampling, max_sampling_rate) if sampling else None
+        # Whether the capture socket's filter does the sampling
+        self._kernel_sampling = False
+        # RotatingExporters given a summary row whenever they are due
+        self.exporters = []
         self.running = False
         self.start_time = None
+        self.packet_count = 0
         
-    def analyze_packet(self, packet):
-        """Analyze individual packet for interesting data"""
-        packet_info = {
-            'timestamp': datetime.now().strftime('%H:%M:%S'),
-            'protocol': 'Unknown',
-            'src': 'N/A',
-            'dst': 'N/A',
-            'length': len(packet)
-        }
-        
-        # IP Layer analysis
-        if IP in packet:
-            packet_info['src'] = packet[IP].src
-            packet_info['dst'] = packet[IP].dst
-            self.ip_stats[packet[IP].src] += 1
-            
-            # Check for potential port scanning (simple heuristic)
-            if self.ip_stats[packet[IP].src] > 100:
-                self.suspicious_ips.add(packet[IP].src)
-        
+    def analyze_packet(self, packet, weight=1):
+        """Analyze individual scapy packet for interesting data"""
+        self.record(*self.parse_packet(packet), float(packet.time), weight)
+
+    def parse_packet(self, packet):
+        """(protocol, src, dst, sport, dport, length, tcp_flags) of a scapy packet"""
+        sport = dport = None
+        src = dst = None
+        tcp_flags = 0
+        network = packet.getlayer(IP) or packet.getlayer(IPv6)
+        if network is not None:
+            src, dst = network.src, network.dst
+
         # Protocol identification
-        if TCP in packet:
-            packet_info['protocol'] = 'TCP'
-            packet_info['sport'] = packet[TCP].sport
-            packet_info['dport'] = packet[TCP].dport
-            self.port_stats[packet[TCP].dport] += 1
-            self.protocol_stats['TCP'] += 1
-            
-        elif UDP in packet:
-            packet_info['protocol'] = 'UDP'
-            packet_info['sport'] = packet[UDP].sport
-            packet_info['dport'] = packet[UDP].dport
-            self.port_stats[packet[UDP].dport] += 1
-            self.protocol_stats['UDP'] += 1
-            
-        elif ICMP in packet:
-            packet_info['protocol'] = 'ICMP'
-            self.protocol_stats['ICMP'] += 1
-            
+        transport = packet.getlayer(TCP) or packet.getlayer(UDP)
+        if transport is not None:
+            protocol = 'TCP' if isinstance(transport, TCP) else 'UDP'
+            sport, dport = transport.sport, transport.dport
+            if protocol == 'TCP':
+                tcp_flags = int(transport.flags)
+        elif ICMP in packet or (network is not None and network.version == 6
+                                and network.nh == 58):
+            protocol = 'ICMP'
         elif ARP in packet:
-            packet_info['protocol'] = 'ARP'
-            self.protocol_stats['ARP'] += 1
-        
-        self.packets.append(packet_info)
-        return packet_info
-    
+            protocol = 'ARP'
+        else:
+            protocol = 'Unknown'
+
+        return protocol, src, dst, sport, dport, len(packet), tcp_flags
+
+    def process_frame(self, frame, length, timestamp=None, linktype=LINKTYPE_ETHERNET, weight=1):
+        """Analyze a raw frame from the fast capture path or a capture file"""
+        self._countdown -= 1
+        if self._countdown:
+            self.record(*parse_frame(frame, length, linktype), timestamp, weight)
+        else:
+            self._timed_record(parse_frame, (frame, length, linktype), timestamp, weight)
+
+    def process_batch(self, batch, weight=1):
+        """Analyze a list of (timestamp, frame, wire_length, linktype) tuples"""
+        record = self.record
+        for timestamp, frame, length, linktype in batch:
+            self._countdown -= 1
+            if self._countdown:
+                record(*parse_frame(frame, length, linktype), timestamp, weight)
+            else:
+                self._timed_record(parse_frame, (frame, length, linktype), timestamp, weight)
+
+    def _timed_record(self, parse, packet, timestamp, weight=1):
+        """parse(*packet) and record the result, measuring both steps
+
+        Only one packet in latency_sample_every comes through here, which
+        keeps the cost of the clock reads off the other packets.
+        """
+        self._countdown = self.latency_sample_every
+        instruments = self.instruments
+        start = time.perf_counter()
+        fields = parse(*packet)
+        parsed = time.perf_counter()
+        self.record(*fields, timestamp, weight)
+        finished = time.perf_counter()
+        instruments.observe_stage('parse', parsed - start)
+        instruments.observe_stage('analyze', finished - parsed)
+        instruments.latency.observe(finished - start)
+        if self.live and timestamp:
+            lag = max(time.time() - timestamp, 0.0)
+            instruments.lag.observe(lag)
+            if self.sampler is not None:
+                self.sampler.observe_lag(lag)
+
+    def record(self, protocol, src, dst, sport, dport, length, tcp_flags=0, timestamp=None,
+               weight=1):
+        """Update statistics for one packet - shared by every capture backend
+
+        A sampled packet stands for weight packets in the counts. Scan
+        detection and flows see only the packets actually analyzed.
+        """
+        if not timestamp:
+            timestamp = time.time()
+        self.packet_count += weight
+        # Stored in packed columns; formatted only when displayed or exported
+        self.packets.append(protocol, src, dst, sport, dport, length, timestamp)
+        self.series.record(timestamp, length, protocol, weight)
+
+        # IP Layer analysis
+        if src is not None:
+            self.ip_stats.add(src, weight)
+            # Windowed distinct port/host counting for scan detection; only
+            # connection attempts count, so servers replying to many client
+            # ports aren't mistaken for scanners
+            if protocol != 'TCP' or tcp_flags & TCP_SYN_ACK == TCP_SYN:
+                self.scan_detector.observe(src, dst, dport, timestamp)
+            self.flows.update(protocol, src, dst, sport, dport, length, tcp_flags, timestamp)
+
+        if sport is not None:
+            self.port_stats.add(dport, weight)
+
+        if protocol != 'Unknown':
+            self.protocol_stats[protocol] += weight
+
+        if time.monotonic() >= self._next_publish:
+            self.publish()
+
+    @property
+    def suspicious_ips(self):
+        """Sources that raised a scan alert within the detection window"""
+        return frozenset(self.scan_detector.active_sources())
+
+    def snapshot(self, recent=10, candidate_fraction=None):
+        """Copy the statistics so they can be read while capture keeps updating them
+
+        candidate_fraction adds the scan sketches a sharded merge needs: those
+        of sources past that fraction of a scan threshold.
+        """
+        active_flows, top_flows = self._merged_flows or (len(self.flows), self.flows.top(5))
+        metrics = self.instruments.copy()
+        if self._worker_metrics is not None:
+            metrics.merge(self._worker_metrics)
+        metrics.counters['flows_finished_total'] = self.flows.expired
+        # Each copy is a single C-level call, so the capture thread can't
+        # mutate a container halfway through it
+        return StatsSnapshot(self.packet_count, dict(self.protocol_stats), self.ip_stats.copy(),
+                             self.port_stats.copy(), self.suspicious_ips,
+                             self.packets.recent(recent),
+                             tuple(self.scan_detector.alerts),
+                             None if candidate_fraction is None
+                             else self.scan_detector.candidates(candidate_fraction),
+                             active_flows, top_flows, self.series.copy(), metrics,
+                             self.sampler.rate if self.sampler is not None else 1)
+
+    def publish(self, export=False):
+        """Build a new snapshot and make it the one readers see
+
+        Double buffered: the snapshot is built by the thread updating the
+        statistics, then swapped in with one reference assignment. Readers
+        such as the dashboard only use self.published, and a snapshot they
+        hold stays valid because snapshots are never modified.
+
+        Exporters that are due (all of them with export=True) get a summary
+        row of the new snapshot.
+        """
+        start = time.perf_counter()
+        counters = self.instruments.counters
+        if self._capture is not None:
+            counters['kernel_packets_total'], counters['kernel_drops_total'] = \
+                self._capture.statistics()
+        if self._pipeline is not None:
+            counters['analyzer_drops_total'] = self._pipeline.dropped
+            counters['queue_depth_bytes'] = self._pipeline.queue_depth()
+            counters['dead_workers'] = len(self._pipeline.dead_workers())
+        if self.sampler is not None and self.live:
+            self._adapt_sampling(counters)
+        self.published = snapshot = self.snapshot()
+        if self.snapshot_interval is not None:
+            self._next_publish = time.monotonic() + self.snapshot_interval
+        self.instruments.observe_stage('publish', time.perf_counter() - start)
+
+        for exporter in self.exporters:
+            if export or exporter.due():
+                start = time.perf_counter()
+                exporter.write(self.summary(snapshot))
+                self.instruments.observe_stage('export', time.perf_counter() - start)
+
+    def _adapt_sampling(self, counters):
+        """Let the sampler react to the latest drop counts and queue fill"""
+        sampler = self.sampler
+        drops = counters.get('kernel_drops_total', 0) + counters.get('analyzer_drops_total', 0)
+        fill = self._pipeline.queue_fill() if self._pipeline is not None else 0.0
+        if sampler.check(drops, fill) and self._kernel_sampling:
+            try:
+                self._capture.attach(sampler.rate, sampler.mode)
+            except (OSError, RuntimeError, ValueError) as e:
+                # e.g. the filter can't be compiled: sample after capture instead
+                print(f"⚠️  Kernel sampling unavailable ({e}), sampling in the analyzer")
+                self._kernel_sampling = False
+
+    def _sampled(self, handle):
+        """Wrap handle(frame, length, timestamp, linktype, weight) as a capture
+        handler that applies the sampler"""
+        sampler = self.sampler
+
+        def handler(frame, length, timestamp):
+            if self._kernel_sampling:
+                # Already sampled; weight it by the rate when it was captured
+                weight = sampler.weight(timestamp)
+            else:
+                key = (flow_hash(frame) or None) if sampler.mode == 'flow' else None
+                if not sampler.keep(key):
+                    return
+                weight = sampler.rate
+            handle(frame, length, timestamp, LINKTYPE_ETHERNET, weight)
+        return handler
+
+    def merge(self, snapshots, arrived=None):
+        """Replace the statistics with the totals of per-worker snapshots
+
+        snapshots holds the latest snapshot of each worker. arrived lists
+        (shard, snapshot) for every snapshot received since the last merge,
+        so scan sketches and alerts in superseded ones are evaluated too.
+        """
+        start = time.perf_counter()
+        protocol_stats = defaultdict(int)
+        ip_stats = make_counter(self.counter_capacity)
+        port_stats = make_counter(self.counter_capacity)
+        packet_count = 0
+        active_flows = 0
+        top_flows = []
+        series = TimeSeries()
+        worker_metrics = Instrumentation()
+        for snapshot in snapshots:
+            packet_count += snapshot.packet_count
+            for proto, count in snapshot.protocol_stats.items():
+                protocol_stats[proto] += count
+            ip_stats.merge(snapshot.ip_stats)
+            port_stats.merge(snapshot.port_stats)
+            # Both directions of a conversation go to the same worker, so
+            # flows never span workers
+            active_flows += snapshot.active_flows
+            top_flows.extend(snapshot.top_flows)
+            series.merge(snapshot.series)
+            worker_metrics.merge(snapshot.metrics)
+        # A scanner's packets can be split across workers, so alerts are
+        # raised from the union of their sketches
+        if arrived is None:
+            arrived = list(enumerate(snapshots))
+        self.scan_detector.merge_candidates(
+            [(shard, snapshot.scan_candidates) for shard, snapshot in arrived
+             if snapshot.scan_candidates],
+            [alert for _, snapshot in arrived for alert in snapshot.alerts])
+        for _, snapshot in arrived:
+            for flow in snapshot.finished_flows or ():
+                self.flows.export(flow)
+        # Workers send the packets they saw since their previous snapshot;
+        # the ring keeps the newest max_packets across merges
+        new_packets = [snapshot.new_packets for _, snapshot in arrived if snapshot.new_packets]
+        self.packets.extend(new_packets[0] if len(new_packets) == 1
+                            else heapq.merge(*new_packets, key=attrgetter('timestamp')))
+
+        # Rebind rather than mutate, so readers holding the old objects are unaffected
+        self.protocol_stats = protocol_stats
+        self.ip_stats = ip_stats
+        self.port_stats = port_stats
+        self.packet_count = packet_count
+        self.series = series
+        self._merged_flows = (active_flows, heapq.nlargest(5, top_flows, key=attrgetter('bytes')))
+        self._worker_metrics = worker_metrics
+        self.instruments.observe_stage('merge', time.perf_counter() - start)
+
     def packet_handler(self, packet):
         """Callback for each captured packet"""
         if self.running:
-            self.analyze_packet(packet)
-    
+            weight = 1
+            sampler = self.sampler
+            if sampler is not None:
+                if self._kernel_sampling:
+                    weight = sampler.weight(float(packet.time))
+                else:
+                    network = packet.getlayer(IP) or packet.getlayer(IPv6)
+                    key = (frozenset((network.src, network.dst))
+                           if network is not None and sampler.mode == 'flow' else None)
+                    if not sampler.keep(key):
+                        return
+                    weight = sampler.rate
+            self._countdown -= 1
+            if self._countdown:
+                self.analyze_packet(packet, weight)
+            else:
+                self._timed_record(self.parse_packet, (packet,), float(packet.time), weight)
+
+    def summary(self, stats, now=None):
+        """Headline numbers of a snapshot as a flat dict - one row of the periodic export"""
+        now = time.time() if now is None else now
+        pps, bps = stats.series.rate(now)
+        row = {'time': datetime.fromtimestamp(now).isoformat(timespec='seconds'),
+               'packets': stats.packet_count, 'packets_per_sec': pps, 'bytes_per_sec': bps}
+        for window, (rate, _) in stats.series.ewma(now).items():
+            row[f'packets_per_sec_{window // 60}m'] = round(rate, 3)
+        for proto in PROTOCOLS:
+            row[proto.lower()] = stats.protocol_stats.get(proto, 0)
+        row['sampling_rate'] = stats.sampling_rate
+        row['active_flows'] = stats.active_flows
+        row['suspicious_sources'] = len(stats.suspicious_ips)
+        metrics = stats.metrics
+        for name in COUNTERS:
+            row[name] = metrics.counters.get(name, 0)
+        row['latency_p50_us'] = round(metrics.latency.quantile(0.5) * 1e6, 2)
+        row['latency_p99_us'] = round(metrics.latency.quantile(0.99) * 1e6, 2)
+        row['lag_p99_ms'] = round(metrics.lag.quantile(0.99) * 1e3, 2)
+        return row
+
+    def format_metrics(self, stats, now=None):
+        """Prometheus text exposition of a snapshot"""
+        now = time.time() if now is None else now
+        pps, bps = stats.series.rate(now)
+        metrics = stats.metrics
+        families = [
+            ('netmon_packets_total', 'counter', "Packets analyzed",
+             [({}, stats.packet_count)]),
+            ('netmon_protocol_packets_total', 'counter', "Packets analyzed per protocol",
+             [({'protocol': proto}, count) for proto, count in sorted(stats.protocol_stats.items())]),
+            ('netmon_packets_per_second', 'gauge', "Packets in the last complete second",
+             [({}, pps)]),
+            ('netmon_bytes_per_second', 'gauge', "Bytes in the last complete second",
+             [({}, bps)]),
+            ('netmon_packets_per_second_average', 'gauge', "Exponentially weighted packet rate",
+             [({'window': f'{window}s'}, rate)
+              for window, (rate, _) in stats.series.ewma(now).items()]),
+            ('netmon_sampling_rate', 'gauge', "Packets each analyzed packet stands for",
+             [({}, stats.sampling_rate)]),
+            ('netmon_active_flows', 'gauge', "Flows in the flow table",
+             [({}, stats.active_flows)]),
+            ('netmon_suspicious_sources', 'gauge', "Sources with a scan alert in the detection window",
+             [({}, len(stats.suspicious_ips))]),
+        ]
+        for name, (kind, help_text) in COUNTERS.items():
+            if name in metrics.counters:
+                families.append((f'netmon_{name}', kind, help_text,
+                                 [({}, metrics.counters[name])]))
+        families += [
+            ('netmon_packet_latency_seconds', 'histogram',
+             "Parse and analysis time of sampled packets", [({}, metrics.latency)]),
+            ('netmon_capture_lag_seconds', 'histogram',
+             "Delay between capturing and analyzing sampled packets", [({}, metrics.lag)]),
+            ('netmon_stage_seconds', 'histogram', "Time spent per processing stage",
+             [({'stage': stage}, histogram)
+              for stage, histogram in sorted(metrics.stages.items())]),
+        ]
+        lines = []
+        for family in families:
+            lines += format_family(*family)
+        return '\n'.join(lines) + '\n'
+
+    def render_metrics(self):
+        """Prometheus text for the published snapshot; the metrics endpoint serves this"""
+        stats = self.published
+        return self.format_metrics(stats) if stats is not None else ''
+
+    def format_stats(self, stats, now=None):
+        """Dashboard lines for a snapshot"""
+        now = time.time() if now is None else now
+        elapsed = now - self.start_time
+        lines = ["=" * 80, f"{'NETWORK TRAFFIC MONITOR':^80}", "=" * 80,
+                 f"Running for: {elapsed:.1f}s | Packets captured: {stats.packet_count}"]
+        pps, bps = stats.series.rate(now)
+        averages = stats.series.ewma(now)
+        lines.append(f"Rate: {pps:.0f} packets/sec, {format_bits(bps)} | "
+                     + " ".join(f"{window // 60}m: {rate:.1f} pkt/s"
+                                for window, (rate, _) in averages.items()))
+        metrics = stats.metrics
+        counters = metrics.counters
+        lines.append(f"Analyzer: p50 {metrics.latency.quantile(0.5) * 1e6:.1f} us, "
+                     f"p99 {metrics.latency.quantile(0.99) * 1e6:.1f} us per packet | "
+                     f"Drops: {counters.get('kernel_drops_total', 0)} kernel, "
+                     f"{counters.get('analyzer_drops_total', 0)} analyzer | "
+                     f"Queued: {counters.get('queue_depth_bytes', 0) // 1024} KB"
+                     + (f" | ⚠️  {counters['dead_workers']} workers died"
+                        if counters.get('dead_workers') else "")
+                     + (f" | Sampling 1 in {stats.sampling_rate} (counts scaled up)"
+                        if stats.sampling_rate > 1 else ""))
+        lines.append("")
+
+        # Protocol distribution
+        lines += ["PROTOCOL DISTRIBUTION:", "-" * 40]
+        total = sum(stats.protocol_stats.values())
+        if total > 0:
+            for proto, count in sorted(stats.protocol_stats.items(), key=lambda x: x[1], reverse=True):
+                bar = '█' * int((count/total) * 30)
+                lines.append(f"{proto:8s} | {bar:30s} {count:5d} ({count/total*100:5.1f}%)")
+
+        # Top talkers
+        lines += ["", "TOP SOURCE IPs:", "-" * 40]
+        for ip, count in stats.ip_stats.top(5):
+            suspicious = " ⚠️ SUSPICIOUS" if ip in stats.suspicious_ips else ""
+            lines.append(f"{ip:15s} : {count:5d} packets{suspicious}")
+
+        # Top destination ports
+        lines += ["", "TOP DESTINATION PORTS:", "-" * 40]
+        for port, count in stats.port_stats.top(5):
+            service = self.get_service_name(port)
+            lines.append(f"Port {port:5d} ({service:10s}) : {count:5d} packets")
+
+        # Scan alerts
+        lines += ["", "RECENT SCAN ALERTS:", "-" * 40]
+        for alert in stats.alerts[-5:]:
+            when = datetime.fromtimestamp(alert.timestamp).strftime('%H:%M:%S')
+            lines.append(f"{when} {alert.source:15s} {alert.kind:9s} "
+                         f"{alert.distinct:5d} distinct in {alert.window:.0f}s")
+
+        # Largest live flows
+        lines += ["", f"TOP FLOWS ({stats.active_flows} active):", "-" * 80]
+        for flow in stats.top_flows:
+            source = f"{flow.src}:{flow.sport}" if flow.sport is not None else flow.src
+            destination = f"{flow.dst}:{flow.dport}" if flow.dport is not None else flow.dst
+            lines.append(f"{flow.protocol:5s} {source:>23s} -> {destination:23s} "
+                         f"{flow.packets:7d} pkts {flow.bytes:10d} bytes "
+                         f"{flow.last_seen - flow.first_seen:6.1f}s")
+
+        # Recent packets
+        lines += ["", "RECENT PACKETS (Last 10):", "-" * 80,
+                  f"{'Time':10s} {'Proto':8s} {'Source':17s} {'Destination':17s} {'Length':8s}",
+                  "-" * 80]
+        for pkt in stats.recent_packets:
+            when = datetime.fromtimestamp(pkt.timestamp).strftime('%H:%M:%S')
+            lines.append(f"{when:10s} {pkt.protocol:8s} {pkt.src or 'N/A':17s} "
+                         f"{pkt.dst or 'N/A':17s} {pkt.length:8d}")
+
+        lines += ["", "=" * 80]
+        return lines
+
     def display_stats(self):
-        """Display real-time statistics"""
+        """Display real-time statistics from the published snapshots
+
+        Only reads self.published, so it never touches structures the
+        capture thread is updating.
+        """
+        dashboard = Dashboard()
         while self.running:
-            os.system('cls' if os.name == 'nt' else 'clear')
-            
-            elapsed = time.time() - self.start_time
-            print("=" * 80)
-            print(f"{'NETWORK TRAFFIC MONITOR':^80}")
-            print("=" * 80)
-            print(f"Running for: {elapsed:.1f}s | Packets captured: {len(self.packets)}")
-            print(f"Rate: {len(self.packets)/elapsed:.2f} packets/sec\n")
-            
-            # Protocol distribution
-            print("PROTOCOL DISTRIBUTION:")
-            print("-" * 40)
-            total = sum(self.protocol_stats.values())
-            if total > 0:
-                for proto, count in sorted(self.protocol_stats.items(), key=lambda x: x[1], reverse=True):
-                    bar = '█' * int((count/total) * 30)
-                    print(f"{proto:8s} | {bar:30s} {count:5d} ({count/total*100:5.1f}%)")
-            
-            # Top talkers
-            print("\nTOP SOURCE IPs:")
-            print("-" * 40)
-            for ip, count in sorted(self.ip_stats.items(), key=lambda x: x[1], reverse=True)[:5]:
-                suspicious = " ⚠️ SUSPICIOUS" if ip in self.suspicious_ips else ""
-                print(f"{ip:15s} : {count:5d} packets{suspicious}")
-            
-            # Top destination ports
-            print("\nTOP DESTINATION PORTS:")
-            print("-" * 40)
-            for port, count in sorted(self.port_stats.items(), key=lambda x: x[1], reverse=True)[:5]:
-                service = self.get_service_name(port)
-                print(f"Port {port:5d} ({service:10s}) : {count:5d} packets")
-            
-            # Recent packets
-            print("\nRECENT PACKETS (Last 10):")
-            print("-" * 80)
-            print(f"{'Time':10s} {'Proto':8s} {'Source':17s} {'Destination':17s} {'Length':8s}")
-            print("-" * 80)
-            for pkt in list(self.packets)[-10:]:
-                print(f"{pkt['timestamp']:10s} {pkt['protocol']:8s} {pkt['src']:17s} {pkt['dst']:17s} {pkt['length']:8d}")
-            
-            print("\n" + "=" * 80)
-            print("Press Ctrl+C to stop monitoring...")
-            
-            time.sleep(2)
-    
+            stats = self.published
+            if stats is not None:
+                start = time.perf_counter()
+                lines = self.format_stats(stats)
+                # Cost of the previous refresh, as this one isn't finished yet
+                lines.append(f"Refresh: {self.refresh_seconds * 1000:.2f} ms "
+                             f"({dashboard.lines_redrawn} lines, {dashboard.bytes_written} bytes) | "
+                             f"Press Ctrl+C to stop monitoring...")
+                dashboard.render(lines)
+                self.refresh_seconds = time.perf_counter() - start
+                self.instruments.observe_stage('render', self.refresh_seconds)
+            time.sleep(self.snapshot_interval or DEFAULT_SNAPSHOT_INTERVAL)
+
     def get_service_name(self, port):
         """Map common ports to service names"""
         services = {
@@ -140,21 +574,56 @@ class NetworkMonitor:
         }
         return services.get(port, 'Unknown')
     
-    def start(self, interface=None, filter_str=None):
-        """Start packet capture"""
-        self.running = True
+    def start(self, interface=None, filter_str=None, backend='auto', workers=1):
+        """Start packet capture
+
+        backend is 'afpacket' (Linux raw socket fast path), 'scapy', or
+        'auto' to prefer the fast path and fall back to scapy when it isn't
+        available or can't be set up (e.g. a filter needs tcpdump, which is
+        missing). With workers > 1 capture only queues frames and worker
+        processes do the analysis.
+        """
+        if self.snapshot_interval is None:
+            raise ValueError("Live capture needs a snapshot_interval to refresh the dashboard")
         self.start_time = time.time()
+        fallback = backend == 'auto'
+        backend = self._choose_backend(backend)
+        self.running = True
+        self.live = True
+        pipeline = self._start_pipeline(workers) if workers > 1 else None
         
+        print(f"Starting packet capture on interface: {interface or 'default'} ({backend})")
+        print("Initializing... This requires admin/root privileges!")
+
         # Start display thread
+        self.publish()
         display_thread = threading.Thread(target=self.display_stats, daemon=True)
         display_thread.start()
-        
-        print(f"Starting packet capture on interface: {interface or 'default'}")
-        print("Initializing... This requires admin/root privileges!")
-        
+
         try:
             # Start sniffing (this blocks)
-            sniff(prn=self.packet_handler, iface=interface, filter=filter_str, store=False)
+            submit = pipeline.submit if pipeline else self.process_frame
+            if self.sampler is not None:
+                submit = self._sampled(submit)
+            capture = None
+            if backend == 'afpacket':
+                capture = self._open_afpacket(interface, filter_str, fallback)
+            if capture is not None:
+                try:
+                    self._capture = capture.filter
+                    self._kernel_sampling = True
+                    capture.capture(submit, lambda: self.running)
+                finally:
+                    capture.close()
+            else:
+                handler = self.packet_handler
+                if pipeline:
+                    handler = lambda packet: submit(bytes(packet), len(packet), float(packet.time))
+                if self.sampler is None:
+                    sniff(prn=handler, iface=interface, filter=filter_str, store=False)
+                else:
+                    with self._open_scapy_socket(interface, filter_str) as sock:
+                        sniff(prn=handler, opened_socket=sock, store=False)
         except KeyboardInterrupt:
             print("\n\nStopping capture...")
             self.running = False
@@ -162,13 +631,141 @@ class NetworkMonitor:
             print("\n⚠️  Permission denied! Run with sudo/administrator privileges:")
             print("   Linux/Mac: sudo python3 network_monitor.py")
             print("   Windows: Run as Administrator")
+        finally:
+            if pipeline:
+                self.running = False
+                self._stop_pipeline(pipeline)
+            else:
+                self.flows.flush()
+
+    def _open_afpacket(self, interface, filter_str, fallback=False):
+        """Open the fast path capture; with fallback, None instead of raising
+        if it can't be set up and scapy is available"""
+        capture = AFPacketCapture(interface, filter_str)
+        try:
+            return capture.open()
+        except PermissionError:
+            # scapy needs the same privileges, so don't retry with it
+            capture.close()
+            raise
+        except (OSError, RuntimeError, ValueError) as e:
+            capture.close()
+            if not fallback or sniff is None:
+                raise
+            print(f"⚠️  AF_PACKET capture unavailable ({e}), falling back to scapy")
+            return None
+
+    def _open_scapy_socket(self, interface, filter_str):
+        """scapy's capture socket, opened here so that on Linux the kernel can
+        sample packets and report its drops, as with the AF_PACKET backend"""
+        sock = conf.L2listen(iface=interface, filter=filter_str)
+        raw = getattr(sock, 'ins', None)
+        if (isinstance(raw, socket.socket)
+                and raw.family == getattr(socket, 'AF_PACKET', None)):
+            self._capture = SocketFilter(raw, filter_str, interface)
+            self._kernel_sampling = True
+        return sock
+
+    def _start_pipeline(self, workers):
+        """Start worker processes plus a thread folding their snapshots into our stats"""
+        pipeline = ShardedPipeline(
+            workers, snapshot_interval=self.snapshot_interval or DEFAULT_SNAPSHOT_INTERVAL,
+            monitor_options={'max_packets': self.max_packets,
+                             'counter_capacity': self.counter_capacity,
+                             'scan_options': self.scan_options,
+                             'flow_options': self.flow_options,
+                             # Workers send snapshots on request instead
+                             'snapshot_interval': None,
+                             'latency_sample_every': self.latency_sample_every,
+                             'live': self.live}).start()
+        self._pipeline = pipeline
+
+        def merge_snapshots():
+            while self.running:
+                time.sleep(pipeline.snapshot_interval)
+                self.merge(pipeline.collect(), pipeline.arrived())
+                self.publish()
+
+        threading.Thread(target=merge_snapshots, daemon=True).start()
+        return pipeline
+
+    def _stop_pipeline(self, pipeline, timeout=10.0):
+        self.merge(pipeline.stop(timeout), pipeline.arrived())
+        self.publish()
+        if pipeline.dropped:
+            print(f"⚠️  {pipeline.dropped} packets dropped: analysis workers fell behind")
+        dead = pipeline.dead_workers()
+        if dead:
+            print(f"⚠️  Analysis workers {', '.join(map(str, dead))} exited unexpectedly; "
+                  f"their share of the traffic is missing from the stats")
     
+    def replay(self, path, speed=None, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+        """Feed a pcap/pcapng file through the analyzer
+
+        By default packets are processed as fast as possible, in batches;
+        speed=1.0 replays at the original capture timing (2.0 twice as fast).
+        workers > 1 spreads analysis over that many processes.
+        Returns (packets processed, seconds taken).
+        """
+        self.running = True
+        self.start_time = time.time()
+        pipeline = self._start_pipeline(workers) if workers > 1 else None
+        process_batch = pipeline.submit_batch if pipeline else self.process_batch
+        processed = 0
+        first_timestamp = None
+        try:
+            with PcapReader(path) as reader:
+                for batch in reader.batches(batch_size):
+                    if not self.running:
+                        break
+                    if speed:
+                        for timestamp, frame, length, linktype in batch:
+                            if timestamp is not None:
+                                if first_timestamp is None:
+                                    first_timestamp = timestamp
+                                delay = ((timestamp - first_timestamp) / speed
+                                         - (time.time() - self.start_time))
+                                if delay > 0:
+                                    time.sleep(delay)
+                            process_batch([(timestamp, frame, length, linktype)])
+                    else:
+                        process_batch(batch)
+                    processed += len(batch)
+        except KeyboardInterrupt:
+            print("\n\nStopping replay...")
+        except RuntimeError as e:
+            # A worker died and its ring can't be drained
+            print(f"\n⚠️  Replay stopped: {e}")
+        finally:
+            self.running = False
+            if pipeline:
+                # Everything read was queued; wait for all of it to be analyzed
+                self._stop_pipeline(pipeline, timeout=None)
+            else:
+                self.flows.flush()
+        return processed, time.time() - self.start_time
+
+    def _choose_backend(self, backend):
+        fast_path_available = sys.platform.startswith('linux')
+        if backend == 'auto':
+            backend = 'afpacket' if fast_path_available else 'scapy'
+        if backend == 'afpacket' and not fast_path_available:
+            raise RuntimeError("The AF_PACKET backend is only available on Linux")
+        if backend == 'scapy' and sniff is None:
+            raise RuntimeError("scapy is not installed - use the afpacket backend or pip install scapy")
+        if backend not in ('afpacket', 'scapy'):
+            raise ValueError(f"Unknown capture backend: {backend}")
+        return backend
+
     def export_stats(self, filename='network_stats.txt'):
         """Export statistics to file"""
         with open(filename, 'w') as f:
             f.write("Network Traffic Analysis Report\n")
             f.write("=" * 50 + "\n\n")
-            f.write(f"Total packets: {len(self.packets)}\n")
+            f.write(f"Total packets: {self.packet_count}\n")
+            if self.sampler is not None and self.sampler.changes:
+                f.write(f"Counts are estimates: sampling changed {self.sampler.changes} times, "
+                        f"ending at 1 in {self.sampler.rate}\n")
             f.write(f"Duration: {time.time() - self.start_time:.2f}s\n\n")
             
             f.write("Protocol Distribution:\n")
@@ -178,11 +775,95 @@ class NetworkMonitor:
             f.write("\nSuspicious IPs:\n")
             for ip in self.suspicious_ips:
                 f.write(f"  {ip} ({self.ip_stats[ip]} packets)\n")
+
+            f.write("\nScan Alerts:\n")
+            for alert in self.scan_detector.alerts:
+                when = datetime.fromtimestamp(alert.timestamp).strftime('%Y-%m-%d %H:%M:%S')
+                f.write(f"  {when} {alert.source} {alert.kind}: "
+                        f"{alert.distinct} distinct in {alert.window:.0f}s\n")
+
+            f.write(f"\nFlows: {self.flows.expired} finished\n")
+
+            f.write("\nTraffic Rates (EWMA):\n")
+            for window, (pps, bps) in self.series.ewma().items():
+                f.write(f"  {window // 60:2d} min: {pps:10.1f} packets/sec {format_bits(bps):>14s}\n")
+
+            f.write("\nTraffic per Minute (last hour):\n")
+            for bucket in self.series.last(60, resolution=60):
+                if bucket.packets:
+                    when = datetime.fromtimestamp(bucket.start).strftime('%Y-%m-%d %H:%M')
+                    protocols = ", ".join(f"{proto} {count}" for proto, count
+                                          in bucket.protocols.items() if count)
+                    f.write(f"  {when}: {bucket.packets} packets, {bucket.bytes} bytes ({protocols})\n")
         
         print(f"\n✅ Stats exported to {filename}")
 
+    def export_packets(self, filename='recent_packets.csv'):
+        """Write the recent-packet buffer to a CSV file, oldest packet first"""
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(PacketRecord._fields)
+            for packet in self.packets:
+                when = datetime.fromtimestamp(packet.timestamp).isoformat(timespec='microseconds')
+                writer.writerow((when,) + packet[1:])
+
+        print(f"✅ {len(self.packets)} recent packets exported to {filename}")
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Real-time network traffic monitor")
+    parser.add_argument('-i', '--interface', default=None, help="interface to capture on")
+    parser.add_argument('-f', '--filter', default=None, help="BPF filter, e.g. 'tcp port 80'")
+    parser.add_argument('--backend', choices=['auto', 'afpacket', 'scapy'], default='auto',
+                        help="capture backend (afpacket is the Linux fast path)")
+    parser.add_argument('-r', '--read', metavar='FILE',
+                        help="analyze a pcap/pcapng file instead of capturing live")
+    parser.add_argument('--speed', type=float, default=None,
+                        help="with --read, replay at this multiple of the original timing")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--top-capacity', type=int, default=DEFAULT_CAPACITY,
+                        help="IPs/ports tracked by the heavy-hitter counters (bounds memory)")
+    parser.add_argument('--exact', action='store_true',
+                        help="count every IP and port exactly (unbounded memory)")
+    parser.add_argument('--max-packets', type=int, default=1000,
+                        help="recent packets kept for inspection (about 53 bytes each)")
+    parser.add_argument('--dump-packets', metavar='FILE',
+                        help="write the recent packets to a CSV file on exit")
+    parser.add_argument('--scan-window', type=float, default=DEFAULT_WINDOW,
+                        help="seconds over which distinct ports/hosts are counted")
+    parser.add_argument('--port-threshold', type=int, default=DEFAULT_PORT_THRESHOLD,
+                        help="distinct destination ports per source that raise an alert")
+    parser.add_argument('--host-threshold', type=int, default=DEFAULT_HOST_THRESHOLD,
+                        help="distinct destination hosts per source that raise an alert")
+    parser.add_argument('--flow-idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help="seconds without packets after which a flow is finished")
+    parser.add_argument('--flow-active-timeout', type=float, default=DEFAULT_ACTIVE_TIMEOUT,
+                        help="seconds after which long-lived flows are reported in pieces")
+    parser.add_argument('--flow-log', metavar='FILE',
+                        help="append a CSV record for every finished flow to FILE")
+    parser.add_argument('--refresh', type=float, default=DEFAULT_SNAPSHOT_INTERVAL,
+                        help="seconds between stats snapshots and dashboard updates")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="analysis worker processes (1 = analyze in the capture thread)")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help=f"serve Prometheus metrics on http://{DEFAULT_METRICS_HOST}:PORT/metrics")
+    parser.add_argument('--export', metavar='FILE',
+                        help="periodically append summary rows to FILE (.csv for CSV, else JSON lines)")
+    parser.add_argument('--export-interval', type=float, default=DEFAULT_EXPORT_INTERVAL,
+                        help="seconds between exported rows")
+    parser.add_argument('--export-max-bytes', type=int, default=DEFAULT_EXPORT_MAX_BYTES,
+                        help="rotate the export file when it reaches this size")
+    parser.add_argument('--export-backups', type=int, default=DEFAULT_EXPORT_BACKUPS,
+                        help="rotated export files to keep")
+    parser.add_argument('--no-latency', action='store_true',
+                        help="don't time any packets (removes the per-packet instrumentation)")
+    parser.add_argument('--sampling', choices=['count', 'flow'], default=None,
+                        help="when overloaded, analyze only 1 in N packets (count: at random, "
+                             "flow: whole conversations) and scale counts by N")
+    parser.add_argument('--max-sampling-rate', type=int, default=DEFAULT_MAX_RATE,
+                        help="largest N --sampling may choose")
+    args = parser.parse_args()
+
     print("""
     ╔═══════════════════════════════════════╗
     ║   Real-Time Network Traffic Monitor   ║
@@ -192,18 +873,65 @@ def main():
     Requires administrative/root privileges!
     """)
     
-    monitor = NetworkMonitor()
-    
-    # You can specify interface and BPF filter
-    # Examples:
-    #   monitor.start(interface='eth0')
-    #   monitor.start(filter_str='tcp port 80')
-    #   monitor.start(filter_str='host 192.168.1.1')
-    
+    monitor = NetworkMonitor(max_packets=args.max_packets,
+                             snapshot_interval=args.refresh,
+                             counter_capacity=None if args.exact else args.top_capacity,
+                             scan_options={'window': args.scan_window,
+                                           'port_threshold': args.port_threshold,
+                                           'host_threshold': args.host_threshold},
+                             flow_options={'idle_timeout': args.flow_idle_timeout,
+                                           'active_timeout': args.flow_active_timeout},
+                             latency_sample_every=None if args.no_latency else LATENCY_SAMPLE_EVERY,
+                             sampling=args.sampling, max_sampling_rate=args.max_sampling_rate)
+    flow_log = None
+    if args.flow_log:
+        flow_log = open(args.flow_log, 'a', newline='')
+        writer = csv.writer(flow_log)
+        if not flow_log.tell():
+            writer.writerow(FlowExport._fields)
+        monitor.flows.subscribe(writer.writerow)
+    exporter = None
+    if args.export:
+        exporter = RotatingExporter(args.export, args.export_interval, args.export_max_bytes,
+                                    args.export_backups)
+        monitor.exporters.append(exporter)
+    server = None
+    if args.metrics_port is not None:
+        server = MetricsServer(monitor.render_metrics, args.metrics_port).start()
+        host, port = server.address[:2]
+        print(f"Metrics served on http://{host}:{port}/metrics")
+
     try:
-        monitor.start()
+        if args.read:
+            count, elapsed = monitor.replay(args.read, args.speed, args.batch_size, args.workers)
+            print(f"Processed {count} packets in {elapsed:.2f}s "
+                  f"({count / elapsed if elapsed else 0:,.0f} packets/sec)")
+            monitor.export_stats()
+            if args.dump_packets:
+                monitor.export_packets(args.dump_packets)
+            return
+
+        # You can specify interface, BPF filter and capture backend
+        # Examples:
+        #   monitor.start(interface='eth0')
+        #   monitor.start(filter_str='tcp port 80')
+        #   monitor.start(filter_str='host 192.168.1.1', backend='scapy')
+
+        try:
+            monitor.start(args.interface, args.filter, args.backend, args.workers)
+        finally:
+            monitor.export_stats()
+            if args.dump_packets:
+                monitor.export_packets(args.dump_packets)
     finally:
-        monitor.export_stats()
+        if exporter:
+            # Final row with the totals at exit
+            monitor.publish(export=True)
+            exporter.close()
+        if server:
+            server.close()
+        if flow_log:
+            flow_log.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,136 @@
+"""
+Recent Packet Ring
+Preallocated columnar buffer of the most recent packets; fields are stored
+as typed arrays and only turned back into strings when someone reads them
+"""
+
+import socket
+from array import array
+from collections import namedtuple
+
+PROTOCOLS = ('Unknown', 'TCP', 'UDP', 'ICMP', 'ARP')
+PROTOCOL_CODES = {name: code for code, name in enumerate(PROTOCOLS)}
+NO_PORT = -1
+# Addresses are stored as 16 bytes; IPv4 as an IPv4-mapped IPv6 address
+ADDRESS_SIZE = 16
+IPV4_MAPPED_PREFIX = bytes(10) + b'\xff\xff'
+NO_ADDRESS = bytes(ADDRESS_SIZE)
+
+PacketRecord = namedtuple('PacketRecord', ['timestamp', 'protocol', 'src', 'dst', 'sport',
+                                           'dport', 'length'])
+
+
+def pack_address(address):
+    """16-byte form of an IPv4/IPv6 address string (all zeros for None)"""
+    if address is None:
+        return NO_ADDRESS
+    if ':' in address:
+        return socket.inet_pton(socket.AF_INET6, address)
+    return IPV4_MAPPED_PREFIX + socket.inet_aton(address)
+
+
+def unpack_address(packed):
+    if packed == NO_ADDRESS:
+        return None
+    if packed[:12] == IPV4_MAPPED_PREFIX:
+        return socket.inet_ntoa(packed[12:])
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+class PacketRing:
+    """The last `capacity` packets in about 53 bytes each
+
+    Appending writes into preallocated columns, so no per-packet objects
+    are kept. A record becomes visible to readers only once all of its
+    columns are written, so the newest records can be read while capture
+    keeps appending.
+    """
+
+    def __init__(self, capacity=1000):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.count = 0
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.lengths = array('I', bytes(4 * capacity))
+        self.sports = array('i', [NO_PORT]) * capacity
+        self.dports = array('i', [NO_PORT]) * capacity
+        self.protocols = bytearray(capacity)
+        self.addresses = bytearray(2 * ADDRESS_SIZE * capacity)
+
+    def append(self, protocol, src, dst, sport, dport, length, timestamp):
+        index = self.count % self.capacity
+        self.timestamps[index] = timestamp
+        self.lengths[index] = length
+        self.sports[index] = NO_PORT if sport is None else sport
+        self.dports[index] = NO_PORT if dport is None else dport
+        self.protocols[index] = PROTOCOL_CODES.get(protocol, 0)
+        offset = index * 2 * ADDRESS_SIZE
+        self.addresses[offset:offset + ADDRESS_SIZE] = pack_address(src)
+        self.addresses[offset + ADDRESS_SIZE:offset + 2 * ADDRESS_SIZE] = pack_address(dst)
+        self.count += 1
+
+    def extend(self, records):
+        """Append PacketRecords, e.g. recent packets gathered from workers"""
+        for record in records:
+            self.append(record.protocol, record.src, record.dst, record.sport, record.dport,
+                        record.length, record.timestamp)
+
+    def since(self, position):
+        """Packets appended after the first `position`, still held, as a new
+        PacketRing just large enough for them
+
+        Copies column slices, so a worker can cheaply hand its newest packets
+        to another process.
+        """
+        count = self.count
+        start = max(position, count - len(self))
+        n = count - start
+        ring = PacketRing(max(n, 1))
+        if n:
+            first = start % self.capacity
+            end = min(first + n, self.capacity)
+            wrapped = n - (end - first)
+            for name, width in (('timestamps', 1), ('lengths', 1), ('sports', 1),
+                                ('dports', 1), ('protocols', 1),
+                                ('addresses', 2 * ADDRESS_SIZE)):
+                column = getattr(self, name)
+                setattr(ring, name, column[first * width:end * width]
+                        + column[:wrapped * width])
+            ring.count = n
+        return ring
+
+    def _record(self, index):
+        offset = index * 2 * ADDRESS_SIZE
+        sport = self.sports[index]
+        dport = self.dports[index]
+        return PacketRecord(self.timestamps[index], PROTOCOLS[self.protocols[index]],
+                            unpack_address(self.addresses[offset:offset + ADDRESS_SIZE]),
+                            unpack_address(self.addresses[offset + ADDRESS_SIZE:
+                                                          offset + 2 * ADDRESS_SIZE]),
+                            None if sport == NO_PORT else sport,
+                            None if dport == NO_PORT else dport,
+                            self.lengths[index])
+
+    def recent(self, n=None):
+        """The newest n (default: all) packets as PacketRecords, oldest first"""
+        count = self.count
+        available = min(count, self.capacity)
+        n = available if n is None else min(n, available)
+        return [self._record(position % self.capacity) for position in range(count - n, count)]
+
+    def __iter__(self):
+        """PacketRecords from oldest to newest, formatted one at a time"""
+        count = self.count
+        for position in range(count - min(count, self.capacity), count):
+            yield self._record(position % self.capacity)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def nbytes(self):
+        """Memory held by the columns"""
+        return sum(column.itemsize * len(column) if isinstance(column, array) else len(column)
+                   for column in (self.timestamps, self.lengths, self.sports, self.dports,
+                                  self.protocols, self.addresses))
@@ -0,0 +1,159 @@
+"""
+Offline Capture Reader
+Streams packets out of pcap and pcapng files in batches without loading the
+whole file into memory
+"""
+
+import struct
+
+PCAP_MAGIC_MICRO = 0xA1B2C3D4
+PCAP_MAGIC_NANO = 0xA1B23C4D
+PCAPNG_SECTION_HEADER = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# pcapng block types
+INTERFACE_DESCRIPTION_BLOCK = 0x00000001
+OBSOLETE_PACKET_BLOCK = 0x00000002
+SIMPLE_PACKET_BLOCK = 0x00000003
+ENHANCED_PACKET_BLOCK = 0x00000006
+IF_TSRESOL_OPTION = 9
+
+READ_SIZE = 1 << 20
+DEFAULT_BATCH_SIZE = 1024
+
+
+class PcapReader:
+    """Iterate (timestamp, frame, wire_length, linktype) tuples from a capture file
+
+    Reads the file in READ_SIZE chunks and hands out memoryview slices of
+    them, so frames are never copied individually. The format (classic pcap
+    in either byte order with micro- or nanosecond timestamps, or pcapng) is
+    detected from the first bytes of the file.
+    """
+
+    def __init__(self, path, read_size=READ_SIZE):
+        self.path = path
+        self.read_size = read_size
+        self.file = open(path, 'rb')
+        self._chunk = b''
+        self._view = memoryview(self._chunk)
+        self._pos = 0
+
+        magic = self.file.read(4)
+        self.file.seek(0)
+        if len(magic) < 4:
+            raise ValueError(f"{path} is not a pcap or pcapng file")
+        if struct.unpack('<I', magic)[0] == PCAPNG_SECTION_HEADER:
+            self.format = 'pcapng'
+        elif (struct.unpack('<I', magic)[0] in (PCAP_MAGIC_MICRO, PCAP_MAGIC_NANO)
+              or struct.unpack('>I', magic)[0] in (PCAP_MAGIC_MICRO, PCAP_MAGIC_NANO)):
+            self.format = 'pcap'
+        else:
+            raise ValueError(f"{path} is not a pcap or pcapng file")
+
+    def _ensure(self, size):
+        """Make at least size bytes available at self._pos; False at end of file"""
+        available = len(self._chunk) - self._pos
+        if available >= size:
+            return True
+        self._chunk = self._chunk[self._pos:] + self.file.read(max(self.read_size, size - available))
+        self._view = memoryview(self._chunk)
+        self._pos = 0
+        if len(self._chunk) >= size:
+            return True
+        if self._chunk:
+            raise ValueError(f"{self.path} is truncated")
+        return False
+
+    def __iter__(self):
+        if self.format == 'pcap':
+            return self._read_pcap()
+        return self._read_pcapng()
+
+    def batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """Yield lists of up to batch_size packets"""
+        batch = []
+        for packet in self:
+            batch.append(packet)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _read_pcap(self):
+        self._ensure(24)
+        magic, = struct.unpack_from('<I', self._chunk, 0)
+        order = '<' if magic in (PCAP_MAGIC_MICRO, PCAP_MAGIC_NANO) else '>'
+        magic, = struct.unpack_from(order + 'I', self._chunk, 0)
+        resolution = 1e-9 if magic == PCAP_MAGIC_NANO else 1e-6
+        linktype = struct.unpack_from(order + 'I', self._chunk, 20)[0] & 0x0FFFFFFF
+        self._pos = 24
+
+        record = struct.Struct(order + 'IIII')
+        while self._ensure(16):
+            sec, fraction, captured, length = record.unpack_from(self._chunk, self._pos)
+            if not self._ensure(16 + captured):
+                raise ValueError(f"{self.path} is truncated")
+            start = self._pos + 16
+            self._pos = start + captured
+            yield sec + fraction * resolution, self._view[start:self._pos], length, linktype
+
+    def _read_pcapng(self):
+        order = '<'
+        interfaces = []
+        while self._ensure(12):
+            block_type, = struct.unpack_from(order + 'I', self._chunk, self._pos)
+            if block_type == PCAPNG_SECTION_HEADER:
+                # Each section declares its own byte order and interface list
+                order = '<' if struct.unpack_from('<I', self._chunk, self._pos + 8)[0] \
+                    == PCAPNG_BYTE_ORDER_MAGIC else '>'
+                interfaces = []
+            total_length, = struct.unpack_from(order + 'I', self._chunk, self._pos + 4)
+            if total_length < 12 or not self._ensure(total_length):
+                raise ValueError(f"{self.path} is truncated or corrupted")
+            body = self._pos + 8
+            self._pos += total_length
+
+            if block_type == ENHANCED_PACKET_BLOCK:
+                interface, high, low, captured, length = struct.unpack_from(
+                    order + 'IIIII', self._chunk, body)
+                linktype, resolution = interfaces[interface]
+                yield (((high << 32) | low) * resolution, self._view[body + 20:body + 20 + captured],
+                       length, linktype)
+            elif block_type == SIMPLE_PACKET_BLOCK:
+                length, = struct.unpack_from(order + 'I', self._chunk, body)
+                linktype, _ = interfaces[0]
+                captured = min(length, total_length - 16)
+                yield None, self._view[body + 4:body + 4 + captured], length, linktype
+            elif block_type == OBSOLETE_PACKET_BLOCK:
+                interface, _, high, low, captured, length = struct.unpack_from(
+                    order + 'HHIIII', self._chunk, body)
+                linktype, resolution = interfaces[interface]
+                yield (((high << 32) | low) * resolution, self._view[body + 20:body + 20 + captured],
+                       length, linktype)
+            elif block_type == INTERFACE_DESCRIPTION_BLOCK:
+                linktype, = struct.unpack_from(order + 'H', self._chunk, body)
+                interfaces.append((linktype, self._timestamp_resolution(
+                    order, body + 8, body + total_length - 12)))
+
+    def _timestamp_resolution(self, order, position, end):
+        """Seconds per timestamp unit from an interface's if_tsresol option"""
+        while position + 4 <= end:
+            code, size = struct.unpack_from(order + 'HH', self._chunk, position)
+            if code == 0:
+                break
+            if code == IF_TSRESOL_OPTION:
+                value = self._chunk[position + 4]
+                return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+            position += 4 + (size + 3) // 4 * 4
+        return 1e-6
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,112 @@
+"""
+Adaptive Sampling
+Overload protection: when analysis falls behind capture, only 1 in N packets
+is analyzed and counted N times, with N chosen from lag, drops and queue fill
+"""
+
+import time
+import random
+
+from fast_capture import SAMPLING_MODES, SAMPLING_HASH_MULTIPLIER
+
+DEFAULT_MAX_RATE = 1024
+# The kernel hash has 16 bits and worker rings store the weight in 16 bits
+MAX_RATE_LIMIT = 65535
+# Seconds between capturing and analyzing a packet
+DEFAULT_HIGH_LAG = 1.0
+DEFAULT_LOW_LAG = 0.1
+# Share of the worker rings in use
+HIGH_QUEUE_FILL = 0.5
+LOW_QUEUE_FILL = 0.1
+# Quiet checks in a row before the rate is lowered again
+CALM_CHECKS = 5
+# Rate changes remembered for weighting packets captured before a change
+MAX_CHANGES = 16
+
+
+class AdaptiveSampler:
+    """Chooses the sampling rate N, one decision per check()
+
+    N doubles (up to max_rate) whenever packets were dropped, the worker
+    rings are filling up or the lag of analyzed packets is high and not
+    shrinking, and halves after CALM_CHECKS quiet checks in a row. The
+    rate in effect at each capture timestamp is remembered, so packets
+    captured just before a change are still weighted correctly.
+    """
+
+    def __init__(self, mode='count', max_rate=DEFAULT_MAX_RATE, high_lag=DEFAULT_HIGH_LAG,
+                 low_lag=DEFAULT_LOW_LAG):
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode: {mode}")
+        if not 1 <= max_rate <= MAX_RATE_LIMIT:
+            raise ValueError(f"max_rate must be between 1 and {MAX_RATE_LIMIT}")
+        self.mode = mode
+        self.max_rate = max_rate
+        self.high_lag = high_lag
+        self.low_lag = low_lag
+        self.rate = 1
+        self.changes = 0
+        # (capture time from which it applies, rate), oldest first
+        self._history = [(float('-inf'), 1)]
+        self._lag = 0.0
+        self._previous_lag = 0.0
+        self._drops = 0
+        self._calm = 0
+
+    def observe_lag(self, seconds):
+        """Report how long after capture a packet was analyzed"""
+        if seconds > self._lag:
+            self._lag = seconds
+
+    def check(self, drops=0, queue_fill=0.0):
+        """Re-evaluate the rate; True if it changed
+
+        drops is the total number of packets lost so far, queue_fill the
+        share of the worker rings in use. The lag is the worst reported
+        since the previous check.
+        """
+        lag, self._lag = self._lag, 0.0
+        previous_lag, self._previous_lag = self._previous_lag, lag
+        dropping = drops > self._drops
+        self._drops = drops
+        if dropping or queue_fill > HIGH_QUEUE_FILL or (lag > self.high_lag
+                                                        and lag >= previous_lag):
+            self._calm = 0
+            rate = min(self.rate * 2, self.max_rate)
+        elif lag < self.low_lag and queue_fill < LOW_QUEUE_FILL:
+            self._calm += 1
+            if self._calm < CALM_CHECKS:
+                return False
+            self._calm = 0
+            rate = max(self.rate // 2, 1)
+        else:
+            self._calm = 0
+            return False
+        if rate == self.rate:
+            return False
+        self.rate = rate
+        self.changes += 1
+        self._history.append((time.time(), rate))
+        del self._history[:-MAX_CHANGES]
+        return True
+
+    def weight(self, timestamp):
+        """Rate in effect when a packet with this capture timestamp arrived"""
+        for since, rate in reversed(self._history):
+            if timestamp >= since:
+                return rate
+        return self._history[0][1]
+
+    def keep(self, key=None):
+        """Whether to analyze a packet, for when the kernel can't sample
+
+        In 'flow' mode key identifies the packet's conversation and must be
+        the same in both directions (e.g. a frozenset of its addresses);
+        packets without one are picked at random, like in 'count' mode.
+        Random rather than every Nth, which would alias with periodic traffic.
+        """
+        if self.rate == 1:
+            return True
+        if key is not None and self.mode == 'flow':
+            return ((hash(key) & 0xFFFFFFFF) * SAMPLING_HASH_MULTIPLIER >> 16) % self.rate == 0
+        return random.random() * self.rate < 1.0
@@ -0,0 +1,289 @@
+"""
+Scan Detection
+Flags sources that contact many distinct ports or hosts within a sliding
+time window, using small per-source HyperLogLog sketches
+"""
+
+import math
+from collections import OrderedDict, deque, namedtuple
+
+DEFAULT_WINDOW = 60.0
+DEFAULT_BUCKETS = 6
+DEFAULT_PORT_THRESHOLD = 100
+DEFAULT_HOST_THRESHOLD = 50
+# 2**7 one-byte registers per sketch: ~9% standard error
+DEFAULT_PRECISION = 7
+DEFAULT_MAX_SOURCES = 100000
+RECENT_ALERTS = 100
+
+MASK64 = (1 << 64) - 1
+INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+
+ScanAlert = namedtuple('ScanAlert', ['timestamp', 'source', 'kind', 'distinct', 'window'])
+
+
+def mix64(value):
+    """splitmix64 finaliser: spreads Python's hash() (identity for ints) over 64 bits"""
+    z = (hash(value) + 0x9E3779B97F4A7C15) & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+def hll_position(precision, value):
+    """(register index, rank) that value updates in a sketch of 2**precision registers"""
+    hashed = mix64(value)
+    return hashed & ((1 << precision) - 1), 65 - precision - (hashed >> precision).bit_length()
+
+
+def hll_add(registers, precision, value):
+    """Add value to a HyperLogLog register array; True if a register changed"""
+    index, rank = hll_position(precision, value)
+    if rank > registers[index]:
+        registers[index] = rank
+        return True
+    return False
+
+
+def hll_merge(register_arrays):
+    """Union of several HyperLogLog sketches (element-wise max)"""
+    if len(register_arrays) == 1:
+        return bytearray(register_arrays[0])
+    return bytearray(map(max, *register_arrays))
+
+
+def hll_estimate(registers):
+    """Estimated number of distinct values added to a register array"""
+    m = len(registers)
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    zeros = registers.count(0)
+    # With this many empty registers the raw estimate can't exceed 2.5 * m,
+    # so linear counting (more accurate for small cardinalities) applies and
+    # the per-register sum can be skipped - the common case for most sources
+    if zeros * 2.5 >= alpha * m:
+        return m * math.log(m / zeros)
+    estimate = alpha * m * m / sum(map(INVERSE_POWERS.__getitem__, registers))
+    if estimate <= 2.5 * m and zeros:
+        return m * math.log(m / zeros)
+    return estimate
+
+
+class SourceState:
+    """Per-source sketches for the current time bucket plus the live history
+
+    window_ports/window_hosts are kept equal to the union of the current and
+    historical sketches, so checking a source never has to merge them.
+    """
+
+    __slots__ = ('bucket', 'ports', 'hosts', 'history', 'window_ports', 'window_hosts',
+                 'last_seen', 'quiet_until', 'distinct_ports', 'distinct_hosts')
+
+    def __init__(self, bucket, size):
+        self.bucket = bucket
+        self.ports = bytearray(size)
+        self.hosts = bytearray(size)
+        self.history = []
+        self.window_ports = bytearray(size)
+        self.window_hosts = bytearray(size)
+        self.last_seen = 0.0
+        self.quiet_until = 0.0
+        self.distinct_ports = 0.0
+        self.distinct_hosts = 0.0
+
+
+class ScanDetector:
+    """Sliding-window distinct port/host counting per source with alert events
+
+    The window is split into `buckets` time buckets; each source keeps one
+    port sketch and one host sketch per live bucket, and buckets that fall
+    out of the window are dropped. Sources idle for a whole window are
+    evicted, and at most max_sources are tracked (least recently seen
+    first out), so memory stays bounded under spoofed floods.
+    """
+
+    def __init__(self, port_threshold=DEFAULT_PORT_THRESHOLD, host_threshold=DEFAULT_HOST_THRESHOLD,
+                 window=DEFAULT_WINDOW, buckets=DEFAULT_BUCKETS, precision=DEFAULT_PRECISION,
+                 max_sources=DEFAULT_MAX_SOURCES):
+        self.port_threshold = port_threshold
+        self.host_threshold = host_threshold
+        self.window = window
+        self.buckets = buckets
+        self.bucket_seconds = window / buckets
+        self.precision = precision
+        self.max_sources = max_sources
+        self.now = 0.0
+        self.alerts = deque(maxlen=RECENT_ALERTS)
+        self._listeners = []
+        self._sources = OrderedDict()
+        self._flagged = {}
+        # (source, kind) -> timestamp of the newest alert, to pass shard alerts on once
+        self._alert_times = OrderedDict()
+        # shard -> latest candidates() result, when merging sharded detectors
+        self._shard_candidates = {}
+        self._swept_bucket = None
+
+    def subscribe(self, callback):
+        """Call callback(ScanAlert) whenever a source crosses a threshold"""
+        self._listeners.append(callback)
+
+    def observe(self, source, destination, port, timestamp):
+        """Account one packet from source to destination[:port]"""
+        self.now = timestamp
+        bucket = int(timestamp // self.bucket_seconds)
+        state = self._sources.get(source)
+        if state is None:
+            state = self._sources[source] = SourceState(bucket, 1 << self.precision)
+            if len(self._sources) > self.max_sources:
+                self._sources.popitem(last=False)
+        else:
+            self._sources.move_to_end(source)
+            if bucket != state.bucket:
+                self._rotate(state, bucket)
+        state.last_seen = timestamp
+
+        # Estimates can only move when a window register does
+        changed = False
+        index, rank = hll_position(self.precision, destination)
+        if rank > state.hosts[index]:
+            state.hosts[index] = rank
+            if rank > state.window_hosts[index]:
+                state.window_hosts[index] = rank
+                changed = True
+        if port is not None:
+            index, rank = hll_position(self.precision, port)
+            if rank > state.ports[index]:
+                state.ports[index] = rank
+                if rank > state.window_ports[index]:
+                    state.window_ports[index] = rank
+                    changed = True
+        if changed and timestamp >= state.quiet_until:
+            self._check(source, state, timestamp)
+
+        if bucket != self._swept_bucket:
+            self._swept_bucket = bucket
+            self._evict_idle(timestamp)
+
+    def _rotate(self, state, bucket):
+        oldest = bucket - self.buckets + 1
+        state.history = [entry for entry in state.history if entry[0] >= oldest]
+        if state.bucket >= oldest:
+            state.history.append((state.bucket, state.ports, state.hosts))
+        size = 1 << self.precision
+        state.bucket = bucket
+        state.ports = bytearray(size)
+        state.hosts = bytearray(size)
+        if state.history:
+            state.window_ports = hll_merge([entry[1] for entry in state.history])
+            state.window_hosts = hll_merge([entry[2] for entry in state.history])
+        else:
+            state.window_ports = bytearray(size)
+            state.window_hosts = bytearray(size)
+
+    def _window_sketches(self, state):
+        return state.window_ports, state.window_hosts
+
+    def _check(self, source, state, timestamp):
+        ports, hosts = self._window_sketches(state)
+        state.distinct_ports = hll_estimate(ports)
+        state.distinct_hosts = hll_estimate(hosts)
+        if self._evaluate(source, state.distinct_ports, state.distinct_hosts, timestamp):
+            state.quiet_until = timestamp + self.window
+
+    def _evaluate(self, source, distinct_ports, distinct_hosts, timestamp):
+        """Emit alerts for exceeded thresholds; True if any were emitted"""
+        alerts = []
+        if distinct_ports > self.port_threshold:
+            alerts.append(ScanAlert(timestamp, source, 'port_scan', round(distinct_ports), self.window))
+        if distinct_hosts > self.host_threshold:
+            alerts.append(ScanAlert(timestamp, source, 'host_scan', round(distinct_hosts), self.window))
+        for alert in alerts:
+            self.raise_alert(alert)
+        return bool(alerts)
+
+    def _remember(self, alert):
+        key = (alert.source, alert.kind)
+        self._alert_times[key] = alert.timestamp
+        self._alert_times.move_to_end(key)
+        if len(self._alert_times) > self.max_sources:
+            self._alert_times.popitem(last=False)
+
+    def raise_alert(self, alert):
+        """Flag the alert's source for one window and notify subscribers"""
+        self._remember(alert)
+        self._flagged[alert.source] = alert.timestamp + alert.window
+        self.alerts.append(alert)
+        for callback in self._listeners:
+            callback(alert)
+
+    def _evict_idle(self, timestamp):
+        cutoff = timestamp - self.window
+        while self._sources:
+            source, state = next(iter(self._sources.items()))
+            if state.last_seen >= cutoff:
+                break
+            del self._sources[source]
+        for source in [s for s, until in self._flagged.items() if until <= timestamp]:
+            del self._flagged[source]
+
+    def active_sources(self):
+        """Sources that raised an alert within the last window"""
+        return [source for source, until in self._flagged.items() if until > self.now]
+
+    def candidates(self, fraction=0.5):
+        """Window sketches of sources near a threshold, for merging across shards
+
+        Returns (now, {source: (port registers, host registers)}) covering
+        every source whose estimate reached `fraction` of a threshold.
+        """
+        bucket = int(self.now // self.bucket_seconds)
+        selected = {}
+        for source, state in self._sources.items():
+            if (state.distinct_ports < self.port_threshold * fraction
+                    and state.distinct_hosts < self.host_threshold * fraction):
+                continue
+            if state.bucket != bucket:
+                # Age out buckets that expired since the source was last seen
+                self._rotate(state, bucket)
+                state.distinct_ports, state.distinct_hosts = map(
+                    hll_estimate, self._window_sketches(state))
+            if (state.distinct_ports >= self.port_threshold * fraction
+                    or state.distinct_hosts >= self.host_threshold * fraction):
+                selected[source] = tuple(bytes(sketch) for sketch in self._window_sketches(state))
+        return self.now, selected
+
+    def merge_candidates(self, updates, alerts=()):
+        """Evaluate sources whose traffic was split across shards
+
+        updates are (shard, candidates()) pairs in arrival order. Each one is
+        combined with the latest candidates of the other shards, and alerts
+        are raised on the union of a source's sketches. Alerts the shards
+        raised themselves are passed through once each.
+        """
+        for alert in alerts:
+            if alert.timestamp <= self._alert_times.get((alert.source, alert.kind), float('-inf')):
+                continue
+            if self._flagged.get(alert.source, 0) > alert.timestamp:
+                # Already alerted on from the merged sketches
+                self._remember(alert)
+            else:
+                self.raise_alert(alert)
+
+        for shard, (now, selected) in updates:
+            self._shard_candidates[shard] = (now, selected)
+            self.now = max(self.now, now)
+            for source in selected:
+                if self._flagged.get(source, 0) > now:
+                    continue
+                sketches = [shard_selected[source]
+                            for shard_now, shard_selected in self._shard_candidates.values()
+                            if source in shard_selected and shard_now > now - self.window]
+                if len(sketches) < 2:
+                    # Seen by one shard only: that shard raises its own alerts
+                    continue
+                ports = hll_merge([entry[0] for entry in sketches])
+                hosts = hll_merge([entry[1] for entry in sketches])
+                self._evaluate(source, hll_estimate(ports), hll_estimate(hosts), now)
+        self._evict_idle(self.now)
+
+    def __len__(self):
+        return len(self._sources)
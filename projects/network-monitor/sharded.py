@@ -0,0 +1,331 @@
+"""
+Sharded Analysis Pipeline
+Capture only copies raw frames into per-worker shared-memory rings; worker
+processes parse and aggregate them and publish periodic stats snapshots
+"""
+
+import time
+import queue
+import struct
+import multiprocessing
+from multiprocessing import shared_memory
+
+from fast_capture import LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6
+
+# head (bytes ever written) and tail (bytes ever consumed) on separate cache lines
+RING_HEAD_OFFSET = 0
+RING_TAIL_OFFSET = 64
+RING_DATA_OFFSET = 128
+RING_COUNTER = struct.Struct('=Q')
+# captured length, wire length, link type, sampling weight, timestamp
+RECORD_HEADER = struct.Struct('=IIHHd')
+WRAP_MARKER = 0xFFFFFFFF
+
+IPV4_ADDRESSES = struct.Struct('!II')
+IPV6_ADDRESSES = struct.Struct('!QQQQ')
+
+DEFAULT_RING_SIZE = 32 * 1024 * 1024
+DEFAULT_SNAPSHOT_INTERVAL = 1.0
+WORKER_BATCH_SIZE = 1024
+IDLE_SLEEP = 0.001
+
+
+class SharedRing:
+    """Single-producer/single-consumer ring of variable-size frame records
+
+    Lives in a SharedMemory block so the capture process and one worker can
+    exchange frames without pickling. The producer only ever writes the head
+    counter and the consumer the tail counter, and record data is written
+    before the head is advanced, so no lock is needed.
+    """
+
+    def __init__(self, capacity=DEFAULT_RING_SIZE, name=None):
+        self.capacity = capacity & ~7
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None,
+                                              size=RING_DATA_OFFSET + self.capacity)
+        self.buf = self.shm.buf
+        if name is None:
+            RING_COUNTER.pack_into(self.buf, RING_HEAD_OFFSET, 0)
+            RING_COUNTER.pack_into(self.buf, RING_TAIL_OFFSET, 0)
+        self._head = RING_COUNTER.unpack_from(self.buf, RING_HEAD_OFFSET)[0]
+        self._tail = RING_COUNTER.unpack_from(self.buf, RING_TAIL_OFFSET)[0]
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def depth(self):
+        """Bytes queued and not yet consumed, as seen from the producer"""
+        tail, = RING_COUNTER.unpack_from(self.buf, RING_TAIL_OFFSET)
+        return self._head - tail
+
+    def put(self, frame, length, timestamp=None, linktype=LINKTYPE_ETHERNET, weight=1):
+        """Append a frame; returns False without writing anything if the ring is full
+
+        weight is how many packets the frame stands for when sampling.
+        """
+        captured = len(frame)
+        size = (RECORD_HEADER.size + captured + 7) & ~7
+        head = self._head
+        position = head % self.capacity
+        skip = self.capacity - position if position + size > self.capacity else 0
+        tail, = RING_COUNTER.unpack_from(self.buf, RING_TAIL_OFFSET)
+        if head + skip + size - tail > self.capacity:
+            return False
+        if skip:
+            # Record doesn't fit before the end: mark the gap and restart at 0.
+            # A gap too small for a header is skipped by the consumer unmarked
+            if skip >= RECORD_HEADER.size:
+                struct.pack_into('=I', self.buf, RING_DATA_OFFSET + position, WRAP_MARKER)
+            position = 0
+        start = RING_DATA_OFFSET + position
+        RECORD_HEADER.pack_into(self.buf, start, captured, length, linktype, weight,
+                                timestamp or 0.0)
+        start += RECORD_HEADER.size
+        self.buf[start:start + captured] = frame
+        self._head = head + skip + size
+        RING_COUNTER.pack_into(self.buf, RING_HEAD_OFFSET, self._head)
+        return True
+
+    def drain(self, process, max_count=WORKER_BATCH_SIZE):
+        """Call process(batch, weight) with up to max_count queued
+        (timestamp, frame, length, linktype) of the same sampling weight
+
+        Frames are memoryviews into the ring and are only valid during the
+        call. Returns the number of records consumed.
+        """
+        head, = RING_COUNTER.unpack_from(self.buf, RING_HEAD_OFFSET)
+        tail = self._tail
+        batch = []
+        weight = None
+        while tail < head and len(batch) < max_count:
+            position = tail % self.capacity
+            if self.capacity - position < RECORD_HEADER.size:
+                # No record fits here, so the producer wrapped
+                tail += self.capacity - position
+                continue
+            start = RING_DATA_OFFSET + position
+            captured, length, linktype, record_weight, timestamp = \
+                RECORD_HEADER.unpack_from(self.buf, start)
+            if captured == WRAP_MARKER:
+                tail += self.capacity - position
+                continue
+            if record_weight != weight:
+                if batch:
+                    # The rest goes in the next batch
+                    break
+                weight = record_weight
+            start += RECORD_HEADER.size
+            batch.append((timestamp, self.buf[start:start + captured], length, linktype))
+            tail += (RECORD_HEADER.size + captured + 7) & ~7
+        if batch:
+            try:
+                process(batch, weight)
+            finally:
+                for record in batch:
+                    record[1].release()
+        self._tail = tail
+        RING_COUNTER.pack_into(self.buf, RING_TAIL_OFFSET, tail)
+        return len(batch)
+
+    def close(self, unlink=False):
+        self.buf.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def flow_hash(frame, linktype=LINKTYPE_ETHERNET):
+    """Direction-independent hash of a frame's IP address pair (0 for non-IP)
+
+    Both directions of a conversation hash alike, so a flow's state always
+    lands on the same worker.
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 14
+        ethertype = frame[12:14]
+        version = 4 if ethertype == b'\x08\x00' else 6 if ethertype == b'\x86\xdd' else 0
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6) and len(frame):
+        offset = 0
+        version = frame[0] >> 4
+    else:
+        return 0
+    try:
+        if version == 4:
+            src, dst = IPV4_ADDRESSES.unpack_from(frame, offset + 12)
+            key = src ^ dst
+        elif version == 6:
+            src_high, src_low, dst_high, dst_low = IPV6_ADDRESSES.unpack_from(frame, offset + 8)
+            key = (src_high ^ dst_high ^ src_low ^ dst_low) & 0xFFFFFFFF
+        else:
+            return 0
+    except struct.error:
+        return 0
+    return (key * 0x9E3779B1 & 0xFFFFFFFF) >> 8
+
+
+def _shard_worker(shard, workers, ring_name, ring_size, snapshots, stop, interval, monitor_options):
+    """Worker process: aggregate frames from one ring into a private NetworkMonitor"""
+    # Imported here so network_monitor can import this module at top level
+    from network_monitor import NetworkMonitor
+
+    ring = SharedRing(ring_size, ring_name)
+    monitor = NetworkMonitor(**monitor_options)
+    detector = monitor.scan_detector
+    # A scan split over every shard leaves each with about 1/workers of it
+    fraction = 0.5 / workers
+    # Finished flows are handed to the parent with the next snapshot
+    finished_flows = []
+    monitor.flows.subscribe(finished_flows.append)
+    # Recent packets already handed over, counted like PacketRing.count
+    shipped = 0
+
+    def publish():
+        nonlocal shipped
+        snapshot = monitor.snapshot(candidate_fraction=fraction)
+        snapshots.put((shard, snapshot._replace(finished_flows=finished_flows[:],
+                                                new_packets=monitor.packets.since(shipped))))
+        finished_flows.clear()
+        shipped = monitor.packets.count
+
+    next_snapshot = time.monotonic() + interval
+    # Also snapshot once per scan bucket of packet time, so scans split
+    # across shards are still merged in replays running faster than real time
+    next_bucket = 0.0
+    try:
+        while True:
+            stopping = stop.is_set()
+            if not ring.drain(monitor.process_batch):
+                if stopping:
+                    # Producer stopped before we last looked and the ring is empty
+                    break
+                time.sleep(IDLE_SLEEP)
+            if time.monotonic() >= next_snapshot or detector.now >= next_bucket:
+                publish()
+                next_snapshot = time.monotonic() + interval
+                next_bucket = detector.now + detector.bucket_seconds
+        monitor.flows.flush()
+        publish()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+class ShardedPipeline:
+    """Fan frames out to worker processes by flow hash and gather their snapshots"""
+
+    def __init__(self, workers=None, ring_size=DEFAULT_RING_SIZE,
+                 snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL, monitor_options=None):
+        """monitor_options are keyword arguments for each worker's NetworkMonitor"""
+        self.workers = workers or multiprocessing.cpu_count()
+        self.monitor_options = monitor_options or {}
+        self.ring_size = ring_size
+        self.snapshot_interval = snapshot_interval
+        self.rings = []
+        self.processes = []
+        self.dropped = 0
+        self._dead = []
+        self._latest = {}
+        self._arrived = []
+        self._context = multiprocessing.get_context()
+        self._snapshots = self._context.Queue()
+        self._stop = self._context.Event()
+
+    def start(self):
+        for shard in range(self.workers):
+            ring = SharedRing(self.ring_size)
+            process = self._context.Process(
+                target=_shard_worker, daemon=True,
+                args=(shard, self.workers, ring.name, ring.capacity, self._snapshots, self._stop,
+                      self.snapshot_interval, self.monitor_options))
+            process.start()
+            self.rings.append(ring)
+            self.processes.append(process)
+        return self
+
+    def submit(self, frame, length, timestamp=None, linktype=LINKTYPE_ETHERNET, weight=1):
+        """Capture handler: queue a frame for its shard, dropping it if the ring is full"""
+        ring = self.rings[flow_hash(frame, linktype) % self.workers]
+        if not ring.put(frame, length, timestamp, linktype, weight):
+            self.dropped += 1
+
+    def submit_batch(self, batch):
+        """Queue (timestamp, frame, length, linktype) tuples, waiting for space instead of dropping"""
+        rings = self.rings
+        workers = self.workers
+        for timestamp, frame, length, linktype in batch:
+            shard = flow_hash(frame, linktype) % workers
+            ring = rings[shard]
+            while not ring.put(frame, length, timestamp, linktype):
+                if not self.processes[shard].is_alive():
+                    # Nothing will ever make room
+                    raise RuntimeError(f"Analysis worker {shard} exited unexpectedly")
+                time.sleep(IDLE_SLEEP)
+
+    def dead_workers(self):
+        """Shards whose worker process exited before the pipeline was stopped,
+        or failed while finishing up"""
+        if not self._stop.is_set():
+            for shard, process in enumerate(self.processes):
+                if shard not in self._dead and not process.is_alive():
+                    self._dead.append(shard)
+        return list(self._dead)
+
+    def queue_depth(self):
+        """Bytes waiting in all rings"""
+        return sum(ring.depth for ring in self.rings)
+
+    def queue_fill(self):
+        """Share of the rings' space in use, 0.0 to 1.0"""
+        capacity = sum(ring.capacity for ring in self.rings)
+        return self.queue_depth() / capacity if capacity else 0.0
+
+    def collect(self, timeout=None):
+        """Latest snapshot from every worker that has reported so far"""
+        while True:
+            try:
+                if timeout:
+                    shard, snapshot = self._snapshots.get(timeout=timeout)
+                    timeout = None
+                else:
+                    shard, snapshot = self._snapshots.get_nowait()
+            except queue.Empty:
+                break
+            self._latest[shard] = snapshot
+            self._arrived.append((shard, snapshot))
+        return list(self._latest.values())
+
+    def arrived(self):
+        """(shard, snapshot) for every snapshot received since the last call,
+        including ones already superseded"""
+        arrived, self._arrived = self._arrived, []
+        return arrived
+
+    def stop(self, timeout=10.0):
+        """Let workers drain their rings, then return their final snapshots
+
+        Workers still busy after timeout seconds are terminated; None waits
+        for them to finish however long that takes.
+        """
+        self.dead_workers()
+        self._stop.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Keep reading while workers exit: a worker can't finish until the
+        # final snapshot it queued has been flushed to the pipe
+        while (any(process.is_alive() for process in self.processes)
+               and (deadline is None or time.monotonic() < deadline)):
+            self.collect(timeout=0.1)
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        # A worker terminated above has a negative exit code, one that raised 1
+        self._dead += [shard for shard, process in enumerate(self.processes)
+                       if process.exitcode and process.exitcode > 0 and shard not in self._dead]
+        snapshots = self.collect()
+        for ring in self.rings:
+            ring.close(unlink=True)
+        self.rings = []
+        return snapshots
@@ -0,0 +1,179 @@
+"""
+Streaming Counters
+Exact and bounded-memory (Space-Saving) frequency counters with cheap top-N
+queries, used for the per-IP and per-port statistics
+"""
+
+import heapq
+import math
+from collections import defaultdict
+from operator import itemgetter
+
+DEFAULT_CAPACITY = 10000
+
+
+class ExactCounter(defaultdict):
+    """Exact counts for every key - memory grows with the number of distinct keys"""
+
+    def __init__(self, *args):
+        super().__init__(int, *args)
+
+    def add(self, key, count=1):
+        """Count key and return its new total"""
+        self[key] += count
+        return self[key]
+
+    def guaranteed(self, key):
+        return self.get(key, 0)
+
+    def merge(self, other):
+        """Add another ExactCounter's counts to this one"""
+        for key, count in other.items():
+            self[key] += count
+
+    def top(self, n):
+        """The n largest (key, count) pairs without sorting every key"""
+        return heapq.nlargest(n, self.items(), key=itemgetter(1))
+
+    def copy(self):
+        return ExactCounter(self)
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter summary holding at most capacity counters
+
+    Any key whose true count exceeds total / capacity is guaranteed to be
+    tracked, and every reported count overestimates the truth by at most
+    error(key) <= total / capacity. Increments of tracked keys are a dict
+    update; the min-heap used to pick a victim is refreshed lazily, so
+    evictions cost O(log capacity) amortised.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        # (count when pushed, key); counts only grow, so entries can be stale-low
+        self._heap = []
+
+    @classmethod
+    def for_error(cls, epsilon):
+        """Summary whose counts are within epsilon * total of the truth"""
+        return cls(math.ceil(1 / epsilon))
+
+    def add(self, key, count=1):
+        """Count key and return a lower bound on its total (see guaranteed())
+
+        The lower bound rather than the estimate is returned so threshold
+        checks aren't tripped by the count a new key inherits on eviction.
+        """
+        self.total += count
+        counts = self._counts
+        if key in counts:
+            counts[key] += count
+            return counts[key] - self._errors[key]
+        if len(counts) < self.capacity:
+            counts[key] = count
+            self._errors[key] = 0
+            heapq.heappush(self._heap, (count, key))
+            return count
+
+        # Evict the smallest counter; the newcomer inherits its count as error
+        heap = self._heap
+        while True:
+            smallest, victim = heap[0]
+            current = counts[victim]
+            if current == smallest:
+                break
+            heapq.heapreplace(heap, (current, victim))
+        del counts[victim]
+        del self._errors[victim]
+        counts[key] = smallest + count
+        self._errors[key] = smallest
+        heapq.heapreplace(heap, (smallest + count, key))
+        return count
+
+    def top(self, n):
+        """The n largest (key, count) pairs in O(capacity)"""
+        return heapq.nlargest(n, self._counts.items(), key=itemgetter(1))
+
+    def error(self, key):
+        """Maximum overestimate of key's count"""
+        return self._errors.get(key, 0)
+
+    def guaranteed(self, key):
+        """Lower bound on key's true count"""
+        return self._counts.get(key, 0) - self._errors.get(key, 0)
+
+    @property
+    def max_error(self):
+        """Bound on the overestimate of any count, total / capacity"""
+        return self.total / self.capacity
+
+    @property
+    def min_count(self):
+        """Count a key must beat to be tracked once the summary is full"""
+        if len(self._counts) < self.capacity:
+            return 0
+        return min(self._counts.values())
+
+    def merge(self, other):
+        """Fold another SpaceSaving summary into this one
+
+        Keys missing from a full summary may have occurred up to its
+        min_count times there, so that is added to both their count and
+        error; the result keeps the capacity largest counters.
+        """
+        own_floor = self.min_count
+        other_floor = other.min_count
+        counts = {}
+        errors = {}
+        for key in self._counts.keys() | other._counts.keys():
+            counts[key] = self._counts.get(key, own_floor) + other._counts.get(key, other_floor)
+            errors[key] = (self._errors.get(key, own_floor) if key in self._counts else own_floor)
+            errors[key] += other._errors.get(key, 0) if key in other._counts else other_floor
+        if len(counts) > self.capacity:
+            counts = dict(heapq.nlargest(self.capacity, counts.items(), key=itemgetter(1)))
+        self._counts = counts
+        self._errors = {key: errors[key] for key in counts}
+        self._heap = [(count, key) for key, count in counts.items()]
+        heapq.heapify(self._heap)
+        self.total += other.total
+
+    def copy(self):
+        """Independent copy, e.g. for a stats snapshot"""
+        summary = SpaceSaving(self.capacity)
+        summary.total = self.total
+        summary._counts = dict(self._counts)
+        summary._errors = dict(self._errors)
+        summary._heap = list(self._heap)
+        return summary
+
+    def __getitem__(self, key):
+        return self._counts.get(key, 0)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __iter__(self):
+        return iter(self._counts)
+
+    def items(self):
+        return self._counts.items()
+
+    def values(self):
+        return self._counts.values()
+
+
+def make_counter(capacity=DEFAULT_CAPACITY):
+    """SpaceSaving with the given capacity, or an ExactCounter if capacity is None"""
+    return ExactCounter() if capacity is None else SpaceSaving(capacity)
@@ -0,0 +1,205 @@
+"""
+Fast Capture Tests
+parse_frame and the batch analysis path checked against frames built with
+scapy, plus a live TPACKET_V3 ring capture on loopback when permitted
+"""
+
+import os
+import socket
+import time
+
+import pytest
+
+pytest.importorskip('scapy.all')
+from scapy.all import (ARP, ICMP, IP, IPv6, TCP, UDP, Dot1Q, Ether, ICMPv6EchoRequest, Raw,
+                       wrpcap)
+
+from fast_capture import (AFPacketCapture, LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL,
+                          parse_frame)
+import network_monitor
+from network_monitor import NetworkMonitor
+
+ETHERNET = Ether(src='02:00:00:00:00:01', dst='02:00:00:00:00:02')
+
+
+def frame(packet):
+    return bytes(packet)
+
+
+@pytest.mark.parametrize('packet, expected', [
+    (ETHERNET / IP(src='10.0.0.1', dst='10.0.0.2') / TCP(sport=40000, dport=443, flags='S'),
+     ('TCP', '10.0.0.1', '10.0.0.2', 40000, 443, 0x02)),
+    (ETHERNET / IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=5353, dport=53) / Raw(b'q'),
+     ('UDP', '10.0.0.1', '10.0.0.2', 5353, 53, 0)),
+    (ETHERNET / IP(src='10.0.0.1', dst='10.0.0.2') / ICMP(),
+     ('ICMP', '10.0.0.1', '10.0.0.2', None, None, 0)),
+    (ETHERNET / IPv6(src='fe80::1', dst='fe80::2') / TCP(sport=1234, dport=22, flags='SA'),
+     ('TCP', 'fe80::1', 'fe80::2', 1234, 22, 0x12)),
+    (ETHERNET / Dot1Q(vlan=7) / IP(src='192.168.1.5', dst='192.168.1.9') / UDP(sport=1, dport=2),
+     ('UDP', '192.168.1.5', '192.168.1.9', 1, 2, 0)),
+    (ETHERNET / IP(src='10.0.0.1', dst='10.0.0.2', ihl=6, options=b'\x01\x01\x01\x01')
+     / TCP(sport=80, dport=8080, flags='A'),
+     ('TCP', '10.0.0.1', '10.0.0.2', 80, 8080, 0x10)),
+    (ETHERNET / ARP(psrc='10.0.0.1', pdst='10.0.0.2'),
+     ('ARP', None, None, None, None, 0)),
+])
+def test_parse_frame_matches_scapy(packet, expected):
+    data = frame(packet)
+    protocol, src, dst, sport, dport, flags = expected
+    assert parse_frame(data) == (protocol, src, dst, sport, dport, len(data), flags)
+
+
+def test_parse_frame_uses_wire_length_and_memoryview():
+    data = frame(ETHERNET / IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=9, dport=10))
+    assert parse_frame(memoryview(data), 1500)[5] == 1500
+
+
+def test_parse_frame_raw_and_cooked_linktypes():
+    packet = IP(src='10.1.1.1', dst='10.2.2.2') / UDP(sport=7, dport=8)
+    assert parse_frame(frame(packet), linktype=LINKTYPE_RAW)[:5] == \
+        ('UDP', '10.1.1.1', '10.2.2.2', 7, 8)
+    # Linux cooked header: packet type, ARPHRD, address length, address, protocol
+    cooked = b'\x00\x00\x00\x01\x00\x06' + bytes(8) + b'\x08\x00' + frame(packet)
+    assert parse_frame(cooked, linktype=LINKTYPE_LINUX_SLL)[:5] == \
+        ('UDP', '10.1.1.1', '10.2.2.2', 7, 8)
+
+
+def test_parse_frame_truncated_and_fragmented():
+    data = frame(ETHERNET / IP(src='10.0.0.1', dst='10.0.0.2') / TCP(sport=1, dport=2))
+    assert parse_frame(data[:20]) == ('Unknown', None, None, None, None, 20, 0)
+    # Ports of a TCP header cut short after the IP header can't be read
+    assert parse_frame(data[:34])[0] == 'Unknown'
+    fragment = frame(ETHERNET / IP(src='10.0.0.1', dst='10.0.0.2', frag=100, proto=6)
+                     / Raw(bytes(16)))
+    assert parse_frame(fragment)[:5] == ('Unknown', '10.0.0.1', '10.0.0.2', None, None)
+
+
+def sample_traffic():
+    packets = []
+    for i in range(30):
+        packets.append(ETHERNET / IP(src=f'10.0.0.{i % 3 + 1}', dst='10.0.1.1')
+                       / TCP(sport=40000 + i, dport=443, flags='S'))
+    for i in range(20):
+        packets.append(ETHERNET / IP(src='10.0.0.9', dst='10.0.1.2')
+                       / UDP(sport=5000 + i, dport=53) / Raw(b'query'))
+    for i in range(5):
+        packets.append(ETHERNET / IPv6(src='fe80::1', dst='fe80::2') / ICMPv6EchoRequest())
+    for packet, timestamp in zip(packets, range(len(packets))):
+        packet.time = 1_700_000_000 + timestamp / 10
+    return packets
+
+
+def test_process_batch_counts_scapy_frames():
+    monitor = NetworkMonitor(snapshot_interval=None)
+    packets = sample_traffic()
+    monitor.process_batch([(float(packet.time), frame(packet), len(packet), LINKTYPE_ETHERNET)
+                           for packet in packets])
+    assert monitor.packet_count == len(packets)
+    assert dict(monitor.protocol_stats) == {'TCP': 30, 'UDP': 20, 'ICMP': 5}
+    assert dict(monitor.port_stats.top(2)) == {443: 30, 53: 20}
+
+
+def test_process_batch_weights_sampled_frames():
+    monitor = NetworkMonitor(snapshot_interval=None)
+    packet = ETHERNET / IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=1, dport=2)
+    monitor.process_batch([(1.0, frame(packet), len(packet), LINKTYPE_ETHERNET)] * 3, weight=4)
+    assert monitor.protocol_stats['UDP'] == 12
+
+
+def test_replayed_pcap_matches_direct_batch(tmp_path):
+    packets = sample_traffic()
+    path = str(tmp_path / 'traffic.pcap')
+    wrpcap(path, packets)
+    replayed = NetworkMonitor(snapshot_interval=None)
+    processed, _ = replayed.replay(path, batch_size=7)
+    direct = NetworkMonitor(snapshot_interval=None)
+    direct.process_batch([(float(packet.time), frame(packet), len(packet), LINKTYPE_ETHERNET)
+                          for packet in packets])
+    assert processed == len(packets)
+    assert dict(replayed.protocol_stats) == dict(direct.protocol_stats)
+    assert dict(replayed.ip_stats.top(10)) == dict(direct.ip_stats.top(10))
+
+
+def can_capture():
+    """Whether this process may open AF_PACKET sockets (CAP_NET_RAW)"""
+    if not hasattr(socket, 'AF_PACKET'):
+        return False
+    try:
+        socket.socket(socket.AF_PACKET, socket.SOCK_RAW).close()
+    except PermissionError:
+        return False
+    return True
+
+
+@pytest.mark.skipif(not can_capture(), reason="needs CAP_NET_RAW for AF_PACKET capture")
+def test_live_ring_capture_on_loopback():
+    payload = b'fast-capture-test-' + os.urandom(8)
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    port = receiver.getsockname()[1]
+    seen = []
+
+    def handler(data, length, timestamp):
+        if payload in bytes(data):
+            seen.append((parse_frame(data, length), timestamp))
+
+    deadline = time.monotonic() + 5.0
+    with AFPacketCapture('lo', use_ring=True) as capture, \
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        assert capture.mode == 'mmap'
+
+        def running():
+            # Keep sending until a datagram shows up in the ring
+            if not seen:
+                sender.sendto(payload, ('127.0.0.1', port))
+            return not seen and time.monotonic() < deadline
+
+        capture.capture(handler, running)
+        packets, _ = capture.statistics()
+    receiver.close()
+
+    assert seen, "no test datagram arrived through the ring"
+    (protocol, src, dst, sport, dport, length, _), timestamp = seen[0]
+    assert (protocol, src, dst, dport) == ('UDP', '127.0.0.1', '127.0.0.1', port)
+    assert length == 14 + 20 + 8 + len(payload)
+    assert abs(timestamp - time.time()) < 10
+    assert packets >= 1
+
+
+class BrokenCapture:
+    """AFPacketCapture stand-in whose setup fails like a filter without tcpdump"""
+
+    def __init__(self, interface=None, filter_str=None):
+        self.closed = False
+
+    def open(self):
+        raise RuntimeError("tcpdump is required to compile BPF filters for the fast path")
+
+    def close(self):
+        self.closed = True
+
+
+def test_auto_backend_falls_back_to_scapy(monkeypatch):
+    monitor = NetworkMonitor()
+    sniffed = []
+
+    def fake_sniff(**options):
+        sniffed.append(options)
+        monitor.running = False
+
+    monkeypatch.setattr(network_monitor, 'AFPacketCapture', BrokenCapture)
+    monkeypatch.setattr(network_monitor, 'sniff', fake_sniff)
+    monkeypatch.setattr(network_monitor.sys, 'platform', 'linux')
+    monitor.start('lo', 'udp', backend='auto')
+    assert len(sniffed) == 1
+    assert (sniffed[0]['iface'], sniffed[0]['filter']) == ('lo', 'udp')
+
+
+def test_explicit_afpacket_backend_does_not_fall_back(monkeypatch):
+    monitor = NetworkMonitor()
+    monkeypatch.setattr(network_monitor, 'AFPacketCapture', BrokenCapture)
+    monkeypatch.setattr(network_monitor, 'sniff', lambda **options: pytest.fail("fell back"))
+    monkeypatch.setattr(network_monitor.sys, 'platform', 'linux')
+    with pytest.raises(RuntimeError, match="tcpdump"):
+        monitor.start('lo', 'udp', backend='afpacket')
+    monitor.running = False
@@ -0,0 +1,78 @@
+"""
+Sharded Pipeline Tests
+Shared-memory ring wrap-around and statistics from several workers checked
+against a single-process run over the same capture
+"""
+
+import pytest
+
+pytest.importorskip('scapy.all')
+from scapy.all import IP, TCP, UDP, Ether, Raw, wrpcap
+
+from network_monitor import NetworkMonitor
+from packet_ring import PacketRing
+from sharded import RECORD_HEADER, SharedRing
+
+
+def test_ring_wraps_over_gaps_smaller_than_a_header():
+    # 24-byte records leave a 16-byte gap before the end of a 256-byte ring
+    ring = SharedRing(256)
+    received = []
+    try:
+        for i in range(40):
+            assert ring.put(bytes([i]) * 4, 4, float(i))
+            ring.drain(lambda batch, weight: received.extend(
+                (timestamp, bytes(frame)) for timestamp, frame, _, _ in batch))
+    finally:
+        ring.close(unlink=True)
+    assert (ring.capacity % ((RECORD_HEADER.size + 4 + 7) & ~7)) < RECORD_HEADER.size
+    assert received == [(float(i), bytes([i]) * 4) for i in range(40)]
+
+
+@pytest.fixture
+def capture_file(tmp_path):
+    packets = []
+    for i in range(500):
+        ethernet = Ether(src='02:00:00:00:00:01', dst='02:00:00:00:00:02')
+        network = IP(src=f'10.0.{i % 7}.{i % 50 + 1}', dst=f'10.1.0.{i % 11 + 1}')
+        if i % 3:
+            packet = ethernet / network / TCP(sport=30000 + i, dport=443, flags='S')
+        else:
+            packet = ethernet / network / UDP(sport=30000 + i, dport=53) / Raw(b'q')
+        packet.time = 1_700_000_000 + i / 100
+        packets.append(packet)
+    path = str(tmp_path / 'traffic.pcap')
+    wrpcap(path, packets)
+    return path
+
+
+def replay(path, workers):
+    monitor = NetworkMonitor(max_packets=1000, snapshot_interval=None)
+    processed, _ = monitor.replay(path, workers=workers)
+    return monitor, processed
+
+
+def test_workers_keep_as_many_recent_packets_as_one_process(capture_file):
+    single, processed = replay(capture_file, 1)
+    sharded, _ = replay(capture_file, 2)
+    assert processed == 500
+    assert len(single.packets) == len(sharded.packets) == 500
+    assert sorted(single.packets) == sorted(sharded.packets)
+    assert sharded.packet_count == single.packet_count
+    assert dict(sharded.protocol_stats) == dict(single.protocol_stats)
+
+
+def test_merged_ring_is_sized_from_max_packets(capture_file):
+    monitor = NetworkMonitor(max_packets=100, snapshot_interval=None)
+    monitor.replay(capture_file, workers=2)
+    assert monitor.packets.capacity == 100
+    assert len(monitor.packets) == 100
+
+
+def test_packet_ring_since_copies_across_the_wrap():
+    ring = PacketRing(5)
+    for i in range(8):
+        ring.append('TCP', f'10.0.0.{i}', 'fe80::1', i, None, 60 + i, float(i))
+    assert list(ring.since(0)) == ring.recent()
+    assert list(ring.since(6)) == ring.recent(2)
+    assert len(ring.since(8)) == 0
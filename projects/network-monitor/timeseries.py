@@ -0,0 +1,199 @@
+"""
+Traffic Time Series
+Per-second packet, byte and per-protocol counts in fixed-size circular
+stores, rolled up to minutes and hours, plus EWMA rates over 1/5/15 minutes
+"""
+
+import math
+from array import array
+from collections import namedtuple
+
+from packet_ring import PROTOCOLS, PROTOCOL_CODES
+
+# (seconds per bucket, buckets kept): an hour of seconds, a day of minutes
+# and 30 days of hours - about 370 KB however long the monitor runs
+RESOLUTIONS = ((1, 3600), (60, 1440), (3600, 720))
+EWMA_WINDOWS = (60, 300, 900)
+
+Bucket = namedtuple('Bucket', ['start', 'packets', 'bytes', 'protocols'])
+
+
+class CircularStore:
+    """`size` buckets of `seconds` each; every slot records which bucket it holds,
+    so slots left over from an earlier revolution read as empty"""
+
+    def __init__(self, seconds, size):
+        self.seconds = seconds
+        self.size = size
+        self.ids = array('q', [-1]) * size
+        # packets, bytes, then one column per protocol
+        self.columns = [array('Q', bytes(8 * size)) for _ in range(2 + len(PROTOCOLS))]
+
+    def add(self, bucket, values):
+        slot = bucket % self.size
+        held = self.ids[slot]
+        if held != bucket:
+            if held > bucket:
+                # Older than anything this store still keeps
+                return
+            self.ids[slot] = bucket
+            for column in self.columns:
+                column[slot] = 0
+        for column, value in zip(self.columns, values):
+            if value:
+                column[slot] += value
+
+    def get(self, bucket):
+        """Counts for a bucket: [packets, bytes, per-protocol...], zeros if not held"""
+        slot = bucket % self.size
+        if self.ids[slot] != bucket:
+            return [0] * len(self.columns)
+        return [column[slot] for column in self.columns]
+
+    def merge(self, other):
+        for slot, bucket in enumerate(other.ids):
+            if bucket >= 0:
+                self.add(bucket, [column[slot] for column in other.columns])
+
+    def copy(self):
+        store = CircularStore.__new__(CircularStore)
+        store.seconds = self.seconds
+        store.size = self.size
+        store.ids = array('q', self.ids)
+        store.columns = [array('Q', column) for column in self.columns]
+        return store
+
+
+class TimeSeries:
+    """Traffic counts over time at 1 s, 1 min and 1 h resolution
+
+    The second in progress is counted in plain attributes; when a packet
+    from a later second arrives it is written to every resolution at once,
+    so the per-packet cost is three additions. Time comes from packet
+    timestamps, so replays produce the same series as the original capture.
+    """
+
+    def __init__(self, resolutions=RESOLUTIONS, ewma_windows=EWMA_WINDOWS):
+        self.stores = [CircularStore(seconds, size) for seconds, size in resolutions]
+        self.ewma_windows = ewma_windows
+        self._decay = [math.exp(-1.0 / window) for window in ewma_windows]
+        # [packets/s, bytes/s] per window, as of the end of the last closed second
+        self._ewma = [[0.0, 0.0] for _ in ewma_windows]
+        self.second = None
+        self._packets = 0
+        self._bytes = 0
+        self._protocols = [0] * len(PROTOCOLS)
+
+    def record(self, timestamp, length, protocol, count=1):
+        """Count a packet (count packets of this length, for a sampled one)"""
+        second = int(timestamp)
+        if second != self.second:
+            if self.second is not None and second < self.second:
+                # Late packet: its second is already closed
+                values = [count, length * count] + [0] * len(PROTOCOLS)
+                values[2 + PROTOCOL_CODES.get(protocol, 0)] = count
+                for store in self.stores:
+                    store.add(second // store.seconds, values)
+                return
+            self._close(second)
+        self._packets += count
+        self._bytes += length * count
+        self._protocols[PROTOCOL_CODES.get(protocol, 0)] += count
+
+    def _close(self, second):
+        """Write out the second in progress and start `second`"""
+        if self.second is not None:
+            values = [self._packets, self._bytes] + self._protocols
+            for store in self.stores:
+                store.add(self.second // store.seconds, values)
+            idle = second - self.second - 1
+            for rates, decay in zip(self._ewma, self._decay):
+                rates[0] = rates[0] * decay + self._packets * (1 - decay)
+                rates[1] = rates[1] * decay + self._bytes * (1 - decay)
+                if idle:
+                    factor = decay ** idle
+                    rates[0] *= factor
+                    rates[1] *= factor
+        self.second = second
+        self._packets = 0
+        self._bytes = 0
+        self._protocols = [0] * len(PROTOCOLS)
+
+    def _store(self, resolution):
+        for store in self.stores:
+            if store.seconds == resolution:
+                return store
+        raise ValueError(f"No {resolution}s resolution (have "
+                         f"{', '.join(str(store.seconds) for store in self.stores)})")
+
+    def last(self, count, resolution=1, now=None):
+        """The `count` buckets up to and including the one holding `now`
+
+        now defaults to the newest packet's second. Costs O(count) whatever
+        the resolution; the second in progress is included.
+        """
+        store = self._store(resolution)
+        if now is None:
+            now = self.second or 0
+        newest = int(now) // resolution
+        current = None if self.second is None else self.second // resolution
+        buckets = []
+        for bucket in range(newest - count + 1, newest + 1):
+            values = store.get(bucket)
+            if bucket == current:
+                values[0] += self._packets
+                values[1] += self._bytes
+                for code, packets in enumerate(self._protocols):
+                    values[2 + code] += packets
+            buckets.append(Bucket(bucket * resolution, values[0], values[1],
+                                  dict(zip(PROTOCOLS, values[2:]))))
+        return buckets
+
+    def rate(self, now=None):
+        """(packets/s, bytes/s) over the last complete second before now"""
+        if self.second is None:
+            return 0.0, 0.0
+        now = self.second if now is None else int(now)
+        bucket = self.last(1, now=now - 1)[0]
+        return float(bucket.packets), float(bucket.bytes)
+
+    def ewma(self, now=None):
+        """{window seconds: (packets/s, bytes/s)} decayed to now if given"""
+        idle = 0 if now is None or self.second is None else max(int(now) - self.second, 0)
+        return {window: (rates[0] * decay ** idle, rates[1] * decay ** idle)
+                for window, rates, decay in zip(self.ewma_windows, self._ewma, self._decay)}
+
+    def merge(self, other):
+        """Add another series' counts and rates to this one, e.g. from a worker"""
+        if other.second is None:
+            return
+        if self.second is None or other.second > self.second:
+            self._close(other.second)
+        for store, other_store in zip(self.stores, other.stores):
+            store.merge(other_store)
+        # Other's second in progress: current here, or already closed
+        if other.second == self.second:
+            self._packets += other._packets
+            self._bytes += other._bytes
+            self._protocols = [a + b for a, b in zip(self._protocols, other._protocols)]
+        elif other._packets:
+            values = [other._packets, other._bytes] + other._protocols
+            for store in self.stores:
+                store.add(other.second // store.seconds, values)
+        idle = self.second - other.second
+        for rates, other_rates, decay in zip(self._ewma, other._ewma, self._decay):
+            factor = decay ** idle
+            rates[0] += other_rates[0] * factor
+            rates[1] += other_rates[1] * factor
+
+    def copy(self):
+        series = TimeSeries.__new__(TimeSeries)
+        series.stores = [store.copy() for store in self.stores]
+        series.ewma_windows = self.ewma_windows
+        series._decay = self._decay
+        series._ewma = [list(rates) for rates in self._ewma]
+        series.second = self.second
+        series._packets = self._packets
+        series._bytes = self._bytes
+        series._protocols = list(self._protocols)
+        return series